@@ -0,0 +1,204 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+from typing import Any, Dict, List, Optional, Tuple, TypedDict
+
+import logging
+
+from pymongo import MongoClient
+from pymongo.errors import OperationFailure
+
+from monitor_and_graphs.latency import Histogram, Summary
+from load_generation.mongodb_load_gen import GROUP, KEY, Command
+from routers import timed
+
+
+LOOKUP_DOCS = 1_000
+"documents sampled from the run collection into the lookup collection"
+
+AggregateTimings = Tuple[Dict[str, Histogram], Dict[str, int]]
+"latencies and failure counts, keyed by pipeline name"
+
+logger = logging.getLogger(__name__)
+
+
+class FanOut(TypedDict):
+    sampled: int
+    "pipelines that were explained"
+    shards: float
+    "mean shards that each pipeline ran on"
+    max_shards: int
+    merged_on: Dict[str, int]
+    "where the shard results were merged, by the explain merge type"
+
+
+class PipelineReport(TypedDict):
+    summary: Summary
+    fan_out: FanOut
+    failed: int
+
+
+
+def pipeline_name(cmd: Command) -> str:
+    " the generator names each pipeline in its comment "
+    return cmd.get('comment', 'pipeline')
+
+
+def aggregate_command(
+    cmd: Command,
+    col: str,
+    lookup: str,
+    batch: Optional[int] = None):
+
+    " points the pipeline at the run collection, and lookups at their own "
+    cmd['aggregate'] = col
+
+    for stage in cmd['pipeline']:
+        if '$lookup' in stage:
+            stage['$lookup']['from'] = lookup
+
+    if batch:
+        cmd['cursor'] = { 'batchSize': batch }
+
+
+
+def seed_lookup(cli: MongoClient, db: str, col: str, lookup: str):
+    """
+    Fills the collection that lookups join with a sample of the run
+    collection. It is left unsharded, since a lookup from a sharded
+    collection needs 5.1
+    """
+    cli[db][col].aggregate([
+        { '$sample': { 'size': LOOKUP_DOCS } },
+        { '$project': { KEY: 1, GROUP: 1 } },
+        { '$out': lookup } ])
+
+    cli[db][lookup].create_index(KEY)
+
+
+
+def aggregate_worker(
+    cli: MongoClient,
+    cmds: List[Command],
+    db: str,
+    read_preference: Optional[Any] = None,
+    stop: Optional[Event] = None) -> AggregateTimings:
+
+    " a failed pipeline is counted instead of ending the run "
+    latencies: Dict[str, Histogram] = {}
+    failures: Dict[str, int] = {}
+
+    for cmd in cmds:
+        if stop and stop.is_set():
+            break
+
+        name = pipeline_name(cmd)
+
+        try:
+            micros = timed(cli, db, cmd, read_preference)
+        except OperationFailure as e:
+            logger.debug(f'{name} pipeline failed: {e}')
+            failures[name] = failures.get(name, 0) + 1
+            continue
+
+        latencies.setdefault(name, Histogram()).record(micros)
+
+    return latencies, failures
+
+
+
+def run_aggregates(
+    cli: MongoClient,
+    cmds: List[Command],
+    db: str,
+    clients: int,
+    read_preference: Optional[Any] = None,
+    stop: Optional[Event] = None) -> AggregateTimings:
+
+    " splits the pipelines over client threads, timed by pipeline "
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        runs = [
+            pool.submit(
+                aggregate_worker,
+                cli, cmds[i::clients], db, read_preference, stop)
+            for i in range(clients) ]
+
+        per_worker = [ r.result() for r in runs ]
+
+    latencies: Dict[str, Histogram] = {}
+    failures: Dict[str, int] = {}
+
+    for worker_latencies, worker_failures in per_worker:
+        for name, hist in worker_latencies.items():
+            latencies.setdefault(name, Histogram()).merge(hist)
+
+        for name, count in worker_failures.items():
+            failures[name] = failures.get(name, 0) + count
+
+    return latencies, failures
+
+
+
+def explain_shards(explain: Dict[str, Any]) -> Tuple[int, str]:
+    " shards the pipeline ran on, and where their results were merged "
+    shards = explain.get('shards')
+    if shards is None:
+        # an unsharded collection only lives on its primary shard
+        return 1, 'unsharded'
+
+    return len(shards), explain.get('mergeType', 'unknown')
+
+
+
+def fan_out(
+    cli: MongoClient,
+    db: str,
+    cmds: List[Command],
+    sample: int) -> Dict[str, FanOut]:
+
+    " explains an even sample of each pipeline to count the shards it hit "
+    by_name: Dict[str, List[Command]] = {}
+    for cmd in cmds:
+        by_name.setdefault(pipeline_name(cmd), []).append(cmd)
+
+    fan_outs: Dict[str, FanOut] = {}
+
+    for name, named in by_name.items():
+        step = max(1, len(named) // sample)
+        explained = [
+            explain_shards(cli[db].command(
+                'aggregate', c['aggregate'],
+                pipeline = c['pipeline'],
+                explain = True))
+            for c in named[::step][:sample] ]
+
+        merged_on: Dict[str, int] = {}
+        for _, merge in explained:
+            merged_on[merge] = merged_on.get(merge, 0) + 1
+
+        shards = [ count for count, _ in explained ]
+
+        fan_outs[name] = FanOut(
+            sampled = len(explained),
+            shards = sum(shards) / len(shards) if shards else 0,
+            max_shards = max(shards, default=0),
+            merged_on = merged_on)
+
+    return fan_outs
+
+
+
+def pipeline_reports(
+    timings: AggregateTimings,
+    fan_outs: Dict[str, FanOut],
+    seconds: float) -> Dict[str, PipelineReport]:
+
+    " pipelines that only failed are reported too, with an empty summary "
+    latencies, failures = timings
+    empty = FanOut(sampled=0, shards=0, max_shards=0, merged_on={})
+
+    return {
+        name: PipelineReport(
+            summary = latencies.get(name, Histogram()).summary(seconds),
+            fan_out = fan_outs.get(name, empty),
+            failed = failures.get(name, 0))
+        for name in sorted({ *latencies, *failures }) }
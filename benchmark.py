@@ -1,22 +1,64 @@
 #!/usr/bin/env python3
 
-from typing import Any, List, NamedTuple, Optional, cast
+from typing import (
+    Any, Awaitable, Callable, Dict, List, Literal, NamedTuple, Optional,
+    Tuple, TypeVar, Union, cast)
+
 from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, fields, replace
+from datetime import datetime
 from pathlib import Path
-from time import asctime
+from threading import Event
+from time import asctime, perf_counter, sleep, time
 
 from asyncio.subprocess import PIPE
 import asyncio as aio
+import csv
+import functools
 import json
+import logging
 import os
-
-from pymongo import MongoClient
-from database import Database, is_selfhost, run_ssh, write_results
-
-from deployment.mongodb.start import Cluster
+import random
+import shlex
+
+from bson import encode
+from pymongo import MongoClient, ReadPreference
+from pymongo.errors import OperationFailure
+from redis.cluster import LoadBalancingStrategy, RedisCluster
+from database import (
+    Database, Standards, is_selfhost, run_ssh, write_results)
+
+from deployment.mongodb.start import Cluster, member_addr
+from deployment.mongodb import sharding
+from deployment.mongodb.indexes import IndexBuild, sync_indexes
+from monitor_and_graphs.latency import (
+    Histogram, Recorded, Summary, merge_summaries)
+from monitor_and_graphs.command_monitor import CommandMonitor
+from monitor_and_graphs.config_load import ConfigMonitor, config_monitor
 from monitor_and_graphs.mongotop import mongo_top
+from monitor_and_graphs.pool_monitor import PoolMonitor
+from monitor_and_graphs.steady import STEADY_CV, STEADY_WINDOW, SteadyState
+from monitor_and_graphs import trace
+from aggregations import (
+    AggregateTimings, aggregate_command, fan_out, pipeline_name,
+    pipeline_reports, run_aggregates, seed_lookup)
+from transactions import (
+    TXN_RETRIES, TxnTimings, run_transactions, touched_shards,
+    transaction_report)
+from catalog import (
+    MetaTimings, drop_meta, meta_command, meta_report, run_meta)
+from routers import (
+    ROUTER_MODES, Router, RouterMode,
+    cluster_routers, router_summaries, run_routed, timed)
 from load_generation.mongodb_load_gen import (
-    Command, Operation, KEY, LOAD_SIZES, generate, operation_json)
+    Command, Operation, GROUP, KEY, LETTERS, LOAD_SIZES, PIPELINES,
+    SELECTIVITY, TXN_DOCS, TXN_SCOPES, Workload, build_operations, generate,
+    operation_json)
+from load_generation.payload import Payload, add_payload_args
+from load_generation.preload import (
+    BATCH_SIZE, LoadReport, RedisType, preload_mongo, preload_redis,
+    report_line)
 
 
 
@@ -28,27 +70,302 @@ TOP_FILES = STORAGE / 'monitor_and_graphs' / 'mongotops'
 GEN_PATH = STORAGE / 'load_generation'
 TIMESTAMP = GEN_PATH / 'mongo-timestamps.log' 
 
+RESULTS = STORAGE / 'monitor_and_graphs' / 'results'
+
+RUN_DB = 'test-db'
+RUN_COL = 'test-col1'
+LOOKUP_COL = 'test-lookup'
+"unsharded collection that aggregation lookups join"
+
+ShardKey = Literal['hashed', 'ranged', 'compound', 'zone']
+
+SetupMode = Literal['run', 'only', 'skip']
+SETUP_MODES = ['run', 'only', 'skip']
+
+SHARD_KEYS: Dict[ShardKey, Dict[str, Any]] = {
+    'hashed': { KEY: 'hashed' },
+    'ranged': { KEY: 1 },
+    'compound': { GROUP: 1, KEY: 1 },
+    'zone': { KEY: 1 },
+}
+"zone keys are ranged, with each shard pinned to a range of the key"
+
+ROUTING_SAMPLE = 100
+
+VALUE_SIZE = 20
+"bytes of redis-benchmark values, when no value size is given"
+
+VALUE_POOL = 1_000
+"values sampled before a redis write run, then picked at random"
+
+STEADY_LIMIT = 0.5
+"share of the run size sent on top of warmup to let the load settle"
+
+READ_PREFERENCES: Dict[str, Any] = {
+    'primary': ReadPreference.PRIMARY,
+    'primaryPreferred': ReadPreference.PRIMARY_PREFERRED,
+    'secondary': ReadPreference.SECONDARY,
+    'secondaryPreferred': ReadPreference.SECONDARY_PREFERRED,
+    'nearest': ReadPreference.NEAREST,
+}
+
+READ_CONCERNS = ['local', 'available', 'majority', 'linearizable']
+
+START_LEAD = 10
+"seconds given to every load host to set up and warm up before a shared start"
+
+DEFAULT_OPS: Dict[Database, List[Operation]] = {
+    'redis': ['write', 'read', 'meta'],
+    'mongodb': ['write', 'read', 'meta'],
+}
+
+SHARD_KEY_OPS: List[Operation] = ['write', 'read', 'point', 'range']
+"mongodb runs of a shard key sweep, point and range finds show its routing"
+
 class Remote(NamedTuple):
     user: str
     address: str
 
 
+T = TypeVar('T')
+
+Results = Dict[str, Recorded]
+"summaries keyed by op and size, same as the top files"
+
+logger = logging.getLogger(__name__)
+
+
+
+@dataclass
+class BenchOptions:
+    """
+    Settings for a benchmark run, which are passed along to remote runs.
+    Each field is also a command line arg, list fields should default to None
+    """
+    tag: Optional[str] = None
+    "label to keep the results of this run separate"
+    sizes: Optional[List[int]] = None
+    "load sizes to run, instead of all the default ones"
+    cluster: str = str(CLUSTER)
+    "cluster info file, used to find the data nodes"
+    ops: Optional[List[str]] = None
+    "operations to run, instead of all the default ones"
+    fresh: bool = False
+    "clear out the data before each write run"
+    setup: SetupMode = 'run'
+    "only sets up the data and times nothing, skip leaves it to another host"
+    chunks: Optional[int] = None
+    "initial chunks per shard when the collection is sharded"
+    stop_balancer: bool = False
+    "keep the balancer off while runs are timed"
+    settle: Optional[float] = None
+    "max seconds to wait for the chunks to even out before a timed run"
+    shard_key: ShardKey = 'hashed'
+    "how the collection is sharded, a new key clears out the collection"
+    routing_sample: int = ROUTING_SAMPLE
+    "find commands explained after each run to count the targeted ones"
+    routers: Optional[RouterMode] = None
+    "spread mongo commands over every mongos, instead of the local one"
+    clients: int = 1
+    "client threads sending commands, for the routers, replica reads, or meta"
+    db_host: str = 'localhost'
+    "host of the database router, for load hosts that are not the main node"
+    start_at: Optional[float] = None
+    "unix time that timed runs wait for, so many load hosts start together"
+    histograms: bool = False
+    "keep the latency histogram of each run, so runs can be merged"
+    max_pool_size: Optional[int] = None
+    "connections each mongo client pool can open, pymongo default if None"
+    min_pool_size: Optional[int] = None
+    wait_queue_timeout_ms: Optional[int] = None
+    "how long a checkout waits for a free connection before failing"
+    replica_reads: bool = False
+    "redis reads go to the replicas, redis-benchmark only uses masters"
+    read_preference: Optional[str] = None
+    "which shard replica set members mongo finds can read from"
+    read_concern: Optional[str] = None
+    write_concern: Optional[str] = None
+    "w of mongo writes, a member count or majority"
+    journal: Optional[str] = None
+    "true or false, if mongo writes wait for the journal"
+    trace: bool = False
+    "print the timed spans of each phase, for a caller to collect"
+    warmup_ops: Optional[int] = None
+    "commands sent before the timed window starts"
+    warmup_seconds: Optional[float] = None
+    "seconds of commands sent before the timed window starts"
+    steady: bool = False
+    "after warmup, wait for the load to settle before the timed window"
+    steady_window: int = STEADY_WINDOW
+    "commands in each window that the steady load is judged by"
+    steady_cv: float = STEADY_CV
+    "max variation of the windows for a steady load"
+    value_dist: str = 'fixed'
+    "how the bytes of each written value are picked"
+    value_size: Optional[int] = None
+    "bytes of the written values, the original values if None"
+    value_min: int = 1
+    value_sigma: float = 1.0
+    value_histogram: Optional[List[str]] = None
+    "bytes:weight buckets that histogram value sizes are drawn from"
+    value_fields: int = 1
+    value_depth: int = 0
+    "levels of sub documents in each written value"
+    indexes: Optional[List[str]] = None
+    "secondary indexes of the run collection, like group,key:-1"
+    rebuild_indexes: bool = False
+    "build the indexes again before each run, to time builds on loaded data"
+    pipelines: Optional[List[str]] = None
+    "aggregation pipelines to run, instead of all of them"
+    selectivity: float = SELECTIVITY
+    "share of the groups that the aggregation pipelines match"
+    cursor_batch: Optional[int] = None
+    "documents in each aggregation cursor batch, server default if None"
+    txn_docs: int = TXN_DOCS
+    "documents inserted by each transaction"
+    txn_scope: str = 'single'
+    "if the documents of a transaction share a shard, or are spread out"
+    txn_retries: int = TXN_RETRIES
+    "times an aborted transaction is tried again"
+
+    def concerns_tag(self) -> Optional[str]:
+        " label of the read, write, and index settings that are not default "
+        indexes = '+'.join(self.indexes or []).replace(':', '.')
+        settings = {
+            'rp': self.read_preference,
+            'rc': self.read_concern,
+            'w': self.write_concern,
+            'j': self.journal,
+            'ix': indexes }
+
+        tag = '_'.join(f'{k}-{v}' for k, v in settings.items() if v)
+        return tag or None
+
+    def flags(self) -> List[str]:
+        " the command line args that recreate these options "
+        flags: List[str] = []
+
+        for field in fields(self):
+            value = getattr(self, field.name)
+            if value is None or value == field.default:
+                continue
+
+            flag = f"--{field.name.replace('_', '-')}"
+
+            if isinstance(value, bool):
+                flags.append(flag)
+            elif isinstance(value, list):
+                flags += [flag, *map(str, value)]
+            else:
+                flags += [flag, str(value)]
+
+        return flags
+
+    def payload(self) -> Payload:
+        return Payload(
+            dist = cast(Any, self.value_dist),
+            size = self.value_size,
+            min_size = self.value_min,
+            sigma = self.value_sigma,
+            buckets = self.value_histogram,
+            fields = self.value_fields,
+            depth = self.value_depth)
+
+    def workload(self) -> Workload:
+        return Workload(
+            payload = self.payload(),
+            selectivity = self.selectivity,
+            txn_docs = self.txn_docs,
+            txn_scope = cast(Any, self.txn_scope))
+
+    @classmethod
+    def pop_from(cls, args: Dict[str, Any]):
+        " takes the option values out of parsed args "
+        return cls(**{
+            f.name: args.pop(f.name)
+            for f in fields(cls) if f.name in args })
+
+
+
+def wait_until(start_at: Optional[float], stop: Optional[Event] = None):
+    " blocks until the shared start time, the clocks should be in sync "
+    if start_at is None:
+        return
+
+    if time() > start_at:
+        logger.warning(
+            f'missed the shared start by {time() - start_at:.1f}s, '
+            'a longer lead keeps the hosts together')
+
+    delay = max(0, start_at - time())
+    if stop:
+        stop.wait(delay)
+    else:
+        sleep(delay)
+
 
-async def redis_bench(port: int, op: Operation, requests: int):
-    out = GEN_PATH / 'redis-bench' / f'{op}_{requests}_times.csv'
+
+def tagged(base: Path, prefix: str, tag: Optional[str]) -> Path:
+    " results of a tagged run are kept in their own folder "
+    return base / f'{prefix}-{tag}' if tag else base
+
+
+def run_key(op: Operation, size: int):
+    return f'{op}{size}'
+
+
+def write_summaries(results: Results, prefix: str, tag: Optional[str]):
+    out = tagged(RESULTS, prefix, tag)
+    out.mkdir(parents=True, exist_ok=True)
+
+    with open(out / 'results.json', 'w') as f:
+        json.dump(results, f, indent=4)
+
+
+
+async def run_blocking(func: Callable[..., T], *args: Any) -> T:
+    """
+    Runs a sync benchmark in a thread, so that a cancel (like a sweep time
+    budget) can stop it; the function has to check the stop event
+    """
+    stop = Event()
+    loop = aio.get_running_loop()
+    run = loop.run_in_executor(
+        None, functools.partial(func, *args, stop=stop))
+
+    try:
+        return await run
+    except aio.CancelledError:
+        stop.set()
+        raise
+
+
+
+async def redis_bench(
+    port: int,
+    op: Operation,
+    requests: int,
+    tag: Optional[str] = None,
+    host: str = 'localhost',
+    value_size: int = VALUE_SIZE):
+
+    out = tagged(GEN_PATH / 'redis-bench', 'redis', tag)
+    out = out / f'{op}_{requests}_times.csv'
     out.parent.mkdir(exist_ok=True, parents=True)
 
     bench = ['redis-benchmark']
+    bench += ['-h', host]
     bench += ['-p', str(port)]
     bench += ['-c', str(1)]
     bench += ['-n', str(requests)]
-    bench += ['-d', str(20)]
+    bench += ['-d', str(value_size)]
     bench += ['--csv']
     bench += ['--cluster']
 
     if op == 'write':  bench += ['-t', 'set']
     elif op == 'read': bench += ['-t', 'get']
     elif op == 'meta': bench += ['-t', 'hset']
+    else: raise ValueError(f'no redis benchmark for {op}')
 
     bench += ['>', str(out)]
     bench = ' '.join(bench)
@@ -56,73 +373,761 @@ async def redis_bench(port: int, op: Operation, requests: int):
     run = await aio.create_subprocess_shell(bench, stdout=PIPE)
     await run.wait()
 
+    return redis_summary(out, requests)
 
 
-def mongo_bench(port: int, op: Operation, size: int):
-    run_db = 'test-db'
-    run_col = 'test-col1'
 
-    with MongoClient(port=port) as cli:
-        admin = cli['admin']
+def redis_summary(csv_file: Path, requests: int) -> Summary:
+    " parses the csv of redis-benchmark, latency columns need redis 6.2+ "
+    with open(csv_file) as f:
+        rows = [ r for r in csv.reader(f) if r ]
 
-        if op == 'write':
-            # not sure if multiple calls is ok
-            admin.command("enableSharding", run_db)
-            admin.command(
-                "shardCollection", f"{run_db}.{run_col}",
-                key = { KEY: "hashed" })
-
-        db = cli[run_db]
-        with open(operation_json(op, size)) as f:
-            cmds: List[Command] = json.load(f)
-
-        start = asctime()
-        for cmd in cmds:
-            if 'insert' in cmd:
-                cmd['insert'] = run_col
-            # elif 'aggregate' in cmd:
-            #     cmd['aggregate'] = run_col
-            elif 'find' in cmd:
-                cmd['find'] = run_col
-
-            db.command(cmd)
+    header = [ 'test', 'rps' ]
+    if rows and 'rps' in rows[0]:
+        header = rows.pop(0)
+
+    if not rows:
+        raise RuntimeError(f'no results in {csv_file}')
+
+    row = dict(zip(header, rows[-1]))
+
+    def latency(col: str):
+        return float(row.get(f'{col}_latency_ms', 0))
+
+    throughput = float(row['rps'])
+    return Summary(
+        ops = requests,
+        seconds = requests / throughput if throughput else 0,
+        throughput = throughput,
+        mean = latency('avg'),
+        p50 = latency('p50'),
+        p95 = latency('p95'),
+        p99 = latency('p99'),
+        max = latency('max'))
+
+
+
+def shard_collection(cli: MongoClient, options: BenchOptions):
+    key = SHARD_KEYS[options.shard_key]
+    chunks = options.chunks
+
+    if chunks and options.shard_key != 'hashed':
+        # only hashed keys can be pre-split on an empty collection
+        chunks = None
+
+    sharding.shard_collection(cli, RUN_DB, RUN_COL, key, chunks)
+
+    if options.shard_key == 'zone':
+        sharding.add_zones(cli, RUN_DB, RUN_COL, KEY, LETTERS)
+
+
+
+def client_args(options: BenchOptions, *listeners: Any):
+    " pool settings of the benchmark clients, only the ones that are set "
+    args: Dict[str, Any] = {}
+
+    if options.max_pool_size is not None:
+        args['maxPoolSize'] = options.max_pool_size
+
+    if options.min_pool_size is not None:
+        args['minPoolSize'] = options.min_pool_size
+
+    if options.wait_queue_timeout_ms is not None:
+        args['waitQueueTimeoutMS'] = options.wait_queue_timeout_ms
+
+    if listeners:
+        args['event_listeners'] = list(listeners)
+
+    return args
+
+
+
+def write_concern(options: BenchOptions) -> Dict[str, Any]:
+    concern: Dict[str, Any] = {}
+
+    if options.write_concern and options.write_concern.isdigit():
+        concern['w'] = int(options.write_concern)
+    elif options.write_concern:
+        concern['w'] = options.write_concern
+
+    if options.journal:
+        concern['j'] = options.journal == 'true'
+
+    return concern
+
+
+def add_concerns(cmd: Command, options: BenchOptions):
+    " commands ignore the client concerns, so they go in each command "
+    if 'find' in cmd or 'aggregate' in cmd:
+        if options.read_concern:
+            cmd['readConcern'] = { 'level': options.read_concern }
+
+    elif write_concern(options):
+        cmd['writeConcern'] = write_concern(options)
+
+
+
+def warmup_size(size: int, options: BenchOptions) -> int:
+    """
+    Commands generated for warmup apart from the timed ones, so the timed
+    run always keeps all of size. Warmup seconds stop after a run's worth
+    """
+    count = options.warmup_ops or 0
+    if options.warmup_seconds:
+        count = max(count, size)
+
+    if options.steady:
+        count += int(size * STEADY_LIMIT)
+
+    return count
+
+
+
+def warm_up(
+    cli: MongoClient,
+    cmds: List[Command],
+    size: int,
+    options: BenchOptions,
+    read_preference: Optional[Any] = None,
+    stop: Optional[Event] = None) -> Tuple[int, Optional[bool]]:
+
+    """
+    Sends the warmup commands until the warmup ops or seconds are done,
+    and then, with steady, until the windowed throughput and latency
+    settle. Returns how many commands were sent, and if the load settled
+    """
+    start = perf_counter()
+    sent = 0
+
+    # the last of the commands are kept for settling the load
+    settle = int(size * STEADY_LIMIT) if options.steady else 0
+
+    def warming():
+        if options.warmup_ops and sent < options.warmup_ops:
+            return True
+
+        return bool(options.warmup_seconds
+            and perf_counter() - start < options.warmup_seconds)
+
+    def send(cmd: Command) -> Optional[float]:
+        # failures are counted in the timed run, warmup only logs them
+        try:
+            return timed(cli, RUN_DB, cmd, read_preference)
+        except OperationFailure as e:
+            logger.debug(f'warmup command failed: {e}')
+            return None
+
+    while sent < len(cmds) - settle and warming():
+        if stop and stop.is_set():
+            return sent, None
+
+        send(cmds[sent])
+        sent += 1
+
+    if not options.steady:
+        return sent, None
+
+    detector = SteadyState(options.steady_window, cv=options.steady_cv)
+
+    while sent < len(cmds):
+        if stop and stop.is_set():
+            break
+
+        micros = send(cmds[sent])
+        sent += 1
+
+        if micros is not None and detector.record(micros):
+            return sent, True
+
+    logger.warning(f'load not steady after {sent} commands, timing anyway')
+    return sent, False
+
+
+
+def setup_collection(
+    cli: MongoClient,
+    op: Operation,
+    options: BenchOptions) -> List[IndexBuild]:
+
+    """
+    Everything before the timed run, so setup cost is not measured; the
+    timed builds of the asked for indexes are returned
+    """
+    current = sharding.sharded_key(cli, RUN_DB, RUN_COL)
+    zoned = bool(sharding.zone_ranges(cli, RUN_DB, RUN_COL))
+    zone = options.shard_key == 'zone'
+
+    # zone and ranged keys are the same key, told apart by the zone ranges
+    new_key = current is not None and (
+        current != SHARD_KEYS[options.shard_key] or zoned != zone)
+
+    writes = op in ('write', 'transaction')
+
+    if writes and zoned and not zone:
+        sharding.remove_zones(cli, RUN_DB, RUN_COL)
+
+    if writes and (options.fresh or new_key):
+        cli[RUN_DB].drop_collection(RUN_COL)
+
+    if writes:
+        shard_collection(cli, options)
+
+    if op == 'transaction' and options.txn_scope == 'cross':
+        if sharding.shard_count(cli) < 2:
+            logger.warning(
+                'cross scope transactions on one shard commit like single '
+                'scope ones')
+
+    if op == 'meta':
+        drop_meta(cli, RUN_DB)
+
+    if op == 'aggregate':
+        seed_lookup(cli, RUN_DB, RUN_COL, LOOKUP_COL)
+
+    builds: List[IndexBuild] = []
+    if op != 'meta':
+        # runs without indexes also drop the ones of earlier runs
+        builds = sync_indexes(
+            cli, RUN_DB, RUN_COL,
+            options.indexes or [], options.rebuild_indexes)
+
+    if options.settle:
+        sharding.wait_settled(cli, RUN_DB, RUN_COL, options.settle)
+
+    return builds
+
+
+
+def save_builds(builds: List[IndexBuild], out: Path, op: Operation, size: int):
+    with open(out / f'indexes-{run_key(op, size)}.json', 'w') as f:
+        json.dump(builds, f, indent=4)
+
+
+
+def mongo_setup(
+    port: int,
+    op: Operation,
+    size: int,
+    options: BenchOptions,
+    out: Optional[Path] = None,
+    stop: Optional[Event] = None):
+
+    """
+    The collection setup of a run alone, so hosts that share the
+    collection can time the run after one of them set it up
+    """
+    with MongoClient(options.db_host, port) as cli:
+        with trace.span('setup collection', 'mongodb'):
+            builds = setup_collection(cli, op, options)
+
+    if out and builds:
+        save_builds(builds, out, op, size)
+
+
+
+def payload_bytes(cmds: List[Command]) -> int:
+    " bson size of every inserted document, transactions included "
+    return sum(
+        len(encode(doc))
+        for cmd in cmds if 'insert' in cmd or 'transaction' in cmd
+        for doc in cmd['documents'])
+
+
+def add_bytes(summary: Recorded, written: int):
+    summary['bytes'] = written
+    summary['mb_per_sec'] = (
+        written / 1e6 / summary['seconds'] if summary['seconds'] else 0)
+
+
+
+def run_commands(
+    cmds: List[Command],
+    op: Operation,
+    options: BenchOptions) -> List[Command]:
+
+    " points the generated commands at the run collection "
+    for cmd in cmds:
+        if 'insert' in cmd:
+            cmd['insert'] = RUN_COL
+        elif 'aggregate' in cmd:
+            aggregate_command(
+                cmd, RUN_COL, LOOKUP_COL, options.cursor_batch)
+        elif 'find' in cmd:
+            cmd['find'] = RUN_COL
+        elif 'transaction' in cmd:
+            cmd['transaction'] = RUN_COL
+        elif op == 'meta':
+            meta_command(cmd, RUN_DB)
+
+        add_concerns(cmd, options)
+
+    if op == 'aggregate' and options.pipelines:
+        cmds = [ c for c in cmds if pipeline_name(c) in options.pipelines ]
+
+    return cmds
+
+
+
+def mongo_bench(
+    port: int,
+    op: Operation,
+    size: int,
+    options: Optional[BenchOptions] = None,
+    out: Optional[Path] = None,
+    stop: Optional[Event] = None):
+
+    """
+    out is the folder that migrations, routing counts, pool events, command
+    timings, and per router results are saved to. Meta runs split their
+    commands over client lanes, and also save per op and config server load
+    """
+    if options is None:
+        options = BenchOptions()
+
+    with open(operation_json(op, size, options.workload())) as f:
+        cmds = run_commands(json.load(f), op, options)
+
+    # warmup gets its own commands, so none are taken from the timed run
+    warmup_cmds = run_commands(
+        build_operations(op, warmup_size(size, options), options.workload()),
+        op, options)
+
+    read_preference = None
+    if options.read_preference:
+        read_preference = READ_PREFERENCES[options.read_preference]
+
+    routers: List[Router] = []
+    if options.routers:
+        routers = cluster_routers(Cluster.from_json(options.cluster))
+
+    config: Optional[ConfigMonitor] = None
+    if op == 'meta' and out:
+        configs = Cluster.from_json(options.cluster).configs
+        config = config_monitor([
+            member_addr(configs, i) for i in range(len(configs.members)) ])
+
+    monitor = PoolMonitor()
+    commands = CommandMonitor()
+    pool_args = client_args(options, monitor, commands)
+
+    with MongoClient(options.db_host, port, **pool_args) as cli:
+        # the balancer is stopped here, so it is started again even if
+        # setup, warmup, or the run fail
+        try:
+            if options.setup != 'skip':
+                with trace.span('setup collection', 'mongodb'):
+                    builds = setup_collection(cli, op, options)
+
+                if out and builds:
+                    save_builds(builds, out, op, size)
+
+            if options.stop_balancer:
+                sharding.stop_balancer(cli)
+
+            latencies = Histogram()
+            per_router: Dict[Router, Histogram] = {}
+            per_op: Optional[MetaTimings] = None
+            per_pipeline: Optional[AggregateTimings] = None
+            txns: Optional[TxnTimings] = None
+
+            with trace.span('warmup', 'mongodb'):
+                warmup, steady = warm_up(
+                    cli, warmup_cmds, size, options, read_preference, stop)
+
+            # every host warms up on its own, then they time together
+            wait_until(options.start_at, stop)
+
+            # the commands sent in warmup are left out of every result
+            monitor.reset()
+            commands.reset()
+
+            if config:
+                config.reset()
+
+            since = datetime.utcnow()
+            start = asctime()
+            run_start = perf_counter()
+
+            with trace.span('timed run', 'mongodb', ops=len(cmds)):
+                if op == 'meta':
+                    # meta commands depend on the ones before them, so
+                    # they keep their order instead of going to routers
+                    per_op = run_meta(
+                        cli, cmds, RUN_DB, options.clients, stop)
+
+                    for hist in per_op[0].values():
+                        latencies.merge(hist)
+
+                elif op == 'aggregate':
+                    per_pipeline = run_aggregates(
+                        cli, cmds, RUN_DB, options.clients,
+                        read_preference, stop)
+
+                    for hist in per_pipeline[0].values():
+                        latencies.merge(hist)
+
+                elif op == 'transaction':
+                    txns = run_transactions(
+                        cli, cmds, RUN_DB, options.clients,
+                        options.txn_retries, stop)
+
+                    latencies.merge(txns.transactions)
+
+                elif options.routers:
+                    per_router = run_routed(
+                        cmds, RUN_DB, routers,
+                        options.routers, options.clients,
+                        pool_args, read_preference, stop)
+
+                    for hist in per_router.values():
+                        latencies.merge(hist)
+
+                else:
+                    for cmd in cmds:
+                        if stop and stop.is_set():
+                            break
+
+                        latencies.record(
+                            timed(cli, RUN_DB, cmd, read_preference))
+
+        finally:
+            if options.stop_balancer:
+                sharding.start_balancer(cli)
+
+        run_time = perf_counter() - run_start
+        pool_report = monitor.report(run_time)
+        command_report = commands.report(run_time)
+
+        if out:
+            with open(out / f'pool-{run_key(op, size)}.json', 'w') as f:
+                json.dump(pool_report, f, indent=4)
+
+            with open(out / f'commands-{run_key(op, size)}.json', 'w') as f:
+                json.dump(command_report, f)
+
+        if out and per_op:
+            report = meta_report(per_op, options.clients, run_time)
+            with open(out / f'meta-{run_key(op, size)}.json', 'w') as f:
+                json.dump(report, f, indent=4)
+
+        if out and per_pipeline:
+            with trace.span('pipeline explain', 'mongodb'):
+                fan_outs = fan_out(
+                    cli, RUN_DB, cmds, options.routing_sample or 1)
+
+            reports = pipeline_reports(per_pipeline, fan_outs, run_time)
+            with open(out / f'aggregate-{run_key(op, size)}.json', 'w') as f:
+                json.dump(reports, f, indent=4)
+
+        if out and txns:
+            with trace.span('transaction explain', 'mongodb'):
+                touched = touched_shards(
+                    cli, RUN_DB, cmds, options.routing_sample)
+
+            report = transaction_report(
+                txns, options.txn_docs, options.txn_scope,
+                sharding.shard_count(cli), touched, run_time)
+
+            with open(out / f'txns-{run_key(op, size)}.json', 'w') as f:
+                json.dump(report, f, indent=4)
+
+        if out and config:
+            with open(out / f'config-{run_key(op, size)}.json', 'w') as f:
+                json.dump(config.report(run_time), f, indent=4)
+
+        if out and per_router:
+            summaries = router_summaries(per_router, run_time)
+            with open(out / f'routers-{run_key(op, size)}.json', 'w') as f:
+                json.dump(summaries, f, indent=4)
+
+        if out:
+            with trace.span('migrations', 'mongodb'):
+                moves = sharding.migrations(cli, RUN_DB, RUN_COL, since)
+
+            with open(out / f'moves-{run_key(op, size)}.json', 'w') as f:
+                json.dump(moves, f, indent=4)
+
+        if out and options.routing_sample:
+            with trace.span('routing explain', 'mongodb'):
+                routes = sharding.routing(
+                    cli, RUN_DB, cmds, options.routing_sample)
+
+            with open(out / f'routing-{run_key(op, size)}.json', 'w') as f:
+                json.dump(routes, f, indent=4)
 
         end = asctime()
         with open(TIMESTAMP, 'a+') as f:
             f.write(f'bench {op}: {size} started {start}, ended {end}\n')
 
+        summary = Recorded(**latencies.summary(run_time))
+        if options.histograms:
+            summary['histogram'] = latencies.as_dict()
+
+        if warmup:
+            summary['warmup'] = warmup
+
+        if steady is not None:
+            summary['steady'] = steady
+
+        written = payload_bytes(cmds)
+        if written:
+            add_bytes(summary, written)
+
+        return summary
+
+
+
+def redis_reads(
+    port: int,
+    requests: int,
+    host: str = 'localhost',
+    clients: int = 1,
+    stop: Optional[Event] = None) -> Summary:
+
+    """
+    GETs of random keys spread over every slot, sent to the replicas of
+    each slot in turn; a missed key takes the same routing as a hit
+    """
+    replicas = LoadBalancingStrategy.ROUND_ROBIN_REPLICAS
+    with RedisCluster(host, port, load_balancing_strategy=replicas) as cli:
+
+        def worker(count: int):
+            latencies = Histogram()
+
+            for _ in range(count):
+                if stop and stop.is_set():
+                    break
+
+                key = f'key:{random.randrange(requests):012d}'
+                start = perf_counter()
+                cli.get(key)
+                latencies.record((perf_counter() - start) * 1e6)
+
+            return latencies
+
+        counts = [
+            requests // clients + (1 if i < requests % clients else 0)
+            for i in range(clients) ]
+
+        run_start = perf_counter()
+
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            hists = list(pool.map(worker, counts))
+
+        run_time = perf_counter() - run_start
+
+    latencies = Histogram()
+    for hist in hists:
+        latencies.merge(hist)
+
+    return latencies.summary(run_time)
+
+
+
+def redis_writes(
+    port: int,
+    requests: int,
+    payload: Payload,
+    host: str = 'localhost',
+    clients: int = 1,
+    stop: Optional[Event] = None) -> Recorded:
+
+    """
+    SETs with values from the payload profile, which redis-benchmark cannot
+    vary; the values are sampled up front, so only the sets are timed
+    """
+    values = [ payload.value() for _ in range(min(requests, VALUE_POOL)) ]
+
+    with RedisCluster(host, port) as cli:
+
+        def worker(worker_id: int):
+            latencies = Histogram()
+            written = 0
+
+            for i in range(worker_id, requests, clients):
+                if stop and stop.is_set():
+                    break
+
+                value = random.choice(values)
+                start = perf_counter()
+                cli.set(f'key:{i:012d}', value)
+                latencies.record((perf_counter() - start) * 1e6)
+                written += len(value)
+
+            return latencies, written
+
+        run_start = perf_counter()
+
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            runs = list(pool.map(worker, range(clients)))
 
+        run_time = perf_counter() - run_start
 
-async def redis_bench_combos(port: int):
-    for op in cast(List[Operation], ['write', 'read', 'meta']):
-        for size in LOAD_SIZES:
-            await redis_bench(port, op, size)
+    latencies = Histogram()
+    for hist, _ in runs:
+        latencies.merge(hist)
 
+    summary = Recorded(**latencies.summary(run_time))
+    add_bytes(summary, sum(written for _, written in runs))
 
+    return summary
 
-async def mongo_bench_combos(port: int):
+
+
+def replication_lag(
+    port: int, host: str = 'localhost') -> Dict[str, Dict[str, int]]:
+
+    " bytes that each replica is behind, keyed by its master "
+    lags: Dict[str, Dict[str, int]] = {}
+
+    with RedisCluster(host, port) as cli:
+        for node in cli.get_primaries():
+            info: Any = cli.info('replication', target_nodes=node)
+            offset = int(info.get('master_repl_offset', 0))
+
+            replicas = [
+                v for k, v in info.items()
+                if k.startswith('slave') and isinstance(v, dict) ]
+
+            lags[f'{node.host}:{node.port}'] = {
+                f"{r['ip']}:{r['port']}": offset - int(r['offset'])
+                for r in replicas }
+
+    return lags
+
+
+
+def redis_flush(port: int, host: str = 'localhost'):
+    with RedisCluster(host, port) as cli:
+        cli.flushall(target_nodes=RedisCluster.PRIMARIES)
+
+
+
+async def redis_run(
+    port: int, op: Operation, size: int, options: BenchOptions) -> Recorded:
+
+    if op == 'write' and options.fresh and options.setup != 'skip':
+        redis_flush(port, options.db_host)
+
+    payload = options.payload()
+    value_size = payload.size or VALUE_SIZE
+
+    async def run(requests: int, tag: Optional[str]) -> Recorded:
+        if op == 'read' and options.replica_reads:
+            return Recorded(**await run_blocking(
+                redis_reads, port, requests,
+                options.db_host, options.clients))
+
+        if op == 'write' and (payload.dist != 'fixed' or payload.is_shaped()):
+            # redis-benchmark values all have the same size
+            return await run_blocking(
+                redis_writes, port, requests, payload,
+                options.db_host, options.clients)
+
+        # redis-benchmark only gives percentiles, so no histogram
+        summary = Recorded(**await redis_bench(
+            port, op, requests, tag, options.db_host, value_size))
+
+        if op == 'write':
+            add_bytes(summary, value_size * summary['ops'])
+
+        return summary
+
+    if options.warmup_ops:
+        # an untimed run first, redis-benchmark cannot leave out requests
+        warmup_tag = '-'.join(filter(None, [options.tag, 'warmup']))
+
+        with trace.span('warmup', 'redis'):
+            await run(options.warmup_ops, warmup_tag)
+
+    # every host warms up on its own, then they time together
+    await run_blocking(wait_until, options.start_at)
+
+    result = await run(size, options.tag)
+
+    if options.warmup_ops:
+        result['warmup'] = options.warmup_ops
+
+    lags = replication_lag(port, options.db_host) if op == 'write' else {}
+
+    if any(lags.values()):
+        # how far behind the write load left the replicas, if there are any
+        out = tagged(GEN_PATH / 'redis-bench', 'redis', options.tag)
+        out = out / f'replication-{run_key(op, size)}.json'
+
+        with open(out, 'w') as f:
+            json.dump(lags, f)
+
+    return result
+
+
+
+async def redis_bench_combos(port: int, options: BenchOptions):
+    results: Results = {}
+    ops = options.ops or DEFAULT_OPS['redis']
+
+    if options.setup == 'only':
+        # flushing is the only setup redis has
+        if 'write' in ops and options.fresh:
+            redis_flush(port, options.db_host)
+
+        return results
+
+    for op in cast(List[Operation], ops):
+        for size in options.sizes or LOAD_SIZES:
+            with trace.span(run_key(op, size), 'redis'):
+                results[run_key(op, size)] = await redis_run(
+                    port, op, size, options)
+
+    write_summaries(results, 'redis', options.tag)
+    return results
+
+
+
+async def mongo_bench_combos(port: int, options: BenchOptions):
     TIMESTAMP.touch()
-    generate(overwrite=False)
+    with trace.span('generate ops', 'mongodb'):
+        generate(overwrite=False, workload=options.workload())
 
-    cluster = Cluster.from_json(CLUSTER)
+    cluster = Cluster.from_json(options.cluster)
     shards = cluster.shards
-    data1 = shards.members[0]
+    data1, data_port = member_addr(shards, 0)
 
-    with MongoClient(data1, shards.port) as cli:
+    with MongoClient(data1, data_port) as cli:
         # connect to primary data node, should pass in cluster
         monitor = cli['admin'].command('getFreeMonitoringStatus')
         print(f"{monitor=}")
 
 
+    # untagged runs are still kept apart by their read and write settings
+    tag = options.tag or options.concerns_tag()
+
     # for op in cast(List[Operation], ['write', 'read', 'meta']):
-    for op in cast(List[Operation], ['write', 'read']):
-        for size in LOAD_SIZES:
+    top_files = tagged(TOP_FILES, 'mongo', tag)
+    results: Results = {}
+
+    ops = options.ops or DEFAULT_OPS['mongodb']
+
+    if options.setup == 'only':
+        top_files.mkdir(parents=True, exist_ok=True)
 
-            TOP_FILES.mkdir(parents=True, exist_ok=True)
-            top_run = TOP_FILES / f'top-{op}{size}.json'
+        for op in cast(List[Operation], ops):
+            for size in options.sizes or LOAD_SIZES:
+                await run_blocking(
+                    mongo_setup, port, op, size, options, top_files)
 
-            async with await mongo_top(top_run, data1, shards.port):
-                mongo_bench(port, op, size)
+        return results
+
+    for op in cast(List[Operation], ops):
+        for size in options.sizes or LOAD_SIZES:
+
+            top_files.mkdir(parents=True, exist_ok=True)
+            top_run = top_files / f'top-{run_key(op, size)}.json'
+
+            with trace.span(run_key(op, size), 'mongodb'):
+                async with await mongo_top(top_run, data1, data_port):
+                    results[run_key(op, size)] = await run_blocking(
+                        mongo_bench, port, op, size, options, top_files)
 
 
         # if op == 'read':
@@ -130,16 +1135,20 @@ async def mongo_bench_combos(port: int):
         #         pass
             # db.drop_collection(run_col)
 
+    write_summaries(results, 'mongo', tag)
+    return results
 
 
 
-async def benchmarks(database: Database, port: int):
+
+async def benchmarks(
+    database: Database, port: int, options: BenchOptions) -> Results:
 
     if database == 'redis':
-        await redis_bench_combos(port)
+        return await redis_bench_combos(port, options)
         
     elif database == 'mongodb':
-        await mongo_bench_combos(port)
+        return await mongo_bench_combos(port, options)
     
     else:
         raise ValueError('cluster is missing')
@@ -149,22 +1158,208 @@ async def benchmarks(database: Database, port: int):
 async def remote_bench(
     ssh: Optional[Remote],
     database: Database,
-    port: int):
+    port: int,
+    options: Optional[BenchOptions] = None) -> Results:
+
+    if options is None:
+        options = BenchOptions()
 
     if ssh is None or is_selfhost(ssh.address):
-        await benchmarks(database, port)
-        return
+        return await benchmarks(database, port, options)
 
     bench = STORAGE / 'benchmark.py'
-    res = await run_ssh(
-        f'python3 {bench} -p {port} -d {database}',
-        ssh.user, ssh.address)
+    bench_cmd = [ 'python3', str(bench), '-p', str(port), '-d', database ]
+    bench_cmd = shlex.join(bench_cmd + options.flags())
+
+    # benchmarks run much longer than the usual ssh commands
+    res = await run_ssh(bench_cmd, ssh.user, ssh.address, timeout=None)
 
     write_results(res)
+    return remote_results(res[0].output)
+
+
+
+async def distributed_bench(
+    hosts: List[Remote],
+    database: Database,
+    port: int,
+    options: Optional[BenchOptions] = None,
+    lead: float = START_LEAD) -> Results:
+
+    """
+    Runs each op and size on all the load hosts at once, starting at the
+    same wall clock time, and merges the worker results into one run as
+    they come back. The first host sets up the data of each run, and
+    clears it out for fresh runs, before any host starts on it
+    """
+    if options is None:
+        options = BenchOptions()
+
+    async def worker(i: int, ssh: Remote, worker_opts: BenchOptions):
+        worker_opts = replace(
+            worker_opts,
+            tag = f'{options.tag}-worker{i}' if options.tag else f'worker{i}',
+            setup = 'skip')
+
+        return ssh, await remote_bench(ssh, database, port, worker_opts)
+
+    results: Results = {}
+    ops = options.ops or DEFAULT_OPS[database]
+
+    for op in cast(List[Operation], ops):
+        for size in options.sizes or LOAD_SIZES:
+            key = run_key(op, size)
+
+            with trace.span('setup', database, key=key):
+                await remote_bench(
+                    hosts[0], database, port,
+                    replace(options, ops=[op], sizes=[size], setup='only'))
+
+            run_opts = replace(
+                options,
+                ops = [op],
+                sizes = [size],
+                start_at = time() + lead,
+                histograms = True)
+
+            workers = [
+                worker(i, ssh, run_opts) for i, ssh in enumerate(hosts) ]
+
+            summaries: List[Recorded] = []
+
+            with trace.span(key, database, hosts=len(hosts)):
+                for done in aio.as_completed(workers):
+                    ssh, worker_results = await done
+                    summary = worker_results[key]
+                    summaries.append(summary)
+
+                    print(f"{ssh.address} {key}: "
+                          f"{summary['throughput']:.0f} ops/s, "
+                          f"{summary.get('mb_per_sec', 0):.2f} MB/s, "
+                          f"p99 {summary['p99']:.2f}ms")
+
+            results[key] = Recorded(**merge_summaries(summaries))
+
+            written = sum(s.get('bytes', 0) for s in summaries)
+            if written:
+                add_bytes(results[key], written)
+            logger.info(f'{key} on {len(hosts)} hosts: {results[key]}')
+
+    prefix = 'redis' if database == 'redis' else 'mongo'
+    write_summaries(results, prefix, options.tag)
+
+    return results
+
+
+
+async def run_trials(
+    trials: int,
+    database: Database,
+    options: BenchOptions,
+    bench: Callable[[BenchOptions], Awaitable[Results]]) -> List[Results]:
+
+    """
+    Repeats the benchmark, each trial with its own tag, and writes all of
+    their results to one trials file, for compare to tell noise apart
+    """
+    base = options.tag
+    if database == 'mongodb':
+        base = base or options.concerns_tag()
+
+    runs: List[Results] = []
+
+    for i in range(1, trials + 1):
+        trial_tag = f'{base}-trial{i}' if base else f'trial{i}'
+
+        with trace.span('trial', database, trial=i):
+            runs.append(await bench(replace(options, tag=trial_tag)))
+
+    prefix = 'redis' if database == 'redis' else 'mongo'
+    out = tagged(RESULTS, prefix, base)
+    out.mkdir(parents=True, exist_ok=True)
+
+    with open(out / 'trials.json', 'w') as f:
+        json.dump(runs, f, indent=4)
+
+    return runs
+
+
+
+def remote_results(output: Union[Standards, Exception]) -> Results:
+    " the summaries are printed as the last line of a benchmark run "
+    if isinstance(output, Exception):
+        raise output
+
+    lines = [ l for l in output.out.splitlines() if l.strip() ]
+    if not lines:
+        raise RuntimeError(f'benchmark had no output: {output.err}')
+
+    return json.loads(lines[-1])
 
 
 
-async def main(user: Optional[str], addr: Optional[str], **kwargs: Any):
+def preload(
+    database: Database,
+    port: int,
+    count: int,
+    workers: int,
+    batch: int = BATCH_SIZE,
+    kind: RedisType = 'set',
+    options: Optional[BenchOptions] = None) -> LoadReport:
+
+    """
+    Fills the database up with count docs, much faster than the write
+    benchmark, so read runs can start from a large dataset
+    """
+    if options is None:
+        options = BenchOptions()
+
+    if database == 'redis':
+        if options.fresh:
+            redis_flush(port)
+
+        # the cluster client finds the rest of the nodes
+        report = preload_redis(
+            [('localhost', port)], count, workers, batch, kind)
+
+    elif database == 'mongodb':
+        with MongoClient(port=port) as cli:
+            if options.fresh:
+                cli[RUN_DB].drop_collection(RUN_COL)
+
+            shard_collection(cli, options)
+
+        routers = cluster_routers(Cluster.from_json(options.cluster))
+
+        report = preload_mongo(
+            routers, (RUN_DB, RUN_COL), count, workers, batch)
+
+    else:
+        raise ValueError('cluster is missing')
+
+    print(report_line(report))
+
+    out = tagged(RESULTS, database, options.tag)
+    out.mkdir(parents=True, exist_ok=True)
+
+    with open(out / f'preload-{count}.json', 'w') as f:
+        json.dump(report, f, indent=4)
+
+    return report
+
+
+
+async def main(
+    user: Optional[str],
+    addr: Optional[str],
+    database: Database,
+    port: int,
+    command: Optional[str] = None,
+    load_hosts: Optional[List[str]] = None,
+    lead: float = START_LEAD,
+    trials: int = 1,
+    **kwargs: Any):
+
     ssh = None
     if user and addr:
         ssh = Remote(user, addr)
@@ -172,7 +1367,63 @@ async def main(user: Optional[str], addr: Optional[str], **kwargs: Any):
     elif user or addr:
         raise ValueError('only one of user or addr specified')
 
-    await remote_bench(ssh, **kwargs)
+    if command == 'preload':
+        if ssh and not is_selfhost(ssh.address):
+            raise ValueError('preload has to run on the loading host')
+
+        count = kwargs.pop('count')
+        workers = kwargs.pop('workers')
+        batch = kwargs.pop('batch')
+        kind = kwargs.pop('kind')
+
+        options = BenchOptions.pop_from(kwargs)
+        if options.trace:
+            trace.enable(echo=True)
+
+        with trace.span('preload', database, count=count):
+            report = preload(
+                database, port, count, workers, batch, kind, options)
+
+        print(json.dumps(report))
+        return
+
+    options = BenchOptions.pop_from(kwargs)
+    if options.trace:
+        # the spans are printed for a caller, and kept with the results
+        trace.enable(echo=True)
+
+    if load_hosts and not user:
+        raise ValueError('user needed to ssh into the load hosts')
+
+    def bench(run_opts: BenchOptions) -> Awaitable[Results]:
+        if load_hosts:
+            hosts = [ Remote(cast(str, user), h) for h in load_hosts ]
+            return distributed_bench(hosts, database, port, run_opts, lead)
+        else:
+            return remote_bench(ssh, database, port, run_opts)
+
+    output: Union[Results, List[Results]]
+
+    try:
+        if trials > 1:
+            output = await run_trials(trials, database, options, bench)
+        else:
+            output = await bench(options)
+
+    finally:
+        if options.trace:
+            # next to the results, in the folder that write_summaries uses
+            prefix = 'redis' if database == 'redis' else 'mongo'
+            tag = options.tag
+            if database == 'mongodb':
+                tag = tag or options.concerns_tag()
+
+            out = tagged(RESULTS, prefix, tag)
+            out.mkdir(parents=True, exist_ok=True)
+            trace.write(out / 'trace.json')
+
+    # trials print a list of results, the usual run prints one
+    print(json.dumps(output))
 
 
 
@@ -183,18 +1434,241 @@ if __name__ == '__main__':
     args.add_argument('-a', '--addr',
         help = 'ssh address where database is')
 
+    args.add_argument('--chunks',
+        type = int,
+        help = 'initial chunks per shard, when the collection is sharded')
+
+    args.add_argument('--clients',
+        default = 1,
+        type = int,
+        help = 'client threads sending commands, with --routers, '
+               '--replica-reads, or the lanes of mongodb meta runs')
+
+    args.add_argument('--cursor-batch',
+        type = int,
+        help = 'documents in each batch of a mongodb aggregation cursor')
+
+    args.add_argument('-c', '--cluster',
+        default = str(CLUSTER),
+        help = 'cluster info file, used to find the mongodb data nodes')
+
     args.add_argument('-d', '--database',
         required= True,
         choices = ['mongodb','redis'],
         help = 'datbase system that is being benchmarked')
 
+    args.add_argument('--db-host',
+        default = 'localhost',
+        help = 'host of the database router, when benchmarking from '
+               'another host')
+
+    args.add_argument('--fresh',
+        action = 'store_true',
+        help = 'clear out the data before each write run')
+
+    args.add_argument('--histograms',
+        action = 'store_true',
+        help = 'keep the latency histograms in the results')
+
+    args.add_argument('-l', '--load-hosts',
+        nargs = '+',
+        help = 'run the benchmark from all these hosts at the same time, '
+               'and merge their results; user required as well')
+
+    args.add_argument('--lead',
+        default = START_LEAD,
+        type = float,
+        help = 'seconds the load hosts get to set up and warm up before '
+               'they start timing together')
+
+    args.add_argument('--indexes',
+        nargs = '+',
+        help = 'secondary indexes of the mongodb collection, each as '
+               'comma joined fields with an optional :1 or :-1, like '
+               'group,key:-1; runs without them drop them')
+
+    args.add_argument('--journal',
+        choices = ['true', 'false'],
+        help = 'if mongodb writes wait for the journal')
+
+    args.add_argument('--max-pool-size',
+        type = int,
+        help = 'max connections in each mongodb client pool')
+
+    args.add_argument('--min-pool-size',
+        type = int,
+        help = 'connections each mongodb client pool keeps open')
+
+    args.add_argument('-n', '--sizes',
+        nargs = '+',
+        type = int,
+        help = 'load sizes to run, instead of all the default ones')
+
+    args.add_argument('-o', '--ops',
+        nargs = '+',
+        choices = [
+            'write', 'read', 'meta', 'point', 'range', 'aggregate',
+            'transaction'],
+        help = 'operations to run, instead of all the default ones')
+
+    args.add_argument('--pipelines',
+        nargs = '+',
+        choices = PIPELINES,
+        help = 'aggregation pipelines to run, instead of all of them')
+
     args.add_argument('-p', '--port',
         required = True,
         type = int,
         help='port to connect to database')
 
+    args.add_argument('--read-concern',
+        choices = READ_CONCERNS,
+        help = 'read concern level of mongodb finds')
+
+    args.add_argument('--read-preference',
+        choices = list(READ_PREFERENCES),
+        help = 'replica set members that mongodb finds can read from')
+
+    args.add_argument('--rebuild-indexes',
+        action = 'store_true',
+        help = 'build the --indexes again before each mongodb run, timing '
+               'the builds over the loaded collection')
+
+    args.add_argument('--replica-reads',
+        action = 'store_true',
+        help = 'send redis reads to the replicas in turn, with a cluster '
+               'client using --clients threads')
+
+    args.add_argument('--routers',
+        choices = ROUTER_MODES,
+        help = 'spread mongodb commands over every mongos in the cluster '
+               'file, picking routers by round-robin or least-latency')
+
+    args.add_argument('--routing-sample',
+        default = ROUTING_SAMPLE,
+        type = int,
+        help = 'find commands explained after each mongodb run, to count '
+               'single shard and broadcast queries; 0 to skip')
+
+    args.add_argument('--selectivity',
+        default = SELECTIVITY,
+        type = float,
+        help = 'share of the groups that aggregation pipelines match')
+
+    args.add_argument('--setup',
+        default = 'run',
+        choices = SETUP_MODES,
+        help = 'only set up the data of each run without timing it, or skip '
+               'the setup that another load host already did')
+
+    args.add_argument('--settle',
+        type = float,
+        help = 'max seconds to wait for chunks to even out before each run')
+
+    args.add_argument('--shard-key',
+        default = 'hashed',
+        choices = list(SHARD_KEYS),
+        help = 'how the mongodb collection is sharded')
+
+    args.add_argument('--steady',
+        action = 'store_true',
+        help = 'after warmup, keep sending mongodb commands until the '
+               'windowed throughput and latency settle, then start timing')
+
+    args.add_argument('--steady-cv',
+        default = STEADY_CV,
+        type = float,
+        help = 'max coefficient of variation of the windows of a steady '
+               'load')
+
+    args.add_argument('--steady-window',
+        default = STEADY_WINDOW,
+        type = int,
+        help = 'commands in each window of the steady load check')
+
+    args.add_argument('--stop-balancer',
+        action = 'store_true',
+        help = 'keep the balancer off while runs are timed')
+
+    args.add_argument('--start-at',
+        type = float,
+        help = 'unix time to wait for before each timed run')
+
+    args.add_argument('-t', '--tag',
+        help = 'label to keep the results of this run separate')
+
+    args.add_argument('--trace',
+        action = 'store_true',
+        help = 'print timed spans of each phase, and write them to the '
+               'results folder in the chrome trace format')
+
+    args.add_argument('--trials',
+        default = 1,
+        type = int,
+        help = 'repeat the whole benchmark this many times, and write '
+               'every result to a trials file for compare')
+
+    args.add_argument('--txn-docs',
+        default = TXN_DOCS,
+        type = int,
+        help = 'documents inserted by each mongodb transaction')
+
+    args.add_argument('--txn-retries',
+        default = TXN_RETRIES,
+        type = int,
+        help = 'times a transaction is started over after a '
+               'TransientTransactionError, before it counts as failed')
+
+    args.add_argument('--txn-scope',
+        default = 'single',
+        choices = TXN_SCOPES,
+        help = 'if the documents of a transaction share a shard key, or '
+               'are spread over the shards')
+
     args.add_argument('-u', '--user',
         help = 'user to ssh into; addr required as well')
 
+    args.add_argument('-w', '--write-concern',
+        help = 'w of mongodb writes, a member count or majority')
+
+    args.add_argument('--warmup-ops',
+        type = int,
+        help = 'commands sent before timing starts, left out of the results')
+
+    args.add_argument('--warmup-seconds',
+        type = float,
+        help = 'seconds of mongodb commands sent before timing starts')
+
+    args.add_argument('--wait-queue-timeout-ms',
+        type = int,
+        help = 'ms a mongodb client waits for a free connection')
+
+    add_payload_args(args)
+
+    commands = args.add_subparsers(dest = 'command')
+
+    loader = commands.add_parser('preload',
+        help = 'bulk load a dataset instead of running benchmarks')
+
+    loader.add_argument('-b', '--batch',
+        default = BATCH_SIZE,
+        type = int,
+        help = 'docs sent in each insert or pipeline')
+
+    loader.add_argument('-k', '--kind',
+        default = 'set',
+        choices = ['set', 'hash'],
+        help = 'redis value type to load')
+
+    loader.add_argument('-n', '--count',
+        required = True,
+        type = int,
+        help = 'amount of docs to load')
+
+    loader.add_argument('-w', '--workers',
+        default = os.cpu_count() or 1,
+        type = int,
+        help = 'worker processes generating and sending docs')
+
     args = args.parse_args()
     aio.run( main(**vars(args)) )
\ No newline at end of file
@@ -0,0 +1,174 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+from typing import Dict, List, Optional, Tuple, TypedDict
+
+import logging
+
+from pymongo import MongoClient
+from pymongo.errors import OperationFailure
+
+from monitor_and_graphs.latency import Histogram, Summary
+from load_generation.mongodb_load_gen import Command
+from routers import timed
+
+
+META_PREFIX = 'meta-'
+"start of every collection name from the meta runs"
+
+MetaTimings = Tuple[Dict[str, Histogram], Dict[str, int]]
+"latencies and failure counts, keyed by command name"
+
+logger = logging.getLogger(__name__)
+
+
+class MetaReport(TypedDict):
+    lanes: int
+    "commands sent at the same time, each lane in order"
+    ops: Dict[str, Summary]
+    "keyed by command name, like create or renameCollection"
+    failed: Dict[str, int]
+
+
+
+def meta_op(cmd: Command) -> str:
+    " the command name is always the first key "
+    return next(iter(cmd))
+
+
+def meta_command(cmd: Command, db: str):
+    " prefixes the generated names, renames take whole namespaces "
+    op = meta_op(cmd)
+
+    if op == 'renameCollection':
+        cmd[op] = f'{db}.{META_PREFIX}{cmd[op]}'
+        cmd['to'] = f"{db}.{META_PREFIX}{cmd['to']}"
+    else:
+        cmd[op] = META_PREFIX + cmd[op]
+
+
+def meta_names(cmd: Command) -> List[str]:
+    " collections that a meta command touches "
+    op = meta_op(cmd)
+
+    if op == 'renameCollection':
+        return [ cmd[op].partition('.')[2], cmd['to'].partition('.')[2] ]
+
+    return [ cmd[op] ]
+
+
+
+def meta_lanes(cmds: List[Command], lanes: int) -> List[List[Command]]:
+    """
+    Splits the commands so that every command on a name, and on the names
+    it was renamed from or to, stays in one lane and in order; the lanes
+    can then run at the same time without racing on a collection
+    """
+    parent: Dict[str, str] = {}
+
+    def root(name: str) -> str:
+        parent.setdefault(name, name)
+        while parent[name] != name:
+            parent[name] = parent[parent[name]]
+            name = parent[name]
+
+        return name
+
+    for cmd in cmds:
+        first, *rest = meta_names(cmd)
+        for name in rest:
+            parent[root(name)] = root(first)
+
+    groups: Dict[str, List[Command]] = {}
+    for cmd in cmds:
+        groups.setdefault(root(meta_names(cmd)[0]), []).append(cmd)
+
+    split: List[List[Command]] = [ [] for _ in range(lanes) ]
+
+    # biggest groups first, each to the lane with the least commands
+    for group in sorted(groups.values(), key=len, reverse=True):
+        min(split, key=len).extend(group)
+
+    return [ lane for lane in split if lane ]
+
+
+
+def meta_worker(
+    cli: MongoClient,
+    cmds: List[Command],
+    db: str,
+    stop: Optional[Event] = None) -> MetaTimings:
+
+    """
+    Sends a lane of commands; a failed command, like a rename that lost a
+    catalog lock, is counted instead of ending the run
+    """
+    latencies: Dict[str, Histogram] = {}
+    failures: Dict[str, int] = {}
+
+    for cmd in cmds:
+        if stop and stop.is_set():
+            break
+
+        op = meta_op(cmd)
+
+        try:
+            micros = timed(cli, db, cmd)
+        except OperationFailure as e:
+            logger.debug(f'{op} failed: {e}')
+            failures[op] = failures.get(op, 0) + 1
+            continue
+
+        latencies.setdefault(op, Histogram()).record(micros)
+
+    return latencies, failures
+
+
+
+def run_meta(
+    cli: MongoClient,
+    cmds: List[Command],
+    db: str,
+    lanes: int,
+    stop: Optional[Event] = None) -> MetaTimings:
+
+    " runs the lanes of meta commands at the same time, on one client "
+    split = meta_lanes(cmds, lanes)
+
+    latencies: Dict[str, Histogram] = {}
+    failures: Dict[str, int] = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, len(split))) as pool:
+        runs = [
+            pool.submit(meta_worker, cli, lane, db, stop) for lane in split ]
+
+        for run in runs:
+            lane_latencies, lane_failures = run.result()
+
+            for op, hist in lane_latencies.items():
+                latencies.setdefault(op, Histogram()).merge(hist)
+
+            for op, count in lane_failures.items():
+                failures[op] = failures.get(op, 0) + count
+
+    return latencies, failures
+
+
+
+def meta_report(
+    timings: MetaTimings, lanes: int, seconds: float) -> MetaReport:
+
+    latencies, failures = timings
+    return MetaReport(
+        lanes = lanes,
+        ops = { op: h.summary(seconds) for op, h in latencies.items() },
+        failed = failures)
+
+
+
+def drop_meta(cli: MongoClient, db: str):
+    " collections left by an earlier meta run would fail the creates "
+    names = cli[db].list_collection_names(
+        filter = { 'name': { '$regex': f'^{META_PREFIX}' } })
+
+    for name in names:
+        cli[db].drop_collection(name)
@@ -16,8 +16,14 @@ import shlex
 import socket
 
 from deployment.modifyconf import mod_path
-from deployment.redis.start import end_server, init_server
-from deployment.mongodb.start import Cluster, start_mongos, mongodb_stop_server
+from deployment.mongodb import start as mongodb_script
+from deployment.redis import start as redis_script
+from deployment.redis.start import (
+    end_server, init_server, parse_conf, replica_ports)
+from deployment.mongodb.start import (
+    Cluster, Mongos, ReplInfo,
+    member_addr, mongodb_stop_server, start_mongos)
+from monitor_and_graphs import trace
 
 
 STORAGE_REPO = 'https://github.com/billybimbob/storage-deployments.git'
@@ -27,7 +33,13 @@ STORAGE_FOLDER = PurePosixPath( PurePath(STORAGE_REPO).stem )
 DEPLOYMENT = Path('deployment')
 LOGS = Path('monitor_and_graphs') / 'logs'
 
+ADDRESSES = DEPLOYMENT / 'ip-addresses.json'
+REDIS_CONF = DEPLOYMENT / 'redis/confs/master.conf'
+REDIS_REPLICA_CONF = DEPLOYMENT / 'redis/confs/slave.conf'
+CLUSTER_LOC = DEPLOYMENT / 'mongodb/cluster.json'
+
 SETUP_TIMEOUT = 15
+COMMAND_TIMEOUT = 12
 
 logger = logging.getLogger(__name__)
 
@@ -66,6 +78,10 @@ class Addresses:
 
         return cls(**ips)
 
+    def to_json(self, path: Union[str, Path]):
+        with open(path, 'w') as f:
+            json.dump(asdict(self), f, indent=4)
+
 
     def __bool__(self) -> bool:
         return (bool(self.main)
@@ -130,28 +146,67 @@ class Result(NamedTuple):
 
 
 
-async def exec_commands(*commands: List[str]) -> List[Result]:
-    " Runs multiple commands with timeout, and wraps them in results "
+def trace_daemons():
+    " spans of the start scripts run in this process go right to the trace "
+    mongodb_script.span_sink = trace.record
+    redis_script.span_sink = trace.record
+
+
+
+def start_script(database: Database) -> List[str]:
+    " the start script on a host, which only prints its spans when traced "
+    script = f'./{STORAGE_FOLDER / DEPLOYMENT / database}/start.py'
+    return [ script, '--trace' ] if trace.is_enabled() else [ script ]
+
+
+
+def command_span(cmd: List[str]) -> Tuple[str, str]:
+    " the name and host of the span for a command, like ssh or scp "
+    program = PurePath(cmd[0]).name
+
+    if program == 'ssh' and len(cmd) > 2:
+        remote = [ PurePath(cmd[2]).name, *cmd[3:] ]
+        return ' '.join(remote), cmd[1].rpartition('@')[2]
+
+    if program == 'scp' and len(cmd) > 2:
+        host = cmd[-1].rpartition('@')[2].partition(':')[0]
+        return f'scp {PurePath(cmd[1]).name}', host
+
+    return ' '.join([ program, *cmd[1:] ]), trace.HOST
+
+
+
+async def exec_commands(
+    *commands: List[str],
+    timeout: Optional[float] = COMMAND_TIMEOUT) -> List[Result]:
+    """
+    Runs multiple commands with timeout, and wraps them in results. Each
+    command is a span on its host, along with the spans it printed
+    """
 
     async def process_exec(cmd: List[str], run_num: int) -> Standards:
         logger.debug(f'run: {run_num} running command {cmd}')
+        name, host = command_span(cmd)
 
-        sub_proc = await aio.create_subprocess_exec(
-            *cmd, stdout=proc.PIPE, stderr=proc.PIPE)
+        with trace.span(name, 'command', host) as span:
+            sub_proc = await aio.create_subprocess_exec(
+                *cmd, stdout=proc.PIPE, stderr=proc.PIPE)
 
-        logger.debug(f'run: {run_num} waiting')
-        try:
-            com = await aio.wait_for(sub_proc.communicate(), 12)
-            logger.debug(f'run: {run_num} finished')
+            logger.debug(f'run: {run_num} waiting')
+            try:
+                com = await aio.wait_for(sub_proc.communicate(), timeout)
+                logger.debug(f'run: {run_num} finished')
 
-        except aio.TimeoutError:
-            logger.error(f'run: {run_num} took too long')
-            sub_proc.kill()
-            await sub_proc.wait()
-            raise
+            except aio.TimeoutError:
+                logger.error(f'run: {run_num} took too long')
+                sub_proc.kill()
+                await sub_proc.wait()
+                raise
 
-        else:
-            return Standards.from_process(com)
+            else:
+                out = Standards.from_process(com)
+                trace.collect(out.out, host, span['tid'])
+                return out
 
 
     outputs = await aio.gather(
@@ -164,7 +219,12 @@ async def exec_commands(*commands: List[str]) -> List[Result]:
 
 
 
-async def run_ssh(cmd: str, user: str, *ips: str) -> List[Result]:
+async def run_ssh(
+    cmd: str,
+    user: str,
+    *ips: str,
+    timeout: Optional[float] = COMMAND_TIMEOUT) -> List[Result]:
+
     remotes = [
         Remote(user, ip, cmd)
         for ip in ips if not is_selfhost(ip) ]
@@ -173,17 +233,79 @@ async def run_ssh(cmd: str, user: str, *ips: str) -> List[Result]:
     if any( is_selfhost(ip) for ip in ips ):
         cmds.append(shlex.split(cmd))
 
-    return await exec_commands(*cmds)
+    return await exec_commands(*cmds, timeout=timeout)
+
+
+
+def host_instances(hosts: List[str], port: int, instances: int) -> List[str]:
+    " members for many daemons on every host, at consecutive ports "
+    if instances <= 1:
+        return list(hosts)
+
+    return [ f'{h}:{port + i}' for h in hosts for i in range(instances) ]
 
 
+def instance_ports(port: int, instances: int) -> Optional[List[int]]:
+    if instances <= 1:
+        return None
+
+    return [ port + i for i in range(instances) ]
+
+
+def instance_cpus(
+    hosts: List[str],
+    instances: int,
+    cpus: Optional[List[str]]) -> Optional[List[str]]:
+
+    " the cpus of each instance are the same on every host "
+    if not cpus:
+        return None
+
+    return [
+        cpus[i] if i < len(cpus) else ''
+        for _ in hosts for i in range(max(instances, 1)) ]
+
+
+def instance_addresses(
+    ips: Addresses, port: int, instances: int) -> Addresses:
+
+    return Addresses(**{
+        role: host_instances(hosts, port, instances)
+        for role, hosts in asdict(ips).items() })
+
+
+def instances_loc(addrs_loc: Path, instances: int) -> Path:
+    " the node list, which only differs from the hosts with many instances "
+    if instances <= 1:
+        return addrs_loc
+
+    return addrs_loc.with_name(f'{addrs_loc.stem}-instances.json')
+
+
+
+async def redis_start(
+    user: str,
+    ips: Addresses,
+    local_conf: Path = REDIS_CONF,
+    addrs_loc: Path = ADDRESSES,
+    native: bool = False,
+    replicas: int = 0,
+    replica_conf: Path = REDIS_REPLICA_CONF,
+    instances: int = 1,
+    cpus: Optional[List[str]] = None) -> List[Result]:
 
-async def redis_start(user: str, ips: Addresses) -> List[Result]:
-    local_conf = DEPLOYMENT / 'redis/confs/master.conf'
-    redis = STORAGE_FOLDER / DEPLOYMENT / 'redis'
     r_log = STORAGE_FOLDER / LOGS / 'redis'
+    port = int(parse_conf(local_conf, 'port')['port'])
+
+    nodes = instance_addresses(ips, port, instances)
+    nodes_loc = instances_loc(addrs_loc, instances)
+    if nodes_loc != addrs_loc:
+        nodes.to_json(nodes_loc)
+
+    master_ports = instance_ports(port, instances)
 
     start_cmds: List[Remote] = []
-    cmd_base = [f'./{redis}/start.py']
+    cmd_base = start_script('redis')
 
     # local addr can potentially be a main addr
     in_ips = any( is_selfhost(ip) for ip in ips )
@@ -191,7 +313,8 @@ async def redis_start(user: str, ips: Addresses) -> List[Result]:
     if in_ips:
         log = LOGS / 'redis' / 'master.log'
         # run locally, no out info
-        await init_server(str(local_conf), log=str(log))
+        await init_server(
+            str(local_conf), log=str(log), ports=master_ports, cpus=cpus)
 
     for ip in ips:
         if is_selfhost(ip):
@@ -200,62 +323,122 @@ async def redis_start(user: str, ips: Addresses) -> List[Result]:
         cmd = list(cmd_base)
         cmd += ['-l', f'{r_log}/master.log']
         cmd += ['-c', 'master.conf']
+
+        if master_ports:
+            cmd += ['-p', *map(str, master_ports)]
+
+        if cpus:
+            cmd += ['-a', *cpus]
+
         start_cmds.append( Remote(user, ip, cmd) )
         
-    # ensure master starts before other nodes
-    results = await exec_commands(*[ s.ssh for s in start_cmds ])
+    for ip in ips.data if replicas else []:
+        ports = replica_ports(nodes, port, replicas, ip)
 
-    addrs_loc = DEPLOYMENT / 'ip-addresses'
+        if is_selfhost(ip):
+            log = LOGS / 'redis' / 'replica.log'
+            await init_server(str(replica_conf), log=str(log), ports=ports)
+            continue
+
+        cmd = list(cmd_base)
+        cmd += ['-l', f'{r_log}/replica.log']
+        cmd += ['-c', 'slave.conf']
+        cmd += ['-p', *map(str, ports)]
+        start_cmds.append( Remote(user, ip, cmd) )
+
+    # ensure master starts before other nodes
+    with trace.span('start servers'):
+        results = await exec_commands(*[ s.ssh for s in start_cmds ])
 
     if in_ips:
-        await init_server(str(local_conf), ips=str(addrs_loc))
+        with trace.span('create cluster'):
+            await init_server(
+                str(local_conf),
+                ips = str(nodes_loc),
+                native = native,
+                replicas = replicas)
 
     else:
-        cluster_start = list(cmd_base)
-        cluster_start += ['-c', str(redis / 'confs' / 'master.conf')]
-        cluster_start += ['-i', str(STORAGE_FOLDER / addrs_loc)]
         ip = ips.main[0]
+        # the node list can be a subset of all the ips
+        results += await exec_commands(shlex.split(
+            f'scp {nodes_loc} {user}@{ip}:~/ip-addresses.json'))
+
+        cluster_start = list(cmd_base)
+        cluster_start += ['-c', 'master.conf']
+        cluster_start += ['-i', 'ip-addresses.json']
+
+        if native:
+            cluster_start += ['--native']
+
+        if replicas:
+            cluster_start += ['-r', str(replicas)]
+
         cluster_start = Remote(user, ip, cluster_start)
 
-        results += await exec_commands(cluster_start.ssh)
+        with trace.span('create cluster'):
+            results += await exec_commands(cluster_start.ssh)
 
     return results
 
 
 
-async def mongo_start(user: str, ips: Addresses) -> List[Result]:
+async def mongo_start(
+    user: str,
+    ips: Addresses,
+    cluster_loc: Path = CLUSTER_LOC,
+    instances: int = 1,
+    cpus: Optional[List[str]] = None,
+    restart: bool = False) -> List[Result]:
 
-    cluster_loc = DEPLOYMENT / 'mongodb/cluster.json'
-    cluster = update_cluster(cluster_loc, ips)
+    " a restart skips the replica set and shard setup, like after a restore "
+    cluster = update_cluster(cluster_loc, ips, instances, cpus)
 
     scp = [ # should scp updated cluster
         shlex.split(f'scp {cluster_loc} {user}@{ip}:~/cluster.json')
         for ip in ips
         if not is_selfhost(ip) ]
 
-    results = await exec_commands(*scp)
-    results += await mongo_remotes(user, ips)
+    with trace.span('push cluster'):
+        results = await exec_commands(*scp)
+
+    results += await mongo_remotes(user, cluster, restart)
 
     # local addr can potentially be a main addr
-    for i, ip in enumerate(ips.main):
-        if not is_selfhost(ip):
+    for i in range(len(cluster.mongos.members)):
+        if not is_selfhost(member_addr(cluster.mongos, i)[0]):
             continue
 
         mongos_conf = DEPLOYMENT / 'mongodb/confs/mongos.conf'
         # run locally, no resulting output
-        await start_mongos(i, str(mongos_conf), cluster)
+        with trace.span('start mongos'):
+            await start_mongos(
+                i, str(mongos_conf), cluster, add_shard=not restart)
 
     return results
 
 
-def update_cluster(cluster_loc: Path, ips: Addresses) -> Cluster:
+def update_cluster(
+    cluster_loc: Path,
+    ips: Addresses,
+    instances: int = 1,
+    cpus: Optional[List[str]] = None) -> Cluster:
+
+    """
+    Instances is the amount of shard members on each data host; each
+    instance index is its own shard replica set, so the instances on a
+    host hold different data
+    """
     # m_log = STORAGE_FOLDER / LOGS / 'mongodb'
     cluster = Cluster.from_json(cluster_loc)
+    shard_port = cluster.shards.port
 
     # cluster.log = str(m_log)
     cluster.mongos.members = ips.main
     cluster.configs.members = ips.misc
-    cluster.shards.members = ips.data
+    cluster.shards.members = host_instances(ips.data, shard_port, instances)
+    cluster.shards.cpus = instance_cpus(ips.data, instances, cpus)
+    cluster.shards.sets = max(instances, 1)
 
     with open(cluster_loc, 'w') as f:
         json.dump(asdict(cluster), f, indent=4)
@@ -263,20 +446,27 @@ def update_cluster(cluster_loc: Path, ips: Addresses) -> Cluster:
     return cluster
 
 
-async def mongo_remotes(user: str, ips: Addresses):
+async def mongo_remotes(
+    user: str, cluster: Cluster, restart: bool = False):
+
+    " members are started on their own host, which can have many members "
     start_cmds: List[Remote] = []
 
-    mongodb = STORAGE_FOLDER / DEPLOYMENT / 'mongodb'
-    cmd_base = [f'./{mongodb}/start.py', '-c', 'cluster.json']
+    cmd_base = [ *start_script('mongodb'), '-c', 'cluster.json' ]
+
+    def host(info: Union[Mongos, ReplInfo], idx: int):
+        return member_addr(info, idx)[0]
 
-    for i, ip in enumerate(ips.misc):
+    for i in range(len(cluster.configs.members)):
+        ip = host(cluster.configs, i)
         cmd = list(cmd_base)
         cmd += ['-r', 'configs']
         cmd += ['-m', str(i)]
         cmd += ['-f', 'config.conf']
         start_cmds.append( Remote(user, ip, cmd) )
 
-    results = await exec_commands(*[ s.ssh for s in start_cmds ])
+    with trace.span('start configs'):
+        results = await exec_commands(*[ s.ssh for s in start_cmds ])
 
     # prompt = "Move on from configs (y/n):"
     # user_input = input(prompt).lower() 
@@ -285,14 +475,16 @@ async def mongo_remotes(user: str, ips: Addresses):
     
     start_cmds.clear()
 
-    for i, ip in enumerate(ips.data):
+    for i in range(len(cluster.shards.members)):
+        ip = host(cluster.shards, i)
         cmd = list(cmd_base)
         cmd += ['-r', 'shards']
         cmd += ['-m', str(i)]
         cmd += ['-f', 'shard.conf']
         start_cmds.append( Remote(user, ip, cmd) )
     
-    results += await exec_commands(*[ s.ssh for s in start_cmds ])
+    with trace.span('start shards'):
+        results += await exec_commands(*[ s.ssh for s in start_cmds ])
 
     # prompt = "Move on from shards (y/n):"
     # user_input = input(prompt).lower() 
@@ -301,12 +493,13 @@ async def mongo_remotes(user: str, ips: Addresses):
     
     start_cmds.clear()
 
-    if ips.misc:
+    if cluster.configs.members and not restart:
         cmd = list(cmd_base)
         cmd += ['-r', 'configs']
-        start_cmds.append( Remote(user, ips.misc[0], cmd) )
+        start_cmds.append( Remote(user, host(cluster.configs, 0), cmd) )
     
-    results += await exec_commands(*[ s.ssh for s in start_cmds ])
+    with trace.span('initiate configs'):
+        results += await exec_commands(*[ s.ssh for s in start_cmds ])
 
     # prompt = "Move on from config init (y/n):"
     # user_input = input(prompt).lower() 
@@ -315,12 +508,13 @@ async def mongo_remotes(user: str, ips: Addresses):
     
     start_cmds.clear()
 
-    if ips.data:
+    if cluster.shards.members and not restart:
         cmd = list(cmd_base)
         cmd += ['-r', 'shards']
-        start_cmds.append( Remote(user, ips.data[0], cmd) )
+        start_cmds.append( Remote(user, host(cluster.shards, 0), cmd) )
     
-    results += await exec_commands(*[ s.ssh for s in start_cmds ])
+    with trace.span('initiate shards'):
+        results += await exec_commands(*[ s.ssh for s in start_cmds ])
 
     # prompt = "Move on from shards init (y/n):"
     # user_input = input(prompt).lower() 
@@ -329,7 +523,8 @@ async def mongo_remotes(user: str, ips: Addresses):
     
     start_cmds.clear()
 
-    for i, ip in enumerate(ips.main):
+    for i in range(len(cluster.mongos.members)):
+        ip = host(cluster.mongos, i)
         if is_selfhost(ip):
             continue
 
@@ -337,11 +532,13 @@ async def mongo_remotes(user: str, ips: Addresses):
         cmd += ['-r', 'mongos']
         cmd += ['-m', str(i)]
         cmd += ['-f', 'mongos.conf'] # should be top level from scp
+        cmd += ['--restart'] if restart else []
         start_cmds.append( Remote(user, ip, cmd) )
 
     logger.info(start_cmds)
 
-    results += await exec_commands(*[ s.ssh for s in start_cmds ])
+    with trace.span('start mongos'):
+        results += await exec_commands(*[ s.ssh for s in start_cmds ])
 
     return results
 
@@ -368,14 +565,18 @@ async def fetch_repo(ips: Addresses, user: str):
     clone = f'git clone {STORAGE_REPO}'
 
     non_local = [ip for ip in ips if not is_selfhost(ip)]
-    results = await run_ssh(clone, user, *non_local)
+
+    with trace.span('fetch repo'):
+        results = await run_ssh(clone, user, *non_local)
 
     failed = [ ip for ip, res in zip(ips, results) if res.is_error ]
 
     if failed:
         logger.debug(f'pulling git for addrs {failed}')
         pull = f'cd {STORAGE_FOLDER} && git pull' # && git checkout . && git pull'
-        await run_ssh(pull, user, *failed)
+
+        with trace.span('pull repo'):
+            await run_ssh(pull, user, *failed)
 
 
 
@@ -383,15 +584,32 @@ async def run_starts(
     ips: Addresses,
     user: str,
     database: Database,
-    out: Optional[str]=None):
-
-    if database == "redis":
-        logger.debug('starting redis daemons')
-        results = await redis_start(user, ips)
-
-    elif database == "mongodb":
-        logger.debug('starting mongo daemons')
-        results = await mongo_start(user, ips)
+    out: Optional[str]=None,
+    redis_conf: Path = REDIS_CONF,
+    addrs_loc: Path = ADDRESSES,
+    cluster_loc: Path = CLUSTER_LOC,
+    redis_native: bool = False,
+    redis_replicas: int = 0,
+    replica_conf: Path = REDIS_REPLICA_CONF,
+    instances: int = 1,
+    cpus: Optional[List[str]] = None,
+    restart: bool = False):
+
+    """
+    Instances are the redis masters, or the shard members, of each host.
+    A mongo restart starts on already initiated data
+    """
+    with trace.span(f'{database} start', instances=instances):
+        if database == "redis":
+            logger.debug('starting redis daemons')
+            results = await redis_start(
+                user, ips, redis_conf, addrs_loc,
+                redis_native, redis_replicas, replica_conf, instances, cpus)
+
+        elif database == "mongodb":
+            logger.debug('starting mongo daemons')
+            results = await mongo_start(
+                user, ips, cluster_loc, instances, cpus, restart)
 
     write_results(results, out)
 
@@ -401,61 +619,107 @@ async def run_shutdown(
     ips: Addresses,
     user: str,
     database: Database,
-    out: Optional[str]=None):
+    out: Optional[str]=None,
+    redis_conf: Path = mod_path(REDIS_CONF),
+    cluster_loc: Path = CLUSTER_LOC,
+    redis_replicas: int = 0,
+    instances: int = 1,
+    **_: Any):
+
+    with trace.span(f'{database} shutdown'):
+        # go reverse so that main nodes end last
+        if database == 'redis':
+            logger.debug('stopping redis daemons')
+
+            script = ' '.join(start_script('redis'))
+            shutdown = f'{script} -s -c master.conf'
+            results: List[Result] = []
 
-    # go reverse so that main nodes end last
-    if database == 'redis':
-        logger.debug('stopping redis daemons')
+            # replicas go first, so they do not try to fail over
+            port = int(parse_conf(redis_conf, 'port')['port'])
+            nodes = instance_addresses(ips, port, instances)
 
-        if any(is_selfhost(ip) for ip in ips):
-            master_conf = mod_path(DEPLOYMENT / 'redis/confs/master.conf')
-            await end_server(str(master_conf))
+            for ip in ips.data if redis_replicas else []:
+                ports = replica_ports(nodes, port, redis_replicas, ip)
 
-        non_local = [ip for ip in ips if not is_selfhost(ip)]
-        redis = STORAGE_FOLDER / DEPLOYMENT / 'redis'
-        shutdown = f'./{redis}/start.py -s -c master.conf'
+                if is_selfhost(ip):
+                    await end_server(str(redis_conf), ports)
+                    continue
 
-        results = await run_ssh(shutdown, user, *non_local)
+                ports_arg = ' '.join(map(str, ports))
+                results += await run_ssh(
+                    f'{shutdown} -p {ports_arg}', user, ip)
 
+            master_ports = instance_ports(port, instances)
+            if master_ports:
+                shutdown += f" -p {' '.join(map(str, master_ports))}"
 
-    elif database == 'mongodb':
-        logger.debug('stopping mongo daemons')
+            if any(is_selfhost(ip) for ip in ips):
+                await end_server(str(redis_conf), master_ports)
+
+            non_local = [ip for ip in ips if not is_selfhost(ip)]
+            results += await run_ssh(shutdown, user, *non_local)
+
+
+        elif database == 'mongodb':
+            logger.debug('stopping mongo daemons')
 
-        if any(is_selfhost(ip) for ip in ips):
-            cluster_loc = DEPLOYMENT / 'mongodb/cluster.json'
             cluster = Cluster.from_json(cluster_loc)
-            mongodb_stop_server(cluster, "mongos")
 
-        main_ips = [ip for ip in ips.main if not is_selfhost(ip)]
-        misc_ips = [ip for ip in ips.misc if not is_selfhost(ip)]
-        data_ips = [ip for ip in ips.data if not is_selfhost(ip)]
+            if any(is_selfhost(ip) for ip in ips):
+                mongodb_stop_server(cluster, "mongos")
+
+            main_ips = [ip for ip in ips.main if not is_selfhost(ip)]
+            misc_ips = [ip for ip in ips.misc if not is_selfhost(ip)]
+
+            script = ' '.join(start_script('mongodb'))
+            shutdown = f'{script} -c cluster.json --shutdown'
 
-        mongodb = STORAGE_FOLDER / DEPLOYMENT / 'mongodb'
-        shutdown = f'./{mongodb}/start.py -c cluster.json --shutdown'
+            # a data host can have many shard members, each with its own port
+            shards = [
+                Remote(user, host, f'{shutdown} -r shards -m {i}').ssh
+                for i, (host, _) in enumerate(
+                    member_addr(cluster.shards, i)
+                    for i in range(len(cluster.shards.members)))
+                if not is_selfhost(host) ]
 
-        # shutdown main first
-        results = await run_ssh(f"{shutdown} -r mongos", user, *main_ips)
-        results += await run_ssh(f"{shutdown} -r configs", user, *misc_ips)
-        results += await run_ssh(f"{shutdown} -r shards", user, *data_ips)
+            # shutdown main first
+            results = await run_ssh(f"{shutdown} -r mongos", user, *main_ips)
+            results += await run_ssh(f"{shutdown} -r configs", user, *misc_ips)
+            results += await exec_commands(*shards)
 
     write_results(results, out)
 
 
 
 async def main(
-    file: Optional[str], user: str, shutdown: bool, **run_args: Any):
+    file: Optional[str],
+    user: str,
+    shutdown: bool,
+    native: bool,
+    trace_file: Optional[str],
+    **run_args: Any):
 
     if file is None:
         file = str(Path(__file__).parent / 'ip-addresses')
 
     ips = Addresses.from_json(file)
 
-    await fetch_repo(ips, user)
+    if trace_file:
+        trace.enable()
+        trace_daemons()
 
-    if not shutdown:
-        await run_starts(ips, user, **run_args)
-    else:
-        await run_shutdown(ips, user, **run_args)
+    try:
+        await fetch_repo(ips, user)
+
+        if not shutdown:
+            await run_starts(ips, user, redis_native=native, **run_args)
+        else:
+            await run_shutdown(ips, user, **run_args)
+
+    finally:
+        if trace_file:
+            trace.write(trace_file)
 
 
 
@@ -476,6 +740,21 @@ if __name__ == "__main__":
     parse.add_argument('-f', '--file',
         help = 'file that contains database node locations')
 
+    parse.add_argument('-a', '--cpus',
+        nargs = '+',
+        help = 'taskset cpu list for each instance, the same on every host')
+
+    parse.add_argument('-i', '--instances',
+        type = int,
+        default = 1,
+        help = 'redis masters or shard members on each host, '
+               'at consecutive ports')
+
+    parse.add_argument('-n', '--native',
+        action = 'store_true',
+        help = 'build the redis cluster with cluster commands, and wait '
+               'for it to converge')
+
     parse.add_argument('-o', '--out',
         help = 'write output of ssh stdout to file')
 
@@ -483,6 +762,10 @@ if __name__ == "__main__":
         action = 'store_true',
         help = 'run shutdown process instead of default start')
 
+    parse.add_argument('-t', '--trace-file',
+        help = 'write the timed spans of each phase and host to this file, '
+               'in the chrome trace format')
+
     parse.add_argument('-u', '--user',
         default = 'cc',
         help = 'the user for the ips, for now all the same')
@@ -1,18 +1,36 @@
-
-from typing import Any, Dict
+from typing import Any, Awaitable, Dict, List, Literal, Optional
+from argparse import ArgumentParser
+from dataclasses import dataclass, replace
+from pathlib import Path
 
 import asyncio as aio
 import json
 import shlex
-import sys
 import logging
 
-from deployment.modifyconf import modify_mongo, modify_redis
+from deployment.modifyconf import modify_mongo_params, modify_redis_params
+from deployment.mongodb.start import Cluster, member_addr
+from deployment.redis.start import replica_layout
+from deployment.runtime import (
+    Node, apply_runtime, mongo_base, order_for_restarts,
+    redis_base, runtime_changes, split_bench)
+
 from database import (
-    Addresses, DEPLOYMENT,
-    exec_commands, fetch_repo, run_shutdown, run_starts)
+    Addresses, Database, DEPLOYMENT, LOGS,
+    exec_commands, fetch_repo, run_shutdown, run_starts, trace_daemons)
 
-from benchmark import Remote, remote_bench
+from benchmark import (
+    SHARD_KEY_OPS, BenchOptions, Remote, Results, redis_flush, remote_bench)
+from load_generation.mongodb_load_gen import LOAD_SIZES
+from monitor_and_graphs import trace
+from sweep import (
+    DESIGNS, Checkpoint, Design, Parameters, Point,
+    expand, point_tag, run_sweep)
+
+from pools import Pool, run_pools, split_pools
+from snapshot import (
+    has_snapshot, restore_snapshot, snapshot_name, take_snapshot)
+from tuning import METRICS, Metric, successive_halving
 
 
 
@@ -22,114 +40,563 @@ MONGO_MASTER_PORT = 27017
 USER = "cc"
 IPS = Addresses.from_json(DEPLOYMENT /'ip-addresses')
 
-with open(DEPLOYMENT / 'parameter_changes.json', 'r') as f:
-    PARAMETERS: Dict[str, Any] = json.load(f)
+PARAMETER_FILE = DEPLOYMENT / 'parameter_changes.json'
+SWEEPS = LOGS / 'sweeps'
 
 REDIS_CONFS = DEPLOYMENT / 'redis' / 'confs'
 MONGODB_CONFS = DEPLOYMENT / 'mongodb' / 'confs'
 
+logger = logging.getLogger(__name__)
+
+Mode = Literal['sweep', 'halving']
+
+
+def load_parameters(file: Path, database: Database) -> Parameters:
+    with open(file, 'r') as f:
+        parameters: Dict[str, Parameters] = json.load(f)
+
+    return parameters[database]
+
+
+
+async def push_redis(point: Point, pool: Pool, replicas: int = 0) -> Path:
+    " writes and copies the config of the point to the nodes "
+    ips = pool.ips
+    port = pool.port(REDIS_MASTER_PORT)
+    params, _ = split_bench(point)
+
+    if pool.port_offset:
+        params['port'] = port
+        params['cluster-config-file'] = f'nodes-{port}.conf'
+
+    master_conf = modify_redis_params(
+        REDIS_CONFS / 'master.conf',
+        params,
+        pool.conf_path(REDIS_CONFS / 'master.conf'))
+
+    # sentinel_conf = modify_redis_params(
+    #     REDIS_CONFS / 'sentinel.conf', point)
+
+    scp_cmds = [
+        shlex.split(
+            f'scp {master_conf} {USER}@{ip}:~/master.conf')
+        for ip in ips ]
+
+    # scp_cmds += [
+    #     shlex.split(
+    #         f'scp {sentinel_conf} {USER}@{ip}:~/sentinel.conf')
+    #     for ip in IPS.misc ]
+
+    if replicas:
+        # replica ports are given when they start, so no port changes
+        slave_params, _ = split_bench(point)
+        slave_conf = modify_redis_params(
+            REDIS_CONFS / 'slave.conf',
+            slave_params,
+            pool.conf_path(REDIS_CONFS / 'slave.conf'))
+
+        scp_cmds += [
+            shlex.split(
+                f'scp {slave_conf} {USER}@{ip}:~/slave.conf')
+            for ip in ips.data ]
+
+    with trace.span('push configs'):
+        await exec_commands(*scp_cmds)
+
+    return master_conf
+
+
+async def start_redis(point: Point, pool: Pool, replicas: int = 0):
+    master_conf = await push_redis(point, pool, replicas)
+    await run_starts(
+        pool.ips, USER, "redis",
+        redis_conf = master_conf,
+        addrs_loc = pool.addrs_loc,
+        redis_replicas = replicas,
+        replica_conf = pool.conf_path(REDIS_CONFS / 'slave.conf'))
+
+
+async def bench_redis(pool: Pool, options: BenchOptions) -> Results:
+    remote = Remote(USER, pool.ips.main[0])
+
+    with trace.span('benchmark', ops=options.ops, sizes=options.sizes):
+        return await remote_bench(
+            remote, "redis", pool.port(REDIS_MASTER_PORT), options)
+
 
-async def deploy_redis():
-    params: Dict[str, Any] = PARAMETERS["redis"]
+async def stop_redis(pool: Pool, replicas: int = 0):
+    master_conf = pool.conf_path(REDIS_CONFS / 'master.conf')
+    await run_shutdown(
+        pool.ips, USER, "redis",
+        redis_conf = master_conf,
+        redis_replicas = replicas)
 
-    for param_name, vals in params.items():
-        for param_val in vals:
-            new_param = param_name, param_val
 
-            master_conf = modify_redis(
-                REDIS_CONFS / 'master.conf', *new_param)
 
-            # sentinel_conf = modify_redis(
-            #     REDIS_CONFS / 'sentinel.conf', *new_param)
+async def deploy_redis(
+    point: Point,
+    sizes: Optional[List[int]] = None,
+    pool: Pool = Pool(IPS),
+    snapshots: bool = False,
+    replicas: int = 0) -> Results:
 
-            # slave_conf = modify_redis(
-            #     REDIS_CONFS / 'slave.conf', *new_param)
+    try:
+        await start_redis(point, pool, replicas)
+        return await run_bench("redis", point, sizes, pool, snapshots)
 
-            scp_cmds = [
-                shlex.split(
-                    f'scp {master_conf} {USER}@{ip}:~/master.conf')
-                for ip in IPS ]
+    finally:
+        # also runs when the point goes over its time budget, or a start
+        # fails part way, so no half started cluster is left behind
+        await stop_redis(pool, replicas)
 
-            # scp_cmds += [
-            #     shlex.split(
-            #         f'scp {sentinel_conf} {USER}@{ip}:~/sentinel.conf')
-            #     for ip in IPS.misc ]
 
-            # scp_cmds += [
-            #     shlex.split(
-            #         f'scp {slave_conf} {USER}@{ip}:~/slave.conf')
-            #     for ip in IPS.data ]
 
-            await exec_commands(*scp_cmds)
-            await run_starts(IPS, USER, "redis")
+async def push_mongodb(point: Point, pool: Pool):
+    " writes and copies the configs of the point to the nodes "
+    ips = pool.ips
+    point, _ = split_bench(point)
 
-            remote = Remote(USER, IPS.main[0])
-            await remote_bench(remote, "redis", REDIS_MASTER_PORT)
+    # mongos_conf = modify_mongo_params(
+    #     MONGODB_CONFS / 'mongos.conf', point,
+    #     pool.conf_path(MONGODB_CONFS / 'mongos.conf'))
+    mongos_conf = MONGODB_CONFS / 'mongos.conf'
 
-            prompt = "Move on to next parameter(y/n):"
-            user_input = input(prompt).lower() 
+    config_conf = modify_mongo_params(
+        MONGODB_CONFS / 'config.conf', point,
+        pool.conf_path(MONGODB_CONFS / 'config.conf'))
 
-            await run_shutdown(IPS, USER, "redis")
+    shard_conf = modify_mongo_params(
+        MONGODB_CONFS / 'shard.conf', point,
+        pool.conf_path(MONGODB_CONFS / 'shard.conf'))
 
-            if user_input == 'n':
-                sys.exit()
+    scp_cmds = [
+        shlex.split(
+            f'scp {mongos_conf} {USER}@{ip}:~/mongos.conf')
+        for ip in ips.main ]
 
+    scp_cmds += [
+        shlex.split(
+            f'scp {config_conf} {USER}@{ip}:~/config.conf')
+        for ip in ips.misc ]
 
-async def deploy_mongodb():
-    params: Dict[str, Any] = PARAMETERS["mongodb"]
+    scp_cmds += [
+        shlex.split(
+            f'scp {shard_conf} {USER}@{ip}:~/shard.conf')
+        for ip in ips.data ]
 
-    for param_name, vals in params.items():
-        for param_val in vals:
-            new_param = param_name, param_val
+    with trace.span('push configs'):
+        await exec_commands(*scp_cmds)
 
-            # mongos_conf = modify_mongo(
-            #     MONGODB_CONFS / 'mongos.conf', *new_param)
-            mongos_conf = MONGODB_CONFS / 'mongos.conf'
-            
-            config_conf = modify_mongo(
-                MONGODB_CONFS / 'config.conf', *new_param)
 
-            shard_conf = modify_mongo(
-                MONGODB_CONFS / 'shard.conf', *new_param)
+async def start_mongodb(point: Point, pool: Pool):
+    await push_mongodb(point, pool)
+    await run_starts(
+        pool.ips, USER, "mongodb", cluster_loc=pool.cluster_loc)
 
-            scp_cmds = [
-                shlex.split(
-                    f'scp {mongos_conf} {USER}@{ip}:~/mongos.conf')
-                for ip in IPS.main ]
 
-            scp_cmds += [
-                shlex.split(
-                    f'scp {config_conf} {USER}@{ip}:~/config.conf')
-                for ip in IPS.misc ]
+async def bench_mongodb(pool: Pool, options: BenchOptions) -> Results:
+    remote = None
 
-            scp_cmds += [
-                shlex.split(
-                    f'scp {shard_conf} {USER}@{ip}:~/shard.conf')
-                for ip in IPS.data ]
+    if pool.name is not None:
+        # every pool has its own mongos, use the copied cluster file
+        remote = Remote(USER, pool.ips.main[0])
+        options.cluster = 'cluster.json'
 
-            await exec_commands(*scp_cmds)
-            await run_starts(IPS, USER, "mongodb")
+    with trace.span('benchmark', ops=options.ops, sizes=options.sizes):
+        return await remote_bench(
+            remote, "mongodb", pool.port(MONGO_MASTER_PORT), options)
 
-            # remote = Remote(USER, IPS.main[0])
-            await remote_bench(None, "mongodb", MONGO_MASTER_PORT)
 
-            prompt = "Move on to next parameter(y/n):"
-            user_input = input(prompt).lower()
+async def stop_mongodb(pool: Pool):
+    await run_shutdown(
+        pool.ips, USER, "mongodb", cluster_loc=pool.cluster_loc)
 
-            await run_shutdown(IPS, USER, "mongodb")
 
-            if user_input == 'n':
-                sys.exit()
 
+async def deploy_mongodb(
+    point: Point,
+    sizes: Optional[List[int]] = None,
+    pool: Pool = Pool(IPS),
+    snapshots: bool = False) -> Results:
+
+    try:
+        await start_mongodb(point, pool)
+        return await run_bench("mongodb", point, sizes, pool, snapshots)
+
+    finally:
+        # same as redis, a failed or timed out start is stopped as well
+        await stop_mongodb(pool)
+
+
+
+async def run_bench(
+    database: Database,
+    point: Point,
+    sizes: Optional[List[int]],
+    pool: Pool,
+    snapshots: bool = False) -> Results:
+
+    """
+    With snapshots, the data from the write run of each size is saved once,
+    and later points restore it instead of writing again, so every read
+    run starts from the same data. Bench params of the point change how the
+    data is laid out, so they get their own snapshots
+    """
+    _, bench_params = split_bench(point)
+    options = BenchOptions(
+        tag = point_tag(point),
+        sizes = sizes,
+        trace = trace.is_enabled(),
+        **bench_params)
+
+    if database == 'mongodb' and 'shard_key' in bench_params:
+        # meta runs do not touch the sharded collection
+        options.ops = options.ops or list(SHARD_KEY_OPS)
+
+    bench = bench_redis if database == 'redis' else bench_mongodb
+
+    if not snapshots:
+        return await bench(pool, options)
+
+    files = dict(
+        redis_conf = pool.conf_path(REDIS_CONFS / 'master.conf'),
+        cluster_loc = pool.cluster_loc)
+
+    results: Results = {}
+    labels = [ pool.name, point_tag(bench_params) if bench_params else None ]
+
+    for size in sizes or LOAD_SIZES:
+        name = snapshot_name(size, '-'.join(l for l in labels if l) or None)
+
+        if has_snapshot(database, name, pool.ips):
+            with trace.span('restore snapshot', name=name):
+                await restore_snapshot(
+                    pool.ips, USER, database, name, **files)
+
+        else:
+            write = replace(options, sizes=[size], ops=['write'], fresh=True)
+            results.update(await bench(pool, write))
+
+            with trace.span('take snapshot', name=name):
+                await take_snapshot(pool.ips, USER, database, name, **files)
+
+        reads = [ op for op in options.ops or ['read'] if op != 'write' ]
+        read = replace(options, sizes=[size], ops=reads)
+        results.update(await bench(pool, read))
+
+    return results
+
+
+
+@dataclass
+class Deployment:
+    """
+    A cluster that is kept up between points; params that can be changed
+    at runtime are set in place, and only the rest cause a restart
+    """
+    database: Database
+    pool: Pool
+    snapshots: bool = False
+    replicas: int = 0
+    "redis replicas for each master"
+    running: Optional[Point] = None
+    "params of the running cluster"
+
+    def nodes(self) -> List[Node]:
+        if self.database == 'redis':
+            port = self.pool.port(REDIS_MASTER_PORT)
+            pairs = replica_layout(self.pool.ips, port, self.replicas)
+            return [ (ip, port) for ip in self.pool.ips ] + [
+                replica for _, replica in pairs ]
+
+        cluster = Cluster.from_json(self.pool.cluster_loc)
+        return [
+            member_addr(info, i)
+            for info in (cluster.configs, cluster.shards)
+            for i in range(len(info.members)) ]
+
+    def base(self, param: str) -> Optional[Any]:
+        if self.database == 'redis':
+            return redis_base(REDIS_CONFS / 'master.conf', param)
+        else:
+            return mongo_base(MONGODB_CONFS / 'shard.conf', param)
+
+
+    async def reconfigure(self, point: Point) -> bool:
+        if self.running is None:
+            return False
+
+        changes = runtime_changes(
+            self.database, self.running, point, self.base)
+
+        if changes is None:
+            return False
+
+        try:
+            if changes:
+                with trace.span('runtime changes', changes=len(changes)):
+                    await apply_runtime(
+                        self.database, self.nodes(), changes)
+
+            # keep the configs up to date for later restarts
+            if self.database == 'redis':
+                await push_redis(point, self.pool, self.replicas)
+
+                # a restart flushes redis on shutdown, so a hot point starts
+                # on empty data too, and both can be compared
+                with trace.span('flush'):
+                    redis_flush(
+                        self.pool.port(REDIS_MASTER_PORT),
+                        self.pool.ips.main[0])
+            else:
+                await push_mongodb(point, self.pool)
+
+        except Exception:
+            logger.exception(f'could not set {changes}, restarting instead')
+            return False
+
+        self.running = point
+        return True
+
+
+    async def run(
+        self, point: Point, sizes: Optional[List[int]] = None) -> Results:
+
+        try:
+            if not await self.reconfigure(point):
+                await self.stop()
+                self.running = point
+
+                if self.database == 'redis':
+                    await start_redis(point, self.pool, self.replicas)
+                else:
+                    await start_mongodb(point, self.pool)
+
+            return await run_bench(
+                self.database, point, sizes, self.pool, self.snapshots)
+
+        except BaseException:
+            # cluster state is unknown after a failed or cancelled run
+            await self.stop()
+            raise
+
+
+    async def stop(self):
+        if self.running is None:
+            return
+
+        self.running = None
+
+        if self.database == 'redis':
+            await stop_redis(self.pool, self.replicas)
+        else:
+            await stop_mongodb(self.pool)
+
+
+
+async def main(
+    database: Database,
+    mode: Mode,
+    parameters: str,
+    design: Design,
+    samples: Optional[int],
+    seed: Optional[int],
+    checkpoint: Optional[str],
+    budget: Optional[float],
+    retry_failed: bool,
+    metric: Metric,
+    op: Optional[str],
+    eta: int,
+    tolerance: float,
+    patience: int,
+    pools: int,
+    hot: bool,
+    snapshots: bool,
+    replicas: int,
+    trace_spans: bool):
+
+    params = load_parameters(Path(parameters), database)
+    points = expand(params, design, samples, seed)
+
+    if checkpoint is None:
+        checkpoint = str(SWEEPS / f'{database}-{mode}-{design}.jsonl')
+
+    # the whole sweep is one timeline, written again after every point
+    trace_file = Path(checkpoint).with_suffix('.trace.json')
+    if trace_spans:
+        trace.enable()
+        trace_daemons()
 
-async def main():
     await fetch_repo(IPS, USER)
-    # await deploy_redis()
-    await deploy_mongodb()
+
+    if mode == 'halving' and pools > 1:
+        logger.warning('halving mode runs on a single pool')
+        pools = 1
+
+    if hot:
+        points = order_for_restarts(database, points)
+
+    pool_list = split_pools(IPS, pools) if pools > 1 else [ Pool(IPS) ]
+    deployments = {
+        p.name: Deployment(database, p, snapshots, replicas)
+        for p in pool_list }
+
+    def deploy(
+        point: Point,
+        sizes: Optional[List[int]],
+        pool: Pool) -> Awaitable[Results]:
+
+        if hot:
+            return deployments[pool.name].run(point, sizes)
+        elif database == 'redis':
+            return deploy_redis(point, sizes, pool, snapshots, replicas)
+        else:
+            return deploy_mongodb(point, sizes, pool, snapshots)
+
+    async def runner(
+        point: Point,
+        sizes: Optional[List[int]] = None,
+        pool: Pool = pool_list[0]) -> Results:
+
+        try:
+            with trace.span(
+                'point', 'sweep', tag=point_tag(point), pool=pool.name):
+                return await deploy(point, sizes, pool)
+
+        finally:
+            if trace_spans:
+                trace.write(trace_file)
+
+    try:
+        if mode == 'sweep' and pools > 1:
+            await run_pools(
+                points,
+                pool_list,
+                lambda pool, point: runner(point, pool=pool),
+                Checkpoint(Path(checkpoint)),
+                budget,
+                retry_failed)
+
+        elif mode == 'sweep':
+            await run_sweep(
+                points, runner, Checkpoint(Path(checkpoint)),
+                budget, retry_failed)
+
+        elif mode == 'halving':
+            best = await successive_halving(
+                points, runner, Checkpoint(Path(checkpoint)), LOAD_SIZES,
+                metric, op, eta, tolerance, patience, budget)
+
+            if best:
+                print(f'best point {best.point}: {metric} {abs(best.score)}')
+
+    finally:
+        # hot deployments are left running between points
+        await aio.gather(*[ d.stop() for d in deployments.values() ])
+
 
 
 if __name__ == "__main__":
     logging.getLogger('asyncio').setLevel(logging.WARNING)
     logging.basicConfig(level=logging.DEBUG)
-    
-    aio.run(main())
\ No newline at end of file
+
+    args = ArgumentParser(
+        description = 'sweeps database parameters, starting and '
+                      'benchmarking the cluster for each point')
+
+    args.add_argument('-b', '--budget',
+        type = float,
+        help = 'max seconds for a single point, including start and '
+               'shutdown; no limit by default')
+
+    args.add_argument('-c', '--checkpoint',
+        help = 'file that finished points are recorded to; a sweep '
+               'with the same file skips those points')
+
+    args.add_argument('-d', '--database',
+        default = 'mongodb',
+        choices = ['mongodb','redis'],
+        help = 'database system that is being swept')
+
+    args.add_argument('-e', '--design',
+        default = 'one-at-a-time',
+        choices = DESIGNS,
+        help = 'how the parameter values are combined into points')
+
+    args.add_argument('--eta',
+        type = int,
+        default = 3,
+        help = 'halving mode keeps the best 1/eta points at each load size')
+
+    args.add_argument('--hot',
+        action = 'store_true',
+        help = 'keep the cluster up between points, and set params that '
+               'can change at runtime in place instead of restarting')
+
+    args.add_argument('-m', '--mode',
+        default = 'sweep',
+        choices = ['sweep', 'halving'],
+        help = 'run every point, or search for the best point with '
+               'successive halving over the load sizes')
+
+    args.add_argument('--metric',
+        default = 'throughput',
+        choices = METRICS,
+        help = 'benchmark result that halving mode optimizes')
+
+    args.add_argument('-n', '--samples',
+        type = int,
+        help = 'amount of points for a latin-hypercube design')
+
+    args.add_argument('-o', '--op',
+        choices = [
+            'write', 'read', 'meta', 'point', 'range', 'aggregate',
+            'transaction'],
+        help = 'only score results of this operation; all by default')
+
+    args.add_argument('-p', '--parameters',
+        default = str(PARAMETER_FILE),
+        help = 'json file of parameter values for each database')
+
+    args.add_argument('-g', '--pools',
+        type = int,
+        default = 1,
+        help = 'split the hosts into this many clusters, which each run '
+               'sweep points at the same time')
+
+    args.add_argument('--patience',
+        type = int,
+        default = 2,
+        help = 'full runs without improvement before halving mode stops')
+
+    args.add_argument('--replicas',
+        type = int,
+        default = 0,
+        help = 'redis replicas for each master, placed on the data hosts')
+
+    args.add_argument('-r', '--retry-failed',
+        action = 'store_true',
+        help = 'rerun checkpointed points that failed or timed out')
+
+    args.add_argument('-s', '--seed',
+        type = int,
+        help = 'random seed for a latin-hypercube design')
+
+    args.add_argument('--snapshots',
+        action = 'store_true',
+        help = 'save the data of each write size once, and restore it '
+               'before the read runs of later points')
+
+    args.add_argument('--trace',
+        action = 'store_true',
+        dest = 'trace_spans',
+        help = 'time each phase of every point on every host, written '
+               'next to the checkpoint in the chrome trace format')
+
+    args.add_argument('-t', '--tolerance',
+        type = float,
+        default = 0.02,
+        help = 'relative improvement that counts as better in halving mode')
+
+    args = args.parse_args()
+    aio.run( main(**vars(args)) )
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 
 import logging
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, List, Optional, Set, Union
 from pathlib import Path
 import json
 
@@ -13,8 +13,16 @@ def mod_path(source: Union[str, Path]):
 
 
 def modify_redis(source: Union[str, Path], param: str, value: Any):
+    return modify_redis_params(source, { param: value })
+
+
+def modify_redis_params(
+    source: Union[str, Path],
+    params: Dict[str, Any],
+    out: Optional[Path] = None):
+
     redis_params: List[str] = []
-    set_param = False
+    set_params: Set[str] = set()
 
     with open(source) as f:
         for line in f:
@@ -28,17 +36,21 @@ def modify_redis(source: Union[str, Path], param: str, value: Any):
                 continue
 
             line_param = line_param[0]
-            if line_param == param:
-                redis_params.append(f'{param} {value}')
-                set_param = True
+            if line_param in params:
+                redis_params.append(f'{line_param} {params[line_param]}\n')
+                set_params.add(line_param)
 
             else:
                 redis_params.append(line)
 
-    if not set_param:
-        redis_params.append(f'{param} {value}')
+    if redis_params and not redis_params[-1].endswith('\n'):
+        redis_params[-1] += '\n'
+
+    for param, value in params.items():
+        if param not in set_params:
+            redis_params.append(f'{param} {value}\n')
 
-    mod_config_path = mod_path(source)
+    mod_config_path = out or mod_path(source)
     with open(mod_config_path, 'w') as f:
         f.write(''.join(redis_params))
     
@@ -46,23 +58,32 @@ def modify_redis(source: Union[str, Path], param: str, value: Any):
 
 
 def modify_mongo(source: Union[str, Path], param: str, value: Any):
+    return modify_mongo_params(source, { param: value })
+
+
+def modify_mongo_params(
+    source: Union[str, Path],
+    params: Dict[str, Any],
+    out: Optional[Path] = None):
+
     logging.info(source)
     with open(source) as f:
         configs: Dict[str, Any] = json.load(f)
 
-    param_chain = param.split('.')
-    param_key = param_chain.pop()
-    param_ref = configs
+    for param, value in params.items():
+        param_chain = param.split('.')
+        param_key = param_chain.pop()
+        param_ref = configs
 
-    for attr in param_chain:
-        if attr not in param_ref:
-            param_ref[attr] = {}
+        for attr in param_chain:
+            if attr not in param_ref:
+                param_ref[attr] = {}
 
-        param_ref: Dict[str, Any] = param_ref[attr]
+            param_ref: Dict[str, Any] = param_ref[attr]
 
-    param_ref[param_key] = value
+        param_ref[param_key] = value
 
-    mod_config_path = mod_path(source)
+    mod_config_path = out or mod_path(source)
     with open(mod_config_path, 'w') as f:
         json.dump(configs, f, indent=4)
     
@@ -0,0 +1,92 @@
+from typing import Any, Dict, List, Tuple, TypedDict
+from time import perf_counter
+
+import logging
+
+from pymongo import MongoClient
+
+
+INDEX_PREFIX = 'bench_'
+"only indexes named with this are dropped, so the shard key index stays"
+
+logger = logging.getLogger(__name__)
+
+
+
+class IndexBuild(TypedDict):
+    name: str
+    keys: Dict[str, Any]
+    docs: int
+    "documents in the collection when the index was built"
+    seconds: float
+    built: bool
+    "false when the index was already there, so nothing was timed"
+
+
+
+def parse_index(spec: str) -> Dict[str, Any]:
+    " fields joined by commas, each with an optional :1, :-1, or :hashed "
+    keys: Dict[str, Any] = {}
+
+    for part in spec.split(','):
+        field, _, direction = part.partition(':')
+        if direction in ('', '1', '-1'):
+            keys[field] = int(direction or 1)
+        else:
+            keys[field] = direction
+
+    return keys
+
+
+def index_name(keys: Dict[str, Any]) -> str:
+    return INDEX_PREFIX + '_'.join(f'{k}_{v}' for k, v in keys.items())
+
+
+
+def sync_indexes(
+    cli: MongoClient,
+    db: str,
+    col: str,
+    specs: List[str],
+    rebuild: bool = False) -> List[IndexBuild]:
+
+    """
+    Drops the benchmark indexes that are not asked for, then builds the
+    missing ones one at a time, timing each build over the documents that
+    are already in the collection
+    """
+    collection = cli[db][col]
+    wanted = [ parse_index(s) for s in specs ]
+    names = [ index_name(keys) for keys in wanted ]
+
+    existing = collection.index_information()
+
+    for name in existing:
+        if name.startswith(INDEX_PREFIX) and (rebuild or name not in names):
+            logger.info(f'dropping index {name}')
+            collection.drop_index(name)
+
+    if not rebuild:
+        existing = collection.index_information()
+
+    builds: List[IndexBuild] = []
+    docs = collection.estimated_document_count()
+
+    for keys, name in zip(wanted, names):
+        seconds = 0.0
+        built = rebuild or name not in existing
+
+        if built:
+            index: List[Tuple[str, Any]] = list(keys.items())
+            start = perf_counter()
+            collection.create_index(index, name=name)
+            seconds = perf_counter() - start
+
+        builds.append(IndexBuild(
+            name = name,
+            keys = keys,
+            docs = docs,
+            seconds = seconds,
+            built = built))
+
+    return builds
@@ -0,0 +1,289 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, TypedDict
+from time import monotonic, sleep
+
+import logging
+
+from bson.max_key import MaxKey
+from bson.min_key import MinKey
+from pymongo import MongoClient
+
+
+SETTLE_POLL = 1.0
+
+logger = logging.getLogger(__name__)
+
+
+
+class Migration(TypedDict):
+    time: str
+    from_shard: str
+    to_shard: str
+
+
+class Routing(TypedDict):
+    ops: int
+    shards: int
+    "with fewer than 2, every op is single shard whatever the key"
+    sampled: int
+    "find commands that were explained"
+    sampled_single_shard: int
+    "explained finds that mongos sent to a single shard"
+    est_single_shard: int
+    "ops estimated to go to a single shard, from the sampled finds"
+    est_broadcast: int
+    indexed: int
+    "explained finds whose plan scanned an index, on any shard"
+
+
+
+def shard_count(cli: MongoClient) -> int:
+    return len(cli['admin'].command('listShards')['shards'])
+
+
+
+def shard_collection(
+    cli: MongoClient,
+    db: str,
+    col: str,
+    key: Dict[str, Any],
+    chunks_per_shard: Optional[int] = None):
+
+    """
+    Shards the collection, pre-splitting into chunks_per_shard chunks on
+    every shard; pre-splitting only works with a hashed key on an empty
+    collection
+    """
+    admin = cli['admin']
+    admin.command('enableSharding', db)
+
+    extra: Dict[str, Any] = {}
+    if chunks_per_shard:
+        extra['numInitialChunks'] = chunks_per_shard * shard_count(cli)
+
+    # not sure if multiple calls is ok
+    admin.command('shardCollection', f'{db}.{col}', key=key, **extra)
+
+
+
+def sharded_key(
+    cli: MongoClient, db: str, col: str) -> Optional[Dict[str, Any]]:
+
+    " the shard key of the collection, if it is sharded "
+    collections = cli['config']['collections']
+    collection = collections.find_one({ '_id': f'{db}.{col}' })
+
+    if not collection or collection.get('dropped'):
+        return None
+
+    return dict(collection['key'])
+
+
+
+def add_zones(cli: MongoClient, db: str, col: str, field: str, values: str):
+    """
+    Gives each shard its own zone, with an even share of the sorted values
+    as the key range of the zone; needs a ranged key on field
+    """
+    admin = cli['admin']
+    shards = [ s['_id'] for s in admin.command('listShards')['shards'] ]
+
+    if len(shards) < 2:
+        logger.warning('one shard gets a single zone over the whole key')
+
+    bounds: List[Any] = [
+        values[i * len(values) // len(shards)] for i in range(len(shards)) ]
+
+    bounds[0] = MinKey()
+    bounds.append(MaxKey())
+
+    for i, shard in enumerate(shards):
+        zone = f'zone-{shard}'
+        admin.command('addShardToZone', shard, zone=zone)
+        admin.command(
+            'updateZoneKeyRange', f'{db}.{col}',
+            min = { field: bounds[i] },
+            max = { field: bounds[i + 1] },
+            zone = zone)
+
+
+
+def zone_ranges(cli: MongoClient, db: str, col: str) -> List[Dict[str, Any]]:
+    " the zone key ranges of the collection, which outlive a drop "
+    return list(cli['config']['tags'].find({ 'ns': f'{db}.{col}' }))
+
+
+def remove_zones(cli: MongoClient, db: str, col: str):
+    " the shards stay in their zones, only the key ranges are removed "
+    for tag in zone_ranges(cli, db, col):
+        cli['admin'].command(
+            'updateZoneKeyRange', f'{db}.{col}',
+            min = tag['min'],
+            max = tag['max'],
+            zone = None)
+
+
+
+def stop_balancer(cli: MongoClient):
+    cli['admin'].command('balancerStop')
+
+
+def start_balancer(cli: MongoClient):
+    cli['admin'].command('balancerStart')
+
+
+
+def chunk_filter(cli: MongoClient, ns: str) -> Dict[str, Any]:
+    " newer versions key chunks by the collection uuid instead of the ns "
+    collection = cli['config']['collections'].find_one({ '_id': ns })
+
+    if collection and 'uuid' in collection:
+        return { '$or': [{ 'ns': ns }, { 'uuid': collection['uuid'] }] }
+    else:
+        return { 'ns': ns }
+
+
+
+def chunk_counts(cli: MongoClient, db: str, col: str) -> Dict[str, int]:
+    " amount of chunks that each shard owns "
+    shards = [ s['_id'] for s in cli['admin'].command('listShards')['shards'] ]
+    counts = { s: 0 for s in shards }
+
+    groups = cli['config']['chunks'].aggregate([
+        { '$match': chunk_filter(cli, f'{db}.{col}') },
+        { '$group': { '_id': '$shard', 'count': { '$sum': 1 } } } ])
+
+    for group in groups:
+        counts[group['_id']] = group['count']
+
+    return counts
+
+
+
+def wait_settled(
+    cli: MongoClient,
+    db: str,
+    col: str,
+    timeout: float,
+    threshold: int = 1):
+
+    """
+    Waits until the chunk counts of the shards are within threshold of
+    each other, and no migration is running
+    """
+    start = monotonic()
+    counts: Dict[str, int] = {}
+
+    while monotonic() - start < timeout:
+        counts = chunk_counts(cli, db, col)
+        status = cli['admin'].command('balancerStatus')
+
+        spread = max(counts.values(), default=0)
+        spread -= min(counts.values(), default=0)
+
+        if spread <= threshold and not status.get('inBalancerRound'):
+            logger.info(f'chunks settled as {counts}')
+            return
+
+        sleep(SETTLE_POLL)
+
+    logger.warning(f'chunks not settled after {timeout}s: {counts}')
+
+
+
+def migrations(
+    cli: MongoClient, db: str, col: str, since: datetime) -> List[Migration]:
+
+    " chunk moves committed on the collection after since "
+    changes = cli['config']['changelog'].find({
+        'what': 'moveChunk.commit',
+        'ns': f'{db}.{col}',
+        'time': { '$gte': since } })
+
+    return [
+        Migration(
+            time = str(c['time']),
+            from_shard = c.get('details', {}).get('from', ''),
+            to_shard = c.get('details', {}).get('to', ''))
+        for c in changes ]
+
+
+
+def is_single_shard(explain: Dict[str, Any]) -> bool:
+    plan = explain.get('queryPlanner', {}).get('winningPlan', {})
+    shards = plan.get('shards')
+
+    if shards is None:
+        # an unsharded collection only lives on its primary shard
+        return True
+
+    return plan.get('stage') == 'SINGLE_SHARD' or len(shards) == 1
+
+
+
+def target_shards(explain: Dict[str, Any]) -> List[str]:
+    " shards mongos sent the command to, none for an unsharded collection "
+    plan = explain.get('queryPlanner', {}).get('winningPlan', {})
+    return [ s.get('shardName', '') for s in plan.get('shards', []) ]
+
+
+
+def uses_index(plan: Any) -> bool:
+    " if any stage of the plan, or the plan of any shard, is an index scan "
+    if isinstance(plan, list):
+        return any(uses_index(p) for p in plan)
+
+    if not isinstance(plan, dict):
+        return False
+
+    if plan.get('stage') == 'IXSCAN':
+        return True
+
+    return any(uses_index(v) for v in plan.values())
+
+
+
+def routing(
+    cli: MongoClient,
+    db: str,
+    cmds: List[Dict[str, Any]],
+    sample: int) -> Routing:
+
+    """
+    Explains an even sample of the find commands to see which ones mongos
+    sent to a single shard, and which scanned an index. Inserts always
+    have the shard key, so they are counted as single shard without an
+    explain. The single shard and broadcast ops of every find are
+    estimated from the sample
+    """
+    shards = shard_count(cli)
+    if shards < 2:
+        logger.warning(f'routing over {shards} shard tells keys nothing')
+
+    finds = [ c for c in cmds if 'find' in c ]
+    inserts = sum(1 for c in cmds if 'insert' in c)
+
+    step = max(1, len(finds) // sample)
+    explained = finds[::step][:sample]
+
+    explains = [
+        cli[db].command('explain', c, verbosity='queryPlanner')
+        for c in explained ]
+
+    single = sum(is_single_shard(e) for e in explains)
+    indexed = sum(
+        uses_index(e.get('queryPlanner', {}).get('winningPlan'))
+        for e in explains)
+
+    single_finds = 0
+    if explained:
+        single_finds = round(single / len(explained) * len(finds))
+
+    return Routing(
+        ops = len(finds) + inserts,
+        shards = shards,
+        sampled = len(explained),
+        sampled_single_shard = single,
+        est_single_shard = inserts + single_finds,
+        est_broadcast = len(finds) - single_finds,
+        indexed = indexed)
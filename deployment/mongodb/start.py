@@ -2,10 +2,12 @@
 
 from __future__ import annotations
 from argparse import ArgumentParser
+from contextlib import contextmanager
 from dataclasses import dataclass
 from pathlib import Path
 from typing import (
-    Any, Dict, List, Literal, Optional, TypedDict, Union)
+    Any, Callable, Dict, Iterator, List, Literal, Optional, Tuple,
+    TypedDict, Union)
 
 from pymongo import MongoClient
 from asyncio.subprocess import PIPE
@@ -13,7 +15,9 @@ import asyncio
 
 import logging
 import json
+import shutil
 import sys
+import time
 
 
 LOG_PATH = (Path(__file__).parents[2] 
@@ -21,6 +25,23 @@ LOG_PATH = (Path(__file__).parents[2]
     / 'logs'
     / 'mongodb')
 
+SNAPSHOT_PATH = LOG_PATH / 'snapshots'
+
+PORT_WAIT = 60
+"max seconds for a started daemon to answer on its port"
+
+MAX_VOTERS = 7
+"voting members a replica set can have, the rest are initiated without"
+
+
+TRACE_PREFIX = 'trace: '
+"same prefix as monitor_and_graphs/trace.py, which collects the spans"
+
+SpanSink = Callable[[Dict[str, Any]], None]
+
+span_sink: Optional[SpanSink] = None
+"where finished spans go; printed when run as a script with --trace"
+
 logger = logging.getLogger(__name__)
 
 
@@ -30,12 +51,35 @@ Log = str
 class Mongos:
     port: int
     members: List[str]
+    cpus: Optional[List[str]] = None
+    "taskset cpu list of each member, like 0-3"
 
 @dataclass
 class ReplInfo:
     set_name: str
     port: int
     members: List[str]
+    cpus: Optional[List[str]] = None
+    "taskset cpu list of each member, like 0-3"
+    sets: int = 1
+    """
+    replica sets the members are split into, every sets-th member in the
+    same one; instances on a host each get their own set, and so their
+    own shard
+    """
+
+    def member_set(self, idx: int) -> int:
+        return idx % self.sets
+
+    def set_members(self, set_idx: int) -> List[int]:
+        return list(range(set_idx, len(self.members), self.sets))
+
+    def replica_set(self, set_idx: int) -> str:
+        " the set name stays as it is with a single set "
+        if self.sets <= 1:
+            return self.set_name
+
+        return f'{self.set_name}-{set_idx}'
 
 
 Mongot = Literal['mongos', 'configs', 'shards']
@@ -83,13 +127,84 @@ class Cluster:
 
 
 
+def print_span(span: Dict[str, Any]):
+    print(TRACE_PREFIX + json.dumps(span), flush=True)
+
+
+@contextmanager
+def traced(name: str, **args: Any) -> Iterator[None]:
+    " times the block as a span, for the caller to collect "
+    wall, start = time.time(), time.monotonic()
+    try:
+        yield
+    finally:
+        if span_sink:
+            span_sink({
+                'name': name,
+                'cat': 'mongodb',
+                'ts': wall * 1e6,
+                'dur': (time.monotonic() - start) * 1e6,
+                'args': args })
+
+
+
+async def wait_port(port: int):
+    " the daemon is up once it takes connections on its port "
+    start = time.monotonic()
+    while time.monotonic() - start < PORT_WAIT:
+        try:
+            _, writer = await asyncio.open_connection('localhost', port)
+        except OSError:
+            await asyncio.sleep(0.1)
+            continue
+
+        writer.close()
+        return
+
+    raise TimeoutError(f'nothing on port {port} after {PORT_WAIT}s')
+
+
+
+def member_addr(info: Union[Mongos, ReplInfo], idx: int) -> Tuple[str, int]:
+    """
+    Members can be host:port, so many members can share a host, otherwise
+    the member uses the port of its role
+    """
+    host, _, port = info.members[idx].partition(':')
+    return host, int(port) if port else info.port
+
+
+def pinned(
+    cmd: List[str], info: Union[Mongos, ReplInfo], idx: int) -> List[str]:
+
+    " members that share a host can each be kept to their own cpus "
+    if not info.cpus or idx >= len(info.cpus) or not info.cpus[idx]:
+        return cmd
+
+    return ['taskset', '-c', info.cpus[idx], *cmd]
+
+
+def member_hosts(
+    info: Union[Mongos, ReplInfo],
+    members: Optional[List[int]] = None) -> List[str]:
+
+    if members is None:
+        members = list(range(len(info.members)))
+
+    return [
+        f'{host}:{port}'
+        for host, port in (member_addr(info, i) for i in members) ]
+
+
+
 async def create_replica(
     mem_idx: int,
     config: str,
     info: ReplInfo,
     is_shard: bool):
 
-    db_path = LOG_PATH / "db"
+    host, port = member_addr(info, mem_idx)
+    db_path = member_db_path(info.members[mem_idx])
     log_path = LOG_PATH
 
     db_path.mkdir(parents=True, exist_ok=True)
@@ -102,7 +217,7 @@ async def create_replica(
 
     with open(log, "w"): pass
 
-    binds = ['localhost', info.members[mem_idx]]
+    binds = ['localhost', host]
     binds = ','.join(binds)
 
     mongod_cmd = ['mongod']
@@ -110,41 +225,57 @@ async def create_replica(
     mongod_cmd += ['--dbpath', db]
     mongod_cmd += ['--logpath', log]
     mongod_cmd += ['--shardsvr' if is_shard else '--configsvr']
-    mongod_cmd += ['--replSet', info.set_name]
-    mongod_cmd += ['--port', str(info.port)]
+    replica_set = info.replica_set(info.member_set(mem_idx))
+    mongod_cmd += ['--replSet', replica_set]
+    mongod_cmd += ['--port', str(port)]
     mongod_cmd += ['--bind_ip', binds]
+    mongod_cmd = pinned(mongod_cmd, info, mem_idx)
 
     logger.debug(f"mongod_cmd: {' '.join(mongod_cmd)}")
 
-    await asyncio.create_subprocess_exec(*mongod_cmd, stdout=PIPE)
+    with traced('mongod start', set=replica_set, port=port):
+        await asyncio.create_subprocess_exec(*mongod_cmd, stdout=PIPE)
+        await wait_port(port)
 
 
 
 
-def initiate(info: ReplInfo, configsvr: bool):
+def initiate(info: ReplInfo, configsvr: bool, set_idx: int = 0):
+    " members past the first MAX_VOTERS join without a vote "
+    members = info.set_members(set_idx)
+    replica_set = info.replica_set(set_idx)
+
     # just use first member host by default
-    with MongoClient(info.members[0], info.port) as cli:
+    with MongoClient(*member_addr(info, members[0])) as cli:
         config: Dict[str, Any] = {
-            '_id': info.set_name,
+            '_id': replica_set,
             'members': [
-                {'_id': i, 'host': f'{m}:{info.port}'}
-                for i, m in enumerate(info.members) ]
+                {'_id': i, 'host': m}
+                for i, m in enumerate(member_hosts(info, members)) ]
         }
 
+        for member in config['members'][MAX_VOTERS:]:
+            member.update(votes=0, priority=0)
+
         if configsvr:
             config['configsvr'] = True
 
-        cli['admin'].command("replSetInitiate", config)
+        with traced('replSetInitiate', set=replica_set):
+            cli['admin'].command("replSetInitiate", config)
 
 
 
-async def start_mongos(mongos_idx: int, config: str, cluster: Cluster):
+async def start_mongos(
+    mongos_idx: int, config: str, cluster: Cluster, add_shard: bool = True):
+
+    " a restart on restored data already has the shard, so skips adding it "
     mongos, configs, shards = cluster.as_tuple()
 
-    config_locs = [ f"{c}:{configs.port}" for c in configs.members ]
+    config_locs = member_hosts(configs)
     config_set = f"{configs.set_name}/{','.join(config_locs)}"
 
-    binds = ['localhost', mongos.members[mongos_idx]]
+    host, port = member_addr(mongos, mongos_idx)
+    binds = ['localhost', host]
     binds = ','.join(binds)
 
     log = LOG_PATH / f"mongo_{mongos_idx}.log"
@@ -155,23 +286,31 @@ async def start_mongos(mongos_idx: int, config: str, cluster: Cluster):
     mongos_cmd += ['--config', config]
     mongos_cmd += ['--logpath', str(log)]
     mongos_cmd += ['--configdb', config_set]
-    mongos_cmd += ['--port', str(mongos.port)]
+    mongos_cmd += ['--port', str(port)]
     mongos_cmd += ['--bind_ip', binds]
+    mongos_cmd = pinned(mongos_cmd, mongos, mongos_idx)
 
     logger.debug(f"mongos cmd: {' '.join(mongos_cmd)}")
 
-    await asyncio.create_subprocess_exec(*mongos_cmd, stdout=PIPE)
+    with traced('mongos start', port=port):
+        await asyncio.create_subprocess_exec(*mongos_cmd, stdout=PIPE)
+        await wait_port(port)
+
+    if not add_shard:
+        return
 
     # add shards might run too early, keep eye on
     await asyncio.sleep(2)
 
-    shard_set = [ f"{s}:{shards.port}" for s in shards.members ]
-    shard_set = f"{shards.set_name}/{','.join(shard_set)}"
+    with MongoClient(port=port) as cli:
+        for s in range(shards.sets):
+            hosts = member_hosts(shards, shards.set_members(s))
+            shard_set = f"{shards.replica_set(s)}/{','.join(hosts)}"
 
-    logger.debug(f'adding shards {shard_set}')
+            logger.debug(f'adding shards {shard_set}')
 
-    with MongoClient(port=mongos.port) as cli:
-        cli['admin'].command("addShard", shard_set)
+            with traced('addShard', port=port, set=shards.replica_set(s)):
+                cli['admin'].command("addShard", shard_set)
 
 
 
@@ -198,7 +337,8 @@ async def init_server(
     cluster: Cluster,
     role: Mongot,
     member: Optional[int],
-    config: Optional[str]):
+    config: Optional[str],
+    restart: bool = False):
 
     # print(f"cluster info here: {cluster}")
     LOG_PATH.mkdir(exist_ok=True, parents=True)
@@ -209,15 +349,18 @@ async def init_server(
     logging.info(config)
 
     if role == 'mongos' and config and member is not None:
-        await start_mongos(member, config, cluster)
+        await start_mongos(member, config, cluster, not restart)
 
     elif role == 'mongos':
         raise ValueError('mongos missing some args')
 
+    elif member is None and restart:
+        raise ValueError('restarted replica sets are already initiated')
+
     elif member is None:
-        initiate(
-            cluster.as_dict()[role],
-            role == 'configs')
+        info = cluster.as_dict()[role]
+        for s in range(info.sets):
+            initiate(info, role == 'configs', s)
 
     elif config:
         await create_replica(
@@ -231,9 +374,60 @@ async def init_server(
 
 
 
-def mongodb_stop_server(cluster: Cluster, role: Mongot):
-    port = cluster.as_dict()[role].port
-    with MongoClient(port=port) as cli:
+def member_db_path(member: Optional[str] = None):
+    " members that share a host need their own db, by their port "
+    if member and ':' in member:
+        return LOG_PATH / f"db-{member.partition(':')[2]}"
+
+    return LOG_PATH / "db"
+
+
+
+def member_snapshot(
+    cluster: Cluster, role: Mongot, member: int, name: str) -> Path:
+
+    """
+    Snapshots are kept by role and port, so a config and a shard, or many
+    shard members, on one host do not overwrite each other
+    """
+    port = member_addr(cluster.as_dict()[role], member)[1]
+    return SNAPSHOT_PATH / name / f'{role}-{port}'
+
+
+def snapshot_db(cluster: Cluster, role: Mongot, member: int, name: str):
+    " copies the db files, the mongod should be stopped first "
+    db_path = member_db_path(cluster.as_dict()[role].members[member])
+    snapshot = member_snapshot(cluster, role, member, name)
+
+    if snapshot.exists():
+        shutil.rmtree(snapshot)
+
+    logger.info(f'snapshot {db_path} to {snapshot}')
+    with traced('snapshot', name=name, role=role, member=member):
+        shutil.copytree(db_path, snapshot)
+
+
+def restore_db(cluster: Cluster, role: Mongot, member: int, name: str):
+    snapshot = member_snapshot(cluster, role, member, name)
+    if not snapshot.exists():
+        raise FileNotFoundError(f'no snapshot {snapshot}')
+
+    db_path = member_db_path(cluster.as_dict()[role].members[member])
+    shutil.rmtree(db_path, ignore_errors=True)
+
+    logger.info(f'restore {snapshot} to {db_path}')
+    with traced('restore', name=name, role=role, member=member):
+        shutil.copytree(snapshot, db_path)
+
+
+
+def mongodb_stop_server(
+    cluster: Cluster, role: Mongot, member: Optional[int] = None):
+
+    info = cluster.as_dict()[role]
+    port = info.port if member is None else member_addr(info, member)[1]
+
+    with MongoClient(port=port) as cli, traced('shutdown', port=port):
         try:
             # shutdown will throw error
             cli['admin'].command('shutdown')
@@ -244,13 +438,26 @@ def mongodb_stop_server(cluster: Cluster, role: Mongot):
 
 
 async def main(
-    cluster: str, shutdown: bool, role: Mongot, **init_args: Any):
+    cluster: str,
+    shutdown: bool,
+    role: Mongot,
+    snapshot: Optional[str],
+    restore: Optional[str],
+    **init_args: Any):
 
     cluster_info = Cluster.from_json(cluster)
     logger.info(shutdown)
 
+    member = init_args.get('member')
+
     if shutdown:
-        mongodb_stop_server(cluster_info, role)
+        mongodb_stop_server(cluster_info, role, member)
+    elif (snapshot or restore) and member is None:
+        raise ValueError('snapshots are taken of one member, pass -m')
+    elif snapshot:
+        snapshot_db(cluster_info, role, member, snapshot)
+    elif restore:
+        restore_db(cluster_info, role, member, restore)
     else:
         await init_server(cluster_info, role, **init_args)
 
@@ -277,13 +484,34 @@ if __name__ == "__main__":
         required = True,
         help = 'the cluster role being modified')
 
+    args.add_argument('--restart',
+        action = 'store_true',
+        help = 'start on already initiated data, like a restored snapshot; '
+               'mongos does not add the shard again')
+
     args.add_argument('-s', '--shutdown',
         action = 'store_true',
         help = 'run shutdown instead of init')
 
+    args.add_argument('--snapshot',
+        help = 'copy the stopped db files of the member to a snapshot of '
+               'this name')
+
+    args.add_argument('--restore',
+        help = 'replace the stopped db files of the member with the named '
+               'snapshot')
+
+    args.add_argument('--trace',
+        action = 'store_true',
+        help = 'print the timed spans, for the caller to collect')
+
     logging.basicConfig(filename="test_mongo.log", filemode="w",level=logging.DEBUG)
     logger.setLevel(level=logging.DEBUG)
 
     logger.debug(f'call: {sys.argv}')
-    args = args.parse_args()
-    asyncio.run(main(**vars(args)))
+
+    opts = vars(args.parse_args())
+    if opts.pop('trace'):
+        span_sink = print_span
+
+    asyncio.run(main(**opts))
@@ -4,17 +4,44 @@ from asyncio.subprocess import PIPE
 import asyncio
 import json
 import logging
+import shutil
+import socket
 
 from argparse import ArgumentParser
 from os import write
 from pathlib import Path
 
+from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import Any, Callable, Dict, List, Set, Optional, Union
+from time import monotonic, time
+from typing import (
+    Any, Callable, Dict, Iterator, List, Set, Optional, Tuple, Union)
 
 from redis import Redis
+from redis.exceptions import RedisError, ResponseError
 
 
+SNAPSHOT_PATH = (Path(__file__).parents[2]
+    / 'monitor_and_graphs'
+    / 'logs'
+    / 'redis'
+    / 'snapshots')
+
+CLUSTER_SLOTS = 16384
+CLUSTER_WAIT = 60
+"max seconds for the nodes to come up, and then to converge"
+
+REPLICA_OFFSET = 1000
+"replicas run on the data hosts next to the masters, at a higher port"
+
+TRACE_PREFIX = 'trace: '
+"same prefix as monitor_and_graphs/trace.py, which collects the spans"
+
+SpanSink = Callable[[Dict[str, Any]], None]
+
+span_sink: Optional[SpanSink] = None
+"where finished spans go; printed when run as a script with --trace"
+
 
 @dataclass
 class Addresses:
@@ -110,6 +137,27 @@ def parse_conf(
 
 
 
+def print_span(span: Dict[str, Any]):
+    print(TRACE_PREFIX + json.dumps(span), flush=True)
+
+
+@contextmanager
+def traced(name: str, **args: Any) -> Iterator[None]:
+    " times the block as a span, for the caller to collect "
+    wall, start = time(), monotonic()
+    try:
+        yield
+    finally:
+        if span_sink:
+            span_sink({
+                'name': name,
+                'cat': 'redis',
+                'ts': wall * 1e6,
+                'dur': (monotonic() - start) * 1e6,
+                'args': args })
+
+
+
 def touch_log(log: Union[Path, str]):
     log = Path(log)
     log.parent.mkdir(exist_ok=True, parents=True)
@@ -119,10 +167,17 @@ def touch_log(log: Union[Path, str]):
 
 
 
+def node_addr(member: str, port: int) -> Tuple[str, int]:
+    " addresses can be host:port, for many nodes on one host "
+    host, _, member_port = member.partition(':')
+    return host, int(member_port) if member_port else port
+
+
+
 async def create_cluster(conf: str, ips: str):
     port = int(parse_conf(conf, 'port')['port'])
     addrs = Addresses.from_json(ips)
-    nodes = [f'{ip}:{port}' for ip in addrs]
+    nodes = [ '%s:%d' % node_addr(ip, port) for ip in addrs ]
 
     logging.info(nodes)
 
@@ -133,10 +188,11 @@ async def create_cluster(conf: str, ips: str):
 
     logging.info(redis_cli)
 
-    proc = await asyncio.create_subprocess_exec(
-        *redis_cli, stdin=PIPE, stdout=PIPE, stderr=PIPE)
+    with traced('cluster create', nodes=len(nodes)):
+        proc = await asyncio.create_subprocess_exec(
+            *redis_cli, stdin=PIPE, stdout=PIPE, stderr=PIPE)
 
-    out, error = await proc.communicate("yes\n".encode("utf-8"))
+        out, error = await proc.communicate("yes\n".encode("utf-8"))
 
     logging.info(out)
     logging.info(error)
@@ -145,10 +201,265 @@ async def create_cluster(conf: str, ips: str):
     #     cli.cluster('create', *nodes)        
 
 
+
+Node = Tuple[str, int]
+
+def replica_layout(
+    addrs: Addresses, port: int, replicas: int) -> List[Tuple[Node, Node]]:
+
+    """
+    Pairs of every master with each of its replicas. Replicas are dealt out
+    over the data hosts, skipping the host of their own master when there
+    is another one, and a host with more than one replica runs them on
+    consecutive ports
+    """
+    pairs: List[Tuple[Node, Node]] = []
+    hosts = [ node_addr(d, port)[0] for d in addrs.data ]
+    next_port = { host: port + REPLICA_OFFSET for host in hosts }
+    dealt = 0
+
+    for member in addrs:
+        master = node_addr(member, port)
+        others = [ h for h in hosts if h != master[0] ] or hosts
+
+        for _ in range(replicas):
+            host = others[dealt % len(others)]
+            dealt += 1
+
+            pairs.append((master, (host, next_port[host])))
+            next_port[host] += 1
+
+    return pairs
+
+
+def replica_ports(
+    addrs: Addresses, port: int, replicas: int, host: str) -> List[int]:
+
+    return [
+        r_port for _, (r_host, r_port) in replica_layout(addrs, port, replicas)
+        if r_host == host ]
+
+
+
+def slot_ranges(masters: int) -> List[Tuple[int, int]]:
+    " contiguous, inclusive slot ranges that split up all the slots "
+    bounds = [ i * CLUSTER_SLOTS // masters for i in range(masters + 1) ]
+    return [ (bounds[i], bounds[i + 1] - 1) for i in range(masters) ]
+
+
+
+def cluster_info(node: Node) -> Dict[str, str]:
+    host, port = node
+    with Redis(host, port) as cli:
+        info: Any = cli.execute_command('CLUSTER', 'INFO')
+
+    if isinstance(info, dict):
+        return { k: str(v) for k, v in info.items() }
+
+    if isinstance(info, bytes):
+        info = info.decode()
+
+    pairs = [ l.split(':', 1) for l in str(info).splitlines() if ':' in l ]
+    return { k.strip(): v.strip() for k, v in pairs }
+
+
+
+def add_slots(node: Node, start: int, end: int):
+    host, port = node
+    with Redis(host, port) as cli:
+        try:
+            cli.execute_command('CLUSTER', 'ADDSLOTSRANGE', start, end)
+        except ResponseError:
+            # ADDSLOTSRANGE is only in redis 7+
+            cli.execute_command('CLUSTER', 'ADDSLOTS', *range(start, end + 1))
+
+
+
+def is_converged(infos: List[Dict[str, str]]) -> bool:
+    " every node is ok, knows every other node, and agrees on the epoch "
+    epochs = { i.get('cluster_current_epoch') for i in infos }
+
+    return (len(epochs) == 1
+        and all(i.get('cluster_state') == 'ok' for i in infos)
+        and all(
+            int(i.get('cluster_known_nodes', 0)) == len(infos)
+            for i in infos))
+
+
+
+async def wait_for(check: Callable[[], bool], what: str):
+    start = monotonic()
+    while monotonic() - start < CLUSTER_WAIT:
+        try:
+            if check():
+                return
+        except RedisError:
+            pass
+
+        await asyncio.sleep(0.1)
+
+    raise TimeoutError(f'{what} not done after {CLUSTER_WAIT}s')
+
+
+
+def port_open(port: int) -> bool:
+    " a server loading its data already takes connections "
+    try:
+        with socket.create_connection(('localhost', port), timeout=1):
+            return True
+    except OSError:
+        return False
+
+
+
+def all_up(nodes: List[Node]):
+    for host, port in nodes:
+        with Redis(host, port) as cli:
+            cli.ping()
+
+    return True
+
+
+def meet(seed: Node, nodes: List[Node]):
+    with Redis(*seed) as cli:
+        for host, port in nodes:
+            cli.execute_command('CLUSTER', 'MEET', host, port)
+
+
+def replicate(replica: Node, master_id: str):
+    " fails until the replica has heard of the master "
+    with Redis(*replica) as cli:
+        cli.execute_command('CLUSTER', 'REPLICATE', master_id)
+
+    return True
+
+
+def node_id(node: Node) -> str:
+    with Redis(*node) as cli:
+        myid: Any = cli.execute_command('CLUSTER', 'MYID')
+
+    return myid.decode() if isinstance(myid, bytes) else str(myid)
+
+
+
+async def attach_replicas(
+    seed: Node, masters: List[Node], pairs: List[Tuple[Node, Node]]):
+
+    replicas = [ r for _, r in pairs ]
+
+    await wait_for(lambda: all_up(replicas), 'replica startup')
+    meet(seed, replicas)
+
+    ids = { m: node_id(m) for m in masters }
+
+    for master, replica in pairs:
+        await wait_for(
+            lambda: replicate(replica, ids[master]),
+            f'replica {replica} of {master}')
+
+
+
+async def bootstrap_cluster(
+    conf: str, ips: str, replicas: int = 0) -> float:
+
+    """
+    Builds the cluster without redis-cli: the first node meets every other
+    one, each node adds its own slot range at the same time, and then the
+    cluster info of every node is polled until they all agree. Replicas
+    join after the masters. Returns how long it took to converge
+    """
+    port = int(parse_conf(conf, 'port')['port'])
+    addrs = Addresses.from_json(ips)
+
+    masters = [ node_addr(ip, port) for ip in addrs ]
+    pairs = replica_layout(addrs, port, replicas)
+    nodes = masters + [ r for _, r in pairs ]
+    seed = masters[0]
+
+    loop = asyncio.get_running_loop()
+    start = monotonic()
+
+    with traced('node startup', nodes=len(masters)):
+        await wait_for(lambda: all_up(masters), 'node startup')
+
+    with traced('meet'):
+        meet(seed, masters[1:])
+
+    with traced('add slots'):
+        await asyncio.gather(*[
+            loop.run_in_executor(None, add_slots, node, *slots)
+            for node, slots in zip(masters, slot_ranges(len(masters))) ])
+
+    if pairs:
+        with traced('attach replicas', replicas=len(pairs)):
+            await attach_replicas(seed, masters, pairs)
+
+    def converged():
+        return is_converged([ cluster_info(n) for n in nodes ])
+
+    with traced('cluster convergence'):
+        await wait_for(converged, 'cluster convergence')
+
+    took = monotonic() - start
+    print(f'cluster of {len(masters)} masters and {len(pairs)} replicas '
+          f'converged in {took:.2f}s')
+
+    return took
+
+
+
+def port_log(log: str, port: int) -> str:
+    path = Path(log)
+    return str(path.with_name(f'{path.stem}-{port}{path.suffix}'))
+
+
+def pinned(cmd: List[str], cpus: Optional[str]) -> List[str]:
+    " keeps the server to a cpu list, like 0-3 "
+    return ['taskset', '-c', cpus, *cmd] if cpus else cmd
+
+
+
+async def start_servers(
+    conf: str,
+    log: str,
+    ports: List[int],
+    data: Optional[str] = None,
+    cpus: Optional[List[str]] = None):
+
+    """
+    The servers share a host, so every file they write is per port; the
+    files go in the data folder, if given, instead of the working folder.
+    Each server can have its own cpus, in the same order as the ports
+    """
+    for i, port in enumerate(ports):
+        redis_server = ['redis-server', conf]
+        redis_server += ['--port', str(port)]
+        redis_server += ['--cluster-config-file', f'nodes-{port}.conf']
+        redis_server += ['--dbfilename', f'dump-{port}.rdb']
+        redis_server += ['--logfile', port_log(log, port)]
+
+        if data:
+            redis_server += ['--dir', data]
+
+        if cpus and i < len(cpus):
+            redis_server = pinned(redis_server, cpus[i])
+
+        print(f'cmd: {redis_server}')
+
+        touch_log(port_log(log, port))
+        with traced('redis-server start', port=port):
+            await asyncio.create_subprocess_exec(*redis_server)
+            await wait_for(lambda: port_open(port), f'redis on {port}')
+
+
 async def init_server(
     conf: str, *,
     log: Optional[str] = None,
-    ips: Optional[str] = None):
+    ips: Optional[str] = None,
+    native: bool = False,
+    replicas: int = 0,
+    ports: Optional[List[int]] = None,
+    cpus: Optional[List[str]] = None):
 
     if log and ips:
         raise ValueError('only one of ips and log should be specified')
@@ -156,32 +467,105 @@ async def init_server(
     elif not (log or ips):
         raise ValueError('log and ips are both not specified')
 
+    elif log and ports:
+        await start_servers(conf, log, ports, cpus=cpus)
+
     elif log:
         redis_server = ['redis-server', conf, '--logfile', log]
+        redis_server = pinned(redis_server, cpus[0] if cpus else None)
         print(f'cmd: {redis_server}')
 
+        port = int(parse_conf(conf, 'port')['port'])
+
         touch_log(log)
-        await asyncio.create_subprocess_exec(*redis_server)
+        with traced('redis-server start', port=port):
+            await asyncio.create_subprocess_exec(*redis_server)
+            await wait_for(lambda: port_open(port), f'redis on {port}')
     
+    elif ips and (native or replicas):
+        # redis-cli picks its own masters, so replicas need the native path
+        await bootstrap_cluster(conf, ips, replicas)
+
     elif ips:
         await create_cluster(conf, ips)
 
 
 
-async def end_server(conf: str):
-    port = parse_conf(conf, 'port')['port']
-    port = int(port)
+async def end_server(conf: str, ports: Optional[List[int]] = None):
+    if not ports:
+        ports = [ int(parse_conf(conf, 'port')['port']) ]
+
+    for port in ports:
+        with Redis(port=port) as cli, traced('shutdown', port=port):
+            # replicas are read only, and their data goes with the master
+            if cli.info('replication').get('role') == 'master':
+                cli.flushall()
+
+            cli.cluster('reset')
+            cli.shutdown()
+
+
+
+def dump_file(cli: Redis) -> Path:
+    rdb_dir = cli.config_get('dir')['dir']
+    rdb_file = cli.config_get('dbfilename')['dbfilename']
+
+    return Path(rdb_dir) / rdb_file
+
+
+
+async def snapshot_server(conf: str, name: str):
+    port = int(parse_conf(conf, 'port')['port'])
+    snapshot = SNAPSHOT_PATH / f'{name}-{port}.rdb'
+    snapshot.parent.mkdir(exist_ok=True, parents=True)
+
+    with Redis(port=port) as cli, traced('snapshot', name=name):
+        cli.save()
+        shutil.copy(dump_file(cli), snapshot)
+
+    logging.info(f'saved snapshot {snapshot}')
+
+
+
+async def restore_server(conf: str, name: str, log: str):
+    " the cluster config is kept, so the node rejoins with the same slots "
+    port = int(parse_conf(conf, 'port')['port'])
+    snapshot = SNAPSHOT_PATH / f'{name}-{port}.rdb'
+
+    if not snapshot.exists():
+        raise FileNotFoundError(f'no snapshot {snapshot}')
 
     with Redis(port=port) as cli:
-        cli.flushall()
-        cli.cluster('reset')
-        cli.shutdown()
+        rdb = dump_file(cli)
+        cli.shutdown(nosave=True)
 
+    with traced('restore', name=name):
+        shutil.copy(snapshot, rdb)
+    logging.info(f'restored snapshot {snapshot}')
 
+    await init_server(conf, log=log)
+
+
+
+async def mod_server(
+    conf: str,
+    shutdown: bool,
+    snapshot: Optional[str],
+    restore: Optional[str],
+    **init_args: Any):
 
-async def mod_server(conf: str, shutdown: bool, **init_args: Any):
     if shutdown:
-        await end_server(conf)
+        await end_server(conf, init_args.get('ports'))
+
+    elif snapshot:
+        await snapshot_server(conf, snapshot)
+
+    elif restore and init_args.get('log'):
+        await restore_server(conf, restore, init_args['log'])
+
+    elif restore:
+        raise ValueError('restore needs a log file to restart with')
+
     else:
         await init_server(conf, **init_args)
 
@@ -189,6 +573,10 @@ async def mod_server(conf: str, shutdown: bool, **init_args: Any):
 if __name__ == "__main__":
     args = ArgumentParser(description = 'start the redis programs')
 
+    args.add_argument('-a', '--cpus',
+        nargs = '+',
+        help = 'taskset cpu list for each started server, like 0-3')
+
     args.add_argument('-c', '--conf', 
         required = True,
         help = 'the redis configuration file')
@@ -203,10 +591,35 @@ if __name__ == "__main__":
     args.add_argument('-l', '--log',
         help = 'log file location')
 
+    args.add_argument('-n', '--native',
+        action = 'store_true',
+        help = 'build the cluster with cluster commands instead of redis-cli')
+
+    args.add_argument('-p', '--ports',
+        nargs = '+',
+        type = int,
+        help = 'start or shutdown servers on these ports, like replicas '
+               'or many masters on one host')
+
+    args.add_argument('-r', '--replicas',
+        default = 0,
+        type = int,
+        help = 'replicas for each master, placed on the data hosts')
+
     args.add_argument('-s', '--shutdown',
         action = 'store_true',
         help = 'run shutdown instead of init')
 
+    args.add_argument('--snapshot',
+        help = 'save the data to a snapshot of this name')
+
+    args.add_argument('--restore',
+        help = 'restart the server with the data of the named snapshot')
+
+    args.add_argument('--trace',
+        action = 'store_true',
+        help = 'print the timed spans, for the caller to collect')
+
     # args.add_argument('-m', '--master',
     #     help = 'location of the master node')
 
@@ -216,5 +629,8 @@ if __name__ == "__main__":
     
     logging.basicConfig(filename="testing.txt", filemode="w")
 
-    args = args.parse_args()
-    asyncio.run(mod_server(**vars(args)))
\ No newline at end of file
+    opts = vars(args.parse_args())
+    if opts.pop('trace'):
+        span_sink = print_span
+
+    asyncio.run(mod_server(**opts))
\ No newline at end of file
@@ -0,0 +1,203 @@
+from typing import (
+    Any, Callable, Dict, Iterable, List, Optional, Tuple, Union)
+
+from pathlib import Path
+
+import asyncio as aio
+import json
+import logging
+
+from pymongo import MongoClient
+from redis import Redis
+
+
+Node = Tuple[str, int]
+ParamSet = Callable[[Any], Dict[str, Any]]
+
+logger = logging.getLogger(__name__)
+
+
+REDIS_RUNTIME = {
+    'maxmemory',
+    'maxmemory-policy',
+    'maxmemory-samples',
+    'save',
+    'repl-diskless-sync',
+    'repl-diskless-sync-delay',
+    'appendonly',
+    'appendfsync',
+    'hz',
+    'loglevel',
+    'timeout',
+    'tcp-keepalive',
+    'slowlog-log-slower-than',
+    'lazyfree-lazy-eviction',
+    'activedefrag',
+}
+"redis params that CONFIG SET can change, everything else needs a restart"
+
+
+MONGO_RUNTIME: Dict[str, ParamSet] = {
+    'storage.wiredTiger.engineConfig.cacheSizeGB':
+        lambda gb: {
+            'wiredTigerEngineRuntimeConfig': f'cache_size={float(gb)}G' },
+
+    'systemLog.verbosity':
+        lambda level: { 'logLevel': int(level) },
+}
+"mongod config options that map to a setParameter, besides setParameter.*"
+
+MONGO_SET_PARAMETER = 'setParameter.'
+
+BENCH_PREFIX = 'bench.'
+"point params that are benchmark options instead of database configs"
+
+
+
+def is_bench(param: str) -> bool:
+    return param.startswith(BENCH_PREFIX)
+
+
+def split_bench(
+    point: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+
+    " the config params, and the bench options without their prefix "
+    configs = { p: v for p, v in point.items() if not is_bench(p) }
+    bench = {
+        p[len(BENCH_PREFIX):]: v
+        for p, v in point.items() if is_bench(p) }
+
+    return configs, bench
+
+
+
+def is_runtime(database: str, param: str) -> bool:
+    if is_bench(param):
+        # the cluster is not touched at all
+        return True
+
+    elif database == 'redis':
+        return param in REDIS_RUNTIME
+
+    elif database == 'mongodb':
+        return (param in MONGO_RUNTIME
+            or param.startswith(MONGO_SET_PARAMETER))
+
+    else:
+        return False
+
+
+
+def redis_base(conf: Union[str, Path], param: str) -> Optional[str]:
+    " the value of the param in the unmodified config, if there is one "
+    value = None
+    with open(conf) as f:
+        for line in f:
+            words = line.split(maxsplit=1)
+            if len(words) == 2 and words[0] == param:
+                value = words[1].strip()
+
+    return value
+
+
+def mongo_base(conf: Union[str, Path], param: str) -> Optional[Any]:
+    with open(conf) as f:
+        value: Any = json.load(f)
+
+    for attr in param.split('.'):
+        if not isinstance(value, dict) or attr not in value:
+            return None
+
+        value = value[attr]
+
+    return value
+
+
+
+def runtime_changes(
+    database: str,
+    old: Dict[str, Any],
+    new: Dict[str, Any],
+    base: Callable[[str], Optional[Any]]) -> Optional[Dict[str, Any]]:
+
+    """
+    The param values to set so a cluster running with the old params has
+    the new ones, or None if any of the changes needs a restart. Params
+    left out of the new point go back to their base config value
+    """
+    changes: Dict[str, Any] = {}
+
+    for param in set(old) | set(new):
+        if param in new and old.get(param) == new[param]:
+            continue
+
+        if is_bench(param):
+            continue
+
+        if not is_runtime(database, param):
+            return None
+
+        if param in new:
+            changes[param] = new[param]
+            continue
+
+        value = base(param)
+        if value is None:
+            # no way to get back to the built in default
+            return None
+
+        changes[param] = value
+
+    return changes
+
+
+
+def restart_key(database: str, point: Dict[str, Any]) -> str:
+    return json.dumps(
+        { p: v for p, v in point.items() if not is_runtime(database, p) },
+        sort_keys = True)
+
+
+def order_for_restarts(
+    database: str, points: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+
+    " groups points that only differ by runtime params next to each other "
+    return sorted(points, key=lambda p: restart_key(database, p))
+
+
+
+def redis_config_set(node: Node, params: Dict[str, Any]):
+    host, port = node
+    with Redis(host, port) as cli:
+        for param, value in params.items():
+            cli.config_set(param, value)
+
+
+def mongo_set_parameter(node: Node, params: Dict[str, Any]):
+    command: Dict[str, Any] = {}
+
+    for param, value in params.items():
+        if param.startswith(MONGO_SET_PARAMETER):
+            command[param[len(MONGO_SET_PARAMETER):]] = value
+        else:
+            command.update(MONGO_RUNTIME[param](value))
+
+    host, port = node
+    with MongoClient(host, port, directConnection=True) as cli:
+        cli['admin'].command({ 'setParameter': 1, **command })
+
+
+
+async def apply_runtime(
+    database: str, nodes: List[Node], params: Dict[str, Any]):
+
+    " sets the params on every node in parallel "
+    setter = redis_config_set if database == 'redis' else mongo_set_parameter
+    loop = aio.get_running_loop()
+
+    logger.info(f'setting {params} on {len(nodes)} nodes')
+
+    await aio.gather(*[
+        loop.run_in_executor(None, setter, node, params)
+        for node in nodes ])
+
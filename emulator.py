@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+
+from dataclasses import asdict
+from typing import Callable, List
+from time import monotonic
+
+import asyncio as aio
+
+import argparse
+import json
+import logging
+
+from pymongo import MongoClient
+from pymongo.errors import OperationFailure, PyMongoError
+from redis import Redis
+
+from database import (
+    CLUSTER_LOC, DEPLOYMENT, LOGS, REDIS_CONF, REDIS_REPLICA_CONF,
+    Addresses, Database)
+
+from deployment.redis.start import (
+    bootstrap_cluster, end_server, parse_conf, replica_layout,
+    start_servers)
+
+from deployment.mongodb.start import (
+    Cluster, Mongot, ReplInfo,
+    create_replica, initiate, member_addr, mongodb_stop_server,
+    start_mongos)
+
+
+LOCAL = 'localhost'
+LOCAL_CLUSTER = DEPLOYMENT / 'mongodb/cluster-local.json'
+LOCAL_ADDRESSES = DEPLOYMENT / 'ip-addresses-local.json'
+MONGO_CONFS = DEPLOYMENT / 'mongodb/confs'
+
+PORT_STRIDE = 100
+"mongo members of a role are this far apart, so the roles never overlap"
+
+READY_WAIT = 60
+"max seconds for the local daemons to come up"
+
+ALREADY_INITIALIZED = 23
+
+logger = logging.getLogger(__name__)
+
+
+
+def local_members(port: int, count: int, stride: int = 1) -> List[str]:
+    return [ f'{LOCAL}:{port + i * stride}' for i in range(count) ]
+
+
+def local_cluster(mongos: int, configs: int, shards: int) -> Cluster:
+    """
+    The cluster file, with every member on localhost at its own port;
+    the role ports are kept from the remote cluster file
+    """
+    cluster = Cluster.from_json(CLUSTER_LOC)
+
+    cluster.mongos.members = local_members(
+        cluster.mongos.port, mongos, PORT_STRIDE)
+    cluster.configs.members = local_members(
+        cluster.configs.port, configs, PORT_STRIDE)
+    cluster.shards.members = local_members(
+        cluster.shards.port, shards, PORT_STRIDE)
+    # the local shards are members of one set, not instances
+    cluster.shards.sets = 1
+
+    with open(LOCAL_CLUSTER, 'w') as f:
+        json.dump(asdict(cluster), f, indent=4)
+
+    return cluster
+
+
+def local_addresses(masters: int, port: int) -> Addresses:
+    " the masters are split over main, data, and misc, which are all needed "
+    if masters < 3:
+        raise ValueError('a redis cluster needs at least 3 masters')
+
+    members = local_members(port, masters)
+    ips = Addresses(
+        main = members[:1],
+        data = members[1:-1],
+        misc = members[-1:])
+
+    ips.to_json(LOCAL_ADDRESSES)
+    return ips
+
+
+
+async def wait_ready(check: Callable[[], bool], what: str):
+    start = monotonic()
+
+    while monotonic() - start < READY_WAIT:
+        try:
+            if check():
+                return
+        except PyMongoError:
+            pass
+
+        await aio.sleep(0.5)
+
+    raise TimeoutError(f'{what} not ready after {READY_WAIT}s')
+
+
+def member_up(info: ReplInfo, idx: int) -> bool:
+    with MongoClient(
+        *member_addr(info, idx),
+        directConnection = True,
+        serverSelectionTimeoutMS = 500) as cli:
+
+        cli['admin'].command('ping')
+        return True
+
+
+def has_primary(info: ReplInfo) -> bool:
+    for i in range(len(info.members)):
+        with MongoClient(
+            *member_addr(info, i),
+            directConnection = True,
+            serverSelectionTimeoutMS = 500) as cli:
+
+            if cli['admin'].command('ismaster').get('ismaster'):
+                return True
+
+    return False
+
+
+
+async def start_set(info: ReplInfo, is_shard: bool):
+    config = MONGO_CONFS / ('shard.conf' if is_shard else 'config.conf')
+
+    for i in range(len(info.members)):
+        await create_replica(i, str(config), info, is_shard)
+
+    for i in range(len(info.members)):
+        await wait_ready(
+            lambda: member_up(info, i), f'{info.set_name} member {i}')
+
+    try:
+        initiate(info, not is_shard)
+
+    except OperationFailure as e:
+        # a restart keeps the db folders, along with the replica set config
+        if e.code != ALREADY_INITIALIZED:
+            raise
+
+    await wait_ready(lambda: has_primary(info), f'{info.set_name} primary')
+
+
+
+async def mongo_local(mongos: int, configs: int, shards: int):
+    cluster = local_cluster(mongos, configs, shards)
+
+    await start_set(cluster.configs, is_shard=False)
+    await start_set(cluster.shards, is_shard=True)
+
+    mongos_conf = MONGO_CONFS / 'mongos.conf'
+    for i in range(len(cluster.mongos.members)):
+        await start_mongos(i, str(mongos_conf), cluster)
+
+    print(f'mongo cluster is up, benchmark with -c {LOCAL_CLUSTER}')
+
+
+def mongo_local_stop():
+    cluster = Cluster.from_json(LOCAL_CLUSTER)
+    roles: List[Mongot] = ['mongos', 'shards', 'configs']
+
+    for role in roles:
+        for i in range(len(cluster.as_dict()[role].members)):
+            mongodb_stop_server(cluster, role, i)
+
+
+
+def redis_port() -> int:
+    return int(parse_conf(REDIS_CONF, 'port')['port'])
+
+
+def member_port(member: str) -> int:
+    return int(member.partition(':')[2])
+
+
+
+async def redis_local(masters: int, replicas: int):
+    """
+    Runs every master and replica as a server on localhost, each with its
+    own port, then builds the cluster natively, the same as remote hosts
+    """
+    port = redis_port()
+    ips = local_addresses(masters, port)
+
+    log = LOGS / 'redis' / 'local.log'
+    data = LOGS / 'redis' / 'local'
+    data.mkdir(parents=True, exist_ok=True)
+
+    master_ports = [ member_port(ip) for ip in ips ]
+    replica_ports = [
+        r_port for _, (_, r_port) in replica_layout(ips, port, replicas) ]
+
+    await start_servers(str(REDIS_CONF), str(log), master_ports, str(data))
+
+    if replica_ports:
+        await start_servers(
+            str(REDIS_REPLICA_CONF), str(log), replica_ports, str(data))
+
+    await bootstrap_cluster(str(REDIS_CONF), str(LOCAL_ADDRESSES), replicas)
+
+
+async def redis_local_stop():
+    " every node the cluster knows of, replicas first so none get promoted "
+    ips = Addresses.from_json(LOCAL_ADDRESSES)
+    seed = member_port(next(iter(ips)))
+
+    with Redis(port=seed) as cli:
+        nodes = cli.cluster('nodes')
+
+    replicas = [
+        member_port(addr.partition('@')[0])
+        for addr, node in nodes.items()
+        if 'slave' in node['flags'] ]
+
+    masters = [ member_port(ip) for ip in ips ]
+
+    await end_server(str(REDIS_CONF), replicas + masters)
+
+
+
+async def main(
+    database: Database,
+    shutdown: bool,
+    mongos: int,
+    configs: int,
+    shards: int,
+    masters: int,
+    replicas: int):
+
+    if database == 'mongodb' and shutdown:
+        mongo_local_stop()
+
+    elif database == 'mongodb':
+        await mongo_local(mongos, configs, shards)
+
+    elif shutdown:
+        await redis_local_stop()
+
+    else:
+        await redis_local(masters, replicas)
+
+
+
+if __name__ == "__main__":
+    logging.getLogger('asyncio').setLevel(logging.WARNING)
+    logging.basicConfig(level=logging.INFO)
+
+    parse = argparse.ArgumentParser(
+        description = 'runs a whole database cluster on this host, with '
+                      'every member at its own port')
+
+    parse.add_argument('-c', '--configs',
+        type = int,
+        default = 1,
+        help = 'amount of mongo config members')
+
+    parse.add_argument('-d', '--database',
+        required = True,
+        choices = ['mongodb','redis'],
+        help = 'datbase system that is being emulated')
+
+    parse.add_argument('-m', '--masters',
+        type = int,
+        default = 3,
+        help = 'amount of redis masters, at least 3')
+
+    parse.add_argument('-o', '--mongos',
+        type = int,
+        default = 1,
+        help = 'amount of mongos routers')
+
+    parse.add_argument('-r', '--replicas',
+        type = int,
+        default = 0,
+        help = 'amount of redis replicas for each master')
+
+    parse.add_argument('-s', '--shutdown',
+        action = 'store_true',
+        help = 'stop the local cluster instead of starting it')
+
+    parse.add_argument('-t', '--shards',
+        type = int,
+        default = 2,
+        help = 'amount of mongo shard members')
+
+    args = parse.parse_args()
+    aio.run(main(**vars(args)))
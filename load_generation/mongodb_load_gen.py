@@ -1,14 +1,25 @@
 #!/usr/bin/env python3
 
-from typing import Any, Dict, List, Literal, Set
+from argparse import ArgumentParser
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Literal, Optional, Set, Tuple
 
 import json
 import os
 import random
 import string
 
+if __package__:
+    from load_generation.payload import Payload, add_payload_args
+else:
+    # run as ./load_generation/mongodb_load_gen.py, next to payload
+    from payload import Payload, add_payload_args
 
-Operation = Literal['write', 'read', 'meta']
+
+Operation = Literal[
+    'write', 'read', 'meta', 'point', 'range', 'aggregate', 'transaction']
+TxnScope = Literal['single', 'cross']
+Pipeline = Literal['match', 'group', 'sort', 'lookup', 'sample']
 Command = Dict[str, Any]
 
 
@@ -18,19 +29,54 @@ LOADS = f"{os.path.dirname(os.path.abspath(__file__))}/load-output/mongodb"
 STRING_LEN = 50
 LETTERS = string.ascii_lowercase
 KEY = "key"
+GROUP = "group"
+GROUPS = 16
+
+PAYLOAD_OPS = ['write', 'transaction', 'point']
+"ops whose files change with the payload profile, points go with writes"
+
+PIPELINES: List[Pipeline] = ['match', 'group', 'sort', 'lookup', 'sample']
+
+SELECTIVITY = 0.1
+"share of the groups that the match stage of a pipeline keeps"
+
+SORT_LIMIT = 100
+LOOKUP_LIMIT = 10
+SAMPLE_SIZE = 10
+
+TXN_DOCS = 4
+"documents inserted by each transaction"
+
+TXN_SCOPES: List[TxnScope] = ['single', 'cross']
 
 FIXED_NUM_COLLECTION = 50
+META_GROUPS = 10
+"sets of collection names that meta commands churn apart from each other"
+
+META_INDEXES: List[Dict[str, int]] = [
+    { KEY: 1 }, { GROUP: 1 }, { GROUP: 1, KEY: 1 }, { KEY: -1, GROUP: 1 } ]
+"index keys that createIndexes builds, each at most once on a collection"
+
+MetaGroup = Tuple[Set[str], Dict[str, Set[str]]]
+"free names, and the used names with the indexes built on each"
 
 
 def generate_random_string(length: int):
     return ''.join(random.choice(LETTERS) for _ in range(length))
 
 
-def add_write_operations(operations: List[Command]):
+def add_write_operations(
+    operations: List[Command], payload: Optional[Payload] = None):
+
     val = generate_random_string(STRING_LEN)
+    doc = { KEY: val, GROUP: random.randrange(GROUPS) }
+
+    if payload and not payload.is_default():
+        doc.update(payload.document())
+
     operations.append({
         "insert": "", # collection name specified later
-        "documents": [{ KEY: val }]
+        "documents": [doc]
     })
 
 
@@ -45,75 +91,342 @@ def add_read_operations(operations: List[Command]):
     })
 
 
-def add_meta_operations(create_drop: str ,collection_name: str, operations: List[Command]): 
-    if create_drop == 'c':
-        operations.append({
-            "create": collection_name
+def add_point_operations(
+    operations: List[Command], written: List[Tuple[str, int]]):
+
+    # has the whole shard key, so mongos can target a single shard
+    key, group = random.choice(written)
+    operations.append({
+        "find": "",
+        "filter": { KEY: key, GROUP: group },
+        "limit": 1
+    })
+
+
+def add_range_operations(operations: List[Command]):
+    # only ranged shard keys can target the shards that own the range
+    prefix = generate_random_string(2)
+    end = prefix[0] + chr(ord(prefix[1]) + 1)
+    operations.append({
+        "find": "",
+        "filter": {
+            KEY: { "$gte": prefix, "$lt": end },
+            GROUP: random.randrange(GROUPS)
+        }
+    })
+
+
+def add_aggregate_operations(
+    operations: List[Command], selectivity: float = SELECTIVITY):
+
+    """
+    A random pipeline, each starting with a match on a range of groups;
+    the comment names the pipeline, so it can be timed on its own
+    """
+    kind = random.choice(PIPELINES)
+    matched = max(1, round(GROUPS * selectivity))
+    low = random.randrange(GROUPS - matched + 1)
+
+    match = { "$match": { GROUP: { "$gte": low, "$lt": low + matched } } }
+    pipeline: List[Dict[str, Any]] = [match]
+
+    if kind == 'group':
+        pipeline.append({
+            "$group": { "_id": f"${GROUP}", "count": { "$sum": 1 } }
+        })
+
+    elif kind == 'sort':
+        pipeline.append({ "$sort": { KEY: 1 } })
+        pipeline.append({ "$limit": SORT_LIMIT })
+
+    elif kind == 'lookup':
+        pipeline.append({ "$limit": LOOKUP_LIMIT })
+        pipeline.append({
+            "$lookup": {
+                "from": "", # collection name specified later
+                "localField": KEY,
+                "foreignField": KEY,
+                "as": "matches"
+            }
         })
-    elif create_drop == 'd':
+
+    elif kind == 'sample':
+        pipeline.append({ "$sample": { "size": SAMPLE_SIZE } })
+
+    operations.append({
+        "aggregate": "", # collection name specified later
+        "pipeline": pipeline,
+        "cursor": {},
+        "comment": kind
+    })
+
+
+
+def add_transaction_operations(
+    operations: List[Command],
+    docs: int = TXN_DOCS,
+    scope: TxnScope = 'single',
+    payload: Optional[Payload] = None):
+
+    """
+    Inserts that commit together; single scope documents share a whole
+    shard key, so they land on one shard with any of the shard keys
+    """
+    val = generate_random_string(STRING_LEN)
+    group = random.randrange(GROUPS)
+    documents: List[Dict[str, Any]] = []
+
+    for _ in range(docs):
+        if scope == 'cross':
+            val = generate_random_string(STRING_LEN)
+            group = random.randrange(GROUPS)
+
+        doc = { KEY: val, GROUP: group }
+        if payload and not payload.is_default():
+            doc.update(payload.document())
+
+        documents.append(doc)
+
+    operations.append({
+        "transaction": "", # collection name specified later
+        "documents": documents,
+        "scope": scope
+    })
+
+
+
+def meta_index_name(keys: Dict[str, int]) -> str:
+    return '_'.join(f'{k}_{v}' for k, v in keys.items())
+
+
+def add_meta_operations(groups: List[MetaGroup], operations: List[Command]):
+    """
+    Catalog churn over a group of free and used names; renames stay in
+    their group, so each group can run apart from the others. Indexes are
+    only built where they are missing, so none is a no-op on the server
+    """
+    free, used = random.choice(groups)
+    indexable = [
+        name for name, built in sorted(used.items())
+        if len(built) < len(META_INDEXES) ]
+
+    choices = ['create'] if free else []
+    if used:
+        choices.append('drop')
+    if indexable:
+        choices.append('createIndexes')
+    if used and free:
+        choices.append('renameCollection')
+
+    meta = random.choice(choices)
+
+    if meta == 'create':
+        name = free.pop()
+        used[name] = set()
+        operations.append({ "create": name })
+
+    elif meta == 'drop':
+        name = random.choice(sorted(used))
+        del used[name]
+        free.add(name)
+        operations.append({ "drop": name })
+
+    elif meta == 'createIndexes':
+        name = random.choice(indexable)
+        keys = random.choice([
+            k for k in META_INDEXES
+            if meta_index_name(k) not in used[name] ])
+
+        used[name].add(meta_index_name(keys))
         operations.append({
-            "drop": collection_name
+            "createIndexes": name,
+            "indexes": [{ "key": keys, "name": meta_index_name(keys) }]
         })
 
+    else:
+        # the indexes move with the collection
+        old, new = random.choice(sorted(used)), free.pop()
+        used[new] = used.pop(old)
+        free.add(old)
+        operations.append({ "renameCollection": old, "to": new })
+
+
+
+@dataclass
+class Workload:
+    """
+    Generator settings besides the op and load size; the ops that depend
+    on a setting get it in their file names
+    """
+    payload: Payload = field(default_factory=Payload)
+    selectivity: float = SELECTIVITY
+    txn_docs: int = TXN_DOCS
+    txn_scope: TxnScope = 'single'
+
+    def profile(self, op: Operation) -> str:
+        parts: List[str] = []
+
+        if op in PAYLOAD_OPS and not self.payload.is_default():
+            parts.append(self.payload.tag())
+
+        if op == 'aggregate' and self.selectivity != SELECTIVITY:
+            parts.append(f'sel{self.selectivity:g}')
+
+        if op == 'transaction':
+            if (self.txn_docs, self.txn_scope) != (TXN_DOCS, 'single'):
+                parts.append(f'd{self.txn_docs}-{self.txn_scope}')
+
+        return ''.join(f'_{p}' for p in parts)
+
+
+
+def operation_json(
+    op: Operation, size: int, workload: Optional[Workload] = None):
+
+    profile = workload.profile(op) if workload else ''
+    return f'{LOADS}/{op}_{size}{profile}_operations.json'
+
+
+def written_keys(
+    load: int, workload: Optional[Workload] = None) -> List[Tuple[str, int]]:
 
+    """
+    Key and group of the documents in the write file of the load, so point
+    finds hit stored documents; loads without one, like a warmup, take
+    every write file there is
+    """
+    loads = [ load ] if os.path.exists(
+        operation_json('write', load, workload)) else LOAD_SIZES
 
-def operation_json(op: Operation, size: int):
-    return f'{LOADS}/{op}_{size}_operations.json'
+    written: List[Tuple[str, int]] = []
+    for size in loads:
+        path = operation_json('write', size, workload)
+        if not os.path.exists(path):
+            continue
 
+        with open(path) as f:
+            written += [
+                (doc[KEY], doc[GROUP])
+                for cmd in json.load(f) for doc in cmd['documents'] ]
 
-def create_operations(op: Operation, load: int):
-    free_collection_names = set(generate_random_string(STRING_LEN) for _ in range(FIXED_NUM_COLLECTION))
-    used_collection_names : Set[str] = set()
+    if not written:
+        raise FileNotFoundError('point finds need the write files first')
+
+    return written
+
+
+
+def build_operations(
+    op: Operation,
+    load: int,
+    workload: Optional[Workload] = None) -> List[Command]:
+
+    " the commands of a load, without saving them "
+    if workload is None:
+        workload = Workload()
+
+    names = [
+        generate_random_string(STRING_LEN)
+        for _ in range(FIXED_NUM_COLLECTION) ]
+
+    meta_groups: List[MetaGroup] = [
+        (set(names[i::META_GROUPS]), {}) for i in range(META_GROUPS) ]
+
+    written = written_keys(load, workload) if op == 'point' else []
 
     operations: List[Command] = []
     for _ in range(load): 
         if op == "write":
-            add_write_operations(operations)
+            add_write_operations(operations, workload.payload)
             
         elif op == "read":
             add_read_operations(operations)
 
+        elif op == "point":
+            add_point_operations(operations, written)
+
+        elif op == "range":
+            add_range_operations(operations)
+
         elif op == "meta":
-            
-            if not free_collection_names:
-                collection_name = used_collection_names.pop()
-                free_collection_names.add(collection_name)
-                add_meta_operations('d', collection_name, operations)
-
-            elif not used_collection_names:
-                collection_name = free_collection_names.pop()
-                used_collection_names.add(collection_name)
-                add_meta_operations('c', collection_name, operations)
-            
-            else:
-                if random.random() < 0.5:
-                    collection_name = used_collection_names.pop()
-                    free_collection_names.add(collection_name)
-                    add_meta_operations('d', collection_name, operations)
-                else:
-                    collection_name = free_collection_names.pop()
-                    used_collection_names.add(collection_name)
-                    add_meta_operations('c', collection_name, operations)
-                
-
-    with open(operation_json(op, load), 'w') as f:
-        json.dump(operations, f, indent=4)
+            add_meta_operations(meta_groups, operations)
+
+        elif op == "aggregate":
+            add_aggregate_operations(operations, workload.selectivity)
 
+        elif op == "transaction":
+            add_transaction_operations(
+                operations,
+                workload.txn_docs,
+                workload.txn_scope,
+                workload.payload)
 
+    return operations
 
-def generate(overwrite: bool=True):
-    if os.path.exists(LOADS) and not overwrite:
-        return
 
-    ops: List[Operation] = ['write', 'read', 'meta']
+
+def create_operations(
+    op: Operation, load: int, workload: Optional[Workload] = None):
+
+    operations = build_operations(op, load, workload)
+
+    with open(operation_json(op, load, workload), 'w') as f:
+        json.dump(operations, f, indent=4)
+
+
+
+def generate(overwrite: bool = True, workload: Optional[Workload] = None):
+    ops: List[Operation] = [
+        'write', 'read', 'meta', 'point', 'range', 'aggregate',
+        'transaction']
 
     if not os.path.isdir(LOADS):
         os.makedirs(LOADS)
 
     for t in ops:
         for load in LOAD_SIZES:
-            create_operations(t, load)
+            out = operation_json(t, load, workload)
+            if os.path.exists(out) and not overwrite:
+                continue
+
+            create_operations(t, load, workload)
 
     
 if __name__ == '__main__':
-    generate()
+    args = ArgumentParser(
+        description = 'writes the mongodb operation files of every op '
+                      'and load size')
+
+    args.add_argument('--selectivity',
+        default = SELECTIVITY,
+        type = float,
+        help = 'share of the groups that aggregation pipelines match')
+
+    args.add_argument('--txn-docs',
+        default = TXN_DOCS,
+        type = int,
+        help = 'documents inserted by each transaction')
+
+    args.add_argument('--txn-scope',
+        default = 'single',
+        choices = TXN_SCOPES,
+        help = 'if the documents of a transaction share a shard, or are '
+               'spread over the shards')
+
+    add_payload_args(args)
+    args = args.parse_args()
+
+    payload = Payload(
+        dist = args.value_dist,
+        size = args.value_size,
+        min_size = args.value_min,
+        sigma = args.value_sigma,
+        buckets = args.value_histogram,
+        fields = args.value_fields,
+        depth = args.value_depth)
+
+    generate(workload=Workload(
+        payload = payload,
+        selectivity = args.selectivity,
+        txn_docs = args.txn_docs,
+        txn_scope = args.txn_scope))
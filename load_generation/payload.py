@@ -0,0 +1,183 @@
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Literal, Optional, Tuple
+
+import hashlib
+import json
+import math
+import random
+import string
+
+
+SizeDist = Literal['fixed', 'uniform', 'lognormal', 'histogram']
+SIZE_DISTS = ['fixed', 'uniform', 'lognormal', 'histogram']
+
+FIELD = 'field'
+NESTED = 'nested'
+LETTERS = string.ascii_lowercase
+
+
+
+def random_value(length: int) -> str:
+    return ''.join(random.choices(LETTERS, k=length))
+
+
+def parse_buckets(buckets: List[str]) -> Tuple[List[int], List[float]]:
+    " bytes:weight pairs, a bare bytes has a weight of 1 "
+    sizes: List[int] = []
+    weights: List[float] = []
+
+    for bucket in buckets:
+        size, _, weight = bucket.partition(':')
+        sizes.append(int(size))
+        weights.append(float(weight or 1))
+
+    return sizes, weights
+
+
+
+@dataclass
+class Payload:
+    """
+    Size and shape of the written values. With no size, the values are
+    left as they were, a single short key field
+    """
+    dist: SizeDist = 'fixed'
+    size: Optional[int] = None
+    "bytes of a fixed value, the max of uniform, the median of lognormal"
+    min_size: int = 1
+    "smallest uniform value"
+    sigma: float = 1.0
+    "spread of the lognormal sizes"
+    buckets: Optional[List[str]] = None
+    "bytes:weight pairs that histogram sizes are drawn from"
+    fields: int = 1
+    "string fields the bytes are split over, at each level"
+    depth: int = 0
+    "levels of sub documents, each with its own fields"
+
+    def __post_init__(self):
+        if self.dist == 'histogram' and not self.buckets:
+            raise ValueError('histogram sizes need buckets')
+
+        if self.dist != 'histogram' and self.size is None:
+            if self.dist != 'fixed' or self.is_shaped():
+                raise ValueError(f'{self.dist} values need a size')
+
+        if self.fields < 1 or self.depth < 0:
+            raise ValueError('values need a field, and depth of at least 0')
+
+
+    def is_default(self) -> bool:
+        return self.dist == 'fixed' and self.size is None
+
+    def is_shaped(self) -> bool:
+        " more than a single flat string "
+        return self.fields != 1 or self.depth > 0
+
+
+    def tag(self) -> str:
+        " label of the profile, so each one gets its own load files "
+        if self.is_default():
+            return ''
+
+        if self.dist == 'histogram' and self.buckets:
+            joined = ' '.join(self.buckets).encode()
+            tag = f'histogram-{hashlib.sha1(joined).hexdigest()[:8]}'
+        elif self.dist == 'uniform':
+            tag = f'uniform-{self.min_size}-{self.size}'
+        elif self.dist == 'lognormal':
+            tag = f'lognormal-{self.size}-s{self.sigma:g}'
+        else:
+            tag = f'fixed-{self.size}'
+
+        if self.is_shaped():
+            tag += f'-f{self.fields}-d{self.depth}'
+
+        return tag
+
+
+    def sample_size(self) -> int:
+        if self.dist == 'histogram' and self.buckets:
+            sizes, weights = parse_buckets(self.buckets)
+            return random.choices(sizes, weights)[0]
+
+        size = self.size or 0
+
+        if self.dist == 'uniform':
+            return random.randint(min(self.min_size, size), size)
+
+        if self.dist == 'lognormal':
+            median = math.log(max(size, 1))
+            return max(1, round(random.lognormvariate(median, self.sigma)))
+
+        return size
+
+
+    def document(self) -> Dict[str, Any]:
+        " fields holding a sampled size, split evenly over every leaf "
+        size = self.sample_size()
+        leaves = self.fields * (self.depth + 1)
+
+        lengths = iter([
+            size // leaves + (1 if i < size % leaves else 0)
+            for i in range(leaves) ])
+
+        return self._level(lengths, self.depth)
+
+    def _level(self, lengths: Iterator[int], depth: int) -> Dict[str, Any]:
+        level: Dict[str, Any] = {
+            f'{FIELD}{i}': random_value(next(lengths))
+            for i in range(self.fields) }
+
+        if depth:
+            level[NESTED] = self._level(lengths, depth - 1)
+
+        return level
+
+
+    def value(self) -> str:
+        " a flat value, where shaped ones are the document as json "
+        if self.is_shaped():
+            return json.dumps(self.document(), separators=(',', ':'))
+
+        return random_value(self.sample_size())
+
+
+
+def add_payload_args(args: ArgumentParser):
+    " the value args of the generator and the benchmarks "
+    args.add_argument('--value-depth',
+        default = 0,
+        type = int,
+        help = 'levels of sub documents in each written value')
+
+    args.add_argument('--value-dist',
+        default = 'fixed',
+        choices = SIZE_DISTS,
+        help = 'how the bytes of each written value are picked')
+
+    args.add_argument('--value-fields',
+        default = 1,
+        type = int,
+        help = 'string fields that each level of a value is split into')
+
+    args.add_argument('--value-histogram',
+        nargs = '+',
+        help = 'bytes:weight buckets that histogram value sizes are drawn '
+               'from, like 200:8 4000:2 200000:1')
+
+    args.add_argument('--value-min',
+        default = 1,
+        type = int,
+        help = 'smallest bytes of a uniform value')
+
+    args.add_argument('--value-sigma',
+        default = 1.0,
+        type = float,
+        help = 'spread of lognormal value sizes')
+
+    args.add_argument('--value-size',
+        type = int,
+        help = 'bytes of a fixed value, the max of uniform values, or the '
+               'median of lognormal values; the original values if unset')
@@ -0,0 +1,169 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Literal, Tuple, TypedDict
+from time import perf_counter
+
+import logging
+import random
+
+from pymongo import MongoClient
+from redis.cluster import RedisCluster
+
+from load_generation.mongodb_load_gen import (
+    GROUP, GROUPS, KEY, STRING_LEN, generate_random_string)
+
+
+BATCH_SIZE = 1_000
+
+RedisType = Literal['set', 'hash']
+Router = Tuple[str, int]
+
+logger = logging.getLogger(__name__)
+
+
+
+class LoadReport(TypedDict):
+    docs: int
+    bytes: int
+    seconds: float
+    docs_per_sec: float
+    mb_per_sec: float
+
+
+
+def worker_counts(total: int, workers: int) -> List[int]:
+    base, extra = divmod(total, workers)
+    return [ base + (1 if i < extra else 0) for i in range(workers) ]
+
+
+def batches(count: int, batch: int):
+    for start in range(0, count, batch):
+        yield min(batch, count - start)
+
+
+
+def mongo_worker(
+    router: Router,
+    namespace: Tuple[str, str],
+    count: int,
+    batch: int) -> Tuple[int, int]:
+
+    " generates and inserts its share of docs, returns docs and bytes "
+    host, port = router
+    db, col = namespace
+
+    docs = 0
+    size = 0
+
+    with MongoClient(host, port) as cli:
+        collection = cli[db][col]
+
+        for amount in batches(count, batch):
+            values = [
+                generate_random_string(STRING_LEN)
+                for _ in range(amount) ]
+
+            docs_batch = [
+                { KEY: v, GROUP: random.randrange(GROUPS) }
+                for v in values ]
+
+            # unordered lets mongos send to all the shards at once
+            collection.insert_many(docs_batch, ordered=False)
+
+            docs += amount
+            size += sum(len(KEY) + len(v) for v in values)
+
+    return docs, size
+
+
+
+def redis_worker(
+    node: Router,
+    worker: int,
+    count: int,
+    batch: int,
+    kind: RedisType) -> Tuple[int, int]:
+
+    host, port = node
+    docs = 0
+    size = 0
+
+    with RedisCluster(host, port) as cli:
+        for amount in batches(count, batch):
+            # cluster pipelines split the batch up by slot owner
+            pipe = cli.pipeline(transaction=False)
+
+            for i in range(docs, docs + amount):
+                key = f'{KEY}:{worker}:{i}'
+                val = generate_random_string(STRING_LEN)
+
+                if kind == 'hash':
+                    pipe.hset(key, KEY, val)
+                else:
+                    pipe.set(key, val)
+
+                size += len(key) + len(val)
+
+            pipe.execute()
+            docs += amount
+
+    return docs, size
+
+
+
+def run_workers(func: Any, args: List[Tuple[Any, ...]]) -> LoadReport:
+    start = perf_counter()
+
+    with ProcessPoolExecutor(max_workers=len(args)) as pool:
+        futures = [ pool.submit(func, *a) for a in args ]
+        done = [ f.result() for f in futures ]
+
+    seconds = perf_counter() - start
+    docs = sum(d for d, _ in done)
+    size = sum(b for _, b in done)
+
+    return LoadReport(
+        docs = docs,
+        bytes = size,
+        seconds = seconds,
+        docs_per_sec = docs / seconds if seconds else 0,
+        mb_per_sec = size / 1e6 / seconds if seconds else 0)
+
+
+
+def preload_mongo(
+    routers: List[Router],
+    namespace: Tuple[str, str],
+    total: int,
+    workers: int,
+    batch: int = BATCH_SIZE) -> LoadReport:
+
+    " workers are spread round robin over the mongos routers "
+    args = [
+        (routers[i % len(routers)], namespace, count, batch)
+        for i, count in enumerate(worker_counts(total, workers)) ]
+
+    logger.info(f'preloading {total} docs with {workers} workers')
+    return run_workers(mongo_worker, args)
+
+
+
+def preload_redis(
+    nodes: List[Router],
+    total: int,
+    workers: int,
+    batch: int = BATCH_SIZE,
+    kind: RedisType = 'set') -> LoadReport:
+
+    args = [
+        (nodes[i % len(nodes)], i, count, batch, kind)
+        for i, count in enumerate(worker_counts(total, workers)) ]
+
+    logger.info(f'preloading {total} keys with {workers} workers')
+    return run_workers(redis_worker, args)
+
+
+
+def report_line(report: Dict[str, Any]) -> str:
+    return (f"loaded {report['docs']} in {report['seconds']:.2f}s, "
+        f"{report['docs_per_sec']:.0f} docs/s, "
+        f"{report['mb_per_sec']:.2f} MB/s")
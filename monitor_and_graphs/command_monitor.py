@@ -0,0 +1,82 @@
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Any, Dict, Tuple, TypedDict
+
+from pymongo import monitoring
+
+from monitor_and_graphs.latency import Histogram, HistogramDict, Summary
+
+
+class Timing(TypedDict):
+    summary: Summary
+    histogram: HistogramDict
+
+
+class CommandReport(TypedDict):
+    commands: Dict[str, Timing]
+    "keyed by command name, like insert or find"
+    servers: Dict[str, Timing]
+    "keyed by the host:port that ran the command, a shard or a router"
+    failed: Dict[str, int]
+
+
+
+def server_name(address: Tuple[str, int]):
+    host, port = address
+    return f'{host}:{port}'
+
+
+
+@dataclass
+class CommandMonitor(monitoring.CommandListener):
+    """
+    Records the driver timed duration of every command, by command name
+    and by the server it was sent to
+    """
+    commands: Dict[str, Histogram] = field(default_factory=dict)
+    servers: Dict[str, Histogram] = field(default_factory=dict)
+    failures: Dict[str, int] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self._lock = Lock()
+
+
+    def started(self, event: Any):
+        pass
+
+    def succeeded(self, event: Any):
+        name = event.command_name
+        server = server_name(event.connection_id)
+
+        with self._lock:
+            self.commands.setdefault(name, Histogram()).record(
+                event.duration_micros)
+            self.servers.setdefault(server, Histogram()).record(
+                event.duration_micros)
+
+    def failed(self, event: Any):
+        name = event.command_name
+        with self._lock:
+            self.failures[name] = self.failures.get(name, 0) + 1
+
+
+    def reset(self):
+        with self._lock:
+            self.commands = {}
+            self.servers = {}
+            self.failures = {}
+
+
+    def report(self, seconds: float) -> CommandReport:
+        def timing(hist: Histogram):
+            return Timing(
+                summary = hist.summary(seconds),
+                histogram = hist.as_dict())
+
+        with self._lock:
+            return CommandReport(
+                commands = {
+                    n: timing(h) for n, h in self.commands.items() },
+                servers = {
+                    s: timing(h) for s, h in self.servers.items() },
+                failed = dict(self.failures))
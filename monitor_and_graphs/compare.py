@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Dict, List, Literal, Optional, Tuple, TypedDict, Union
+
+import json
+import random
+import sys
+
+if __package__:
+    from monitor_and_graphs.latency import Recorded
+else:
+    # run as ./monitor_and_graphs/compare.py, next to latency
+    from latency import Recorded
+
+
+Trial = Dict[str, Recorded]
+"summaries of one benchmark run, keyed by op and size"
+
+Verdict = Literal['better', 'worse', 'same', 'inconclusive']
+
+METRICS = ['throughput', 'mean', 'p50', 'p95', 'p99']
+HIGHER_BETTER = {'throughput'}
+
+RESAMPLES = 10000
+
+
+class Delta(TypedDict):
+    run: str
+    metric: str
+    trials: Tuple[int, int]
+    "baseline and candidate trial counts"
+    baseline: float
+    candidate: float
+    change: float
+    "relative change of the trial means, 0.1 is 10% higher"
+    low: float
+    high: float
+    "bootstrap confidence interval of the change"
+    verdict: Verdict
+    regression: bool
+
+
+
+def load_trials(paths: List[Union[str, Path]]) -> List[Trial]:
+    " results files of single runs, or trials files that list many runs "
+    trials: List[Trial] = []
+
+    for path in paths:
+        with open(path) as f:
+            data = json.load(f)
+
+        if isinstance(data, list):
+            trials.extend(data)
+        else:
+            trials.append(data)
+
+    return trials
+
+
+def trial_values(trials: List[Trial], run: str, metric: str) -> List[float]:
+    return [ t[run][metric] for t in trials if run in t ]
+
+
+def mean(values: List[float]) -> float:
+    return sum(values) / len(values) if values else 0
+
+
+
+def relative(baseline: float, candidate: float) -> float:
+    if baseline == 0:
+        return 0 if candidate == 0 else float('inf')
+
+    return candidate / baseline - 1
+
+
+def bootstrap(
+    baseline: List[float],
+    candidate: List[float],
+    confidence: float,
+    resamples: int,
+    rng: random.Random) -> Tuple[float, float]:
+
+    """
+    Confidence interval of the relative change in means, from resampling
+    the trials of each side with replacement
+    """
+    changes = sorted(
+        relative(
+            mean(rng.choices(baseline, k=len(baseline))),
+            mean(rng.choices(candidate, k=len(candidate))))
+        for _ in range(resamples))
+
+    tail = (1 - confidence) / 2
+    low = changes[int(tail * (resamples - 1))]
+    high = changes[int((1 - tail) * (resamples - 1))]
+
+    return low, high
+
+
+
+def verdict(
+    metric: str, low: float, high: float, enough: bool) -> Verdict:
+
+    " noise when the interval holds no change, or with a single trial "
+    if not enough:
+        return 'inconclusive'
+
+    if low <= 0 <= high:
+        return 'same'
+
+    higher = low > 0
+    return 'better' if higher == (metric in HIGHER_BETTER) else 'worse'
+
+
+
+def compare(
+    baseline: List[Trial],
+    candidate: List[Trial],
+    metrics: List[str] = METRICS,
+    threshold: float = 0.05,
+    confidence: float = 0.95,
+    resamples: int = RESAMPLES,
+    seed: Optional[int] = None) -> List[Delta]:
+
+    """
+    Deltas of every run that both sides have; a regression is a worse
+    verdict with a change beyond threshold
+    """
+    rng = random.Random(seed)
+    runs = sorted(set().union(*baseline) & set().union(*candidate))
+
+    deltas: List[Delta] = []
+
+    for run in runs:
+        for metric in metrics:
+            base = trial_values(baseline, run, metric)
+            cand = trial_values(candidate, run, metric)
+
+            change = relative(mean(base), mean(cand))
+            low, high = bootstrap(base, cand, confidence, resamples, rng)
+            judged = verdict(
+                metric, low, high, len(base) > 1 and len(cand) > 1)
+
+            deltas.append(Delta(
+                run = run,
+                metric = metric,
+                trials = (len(base), len(cand)),
+                baseline = mean(base),
+                candidate = mean(cand),
+                change = change,
+                low = low,
+                high = high,
+                verdict = judged,
+                regression = judged == 'worse' and abs(change) > threshold))
+
+    return deltas
+
+
+
+def delta_line(delta: Delta) -> str:
+    flag = ' REGRESSION' if delta['regression'] else ''
+    return (
+        f"{delta['run']:<16} {delta['metric']:<10} "
+        f"{delta['baseline']:>12.3f} -> {delta['candidate']:>12.3f} "
+        f"{delta['change']:>+8.1%} "
+        f"[{delta['low']:+.1%}, {delta['high']:+.1%}] "
+        f"{delta['verdict']}{flag}")
+
+
+
+def main(
+    baseline: List[str],
+    candidate: List[str],
+    metrics: List[str],
+    threshold: float,
+    confidence: float,
+    resamples: int,
+    seed: Optional[int],
+    out: Optional[str]) -> int:
+
+    deltas = compare(
+        load_trials(baseline), load_trials(candidate),
+        metrics, threshold, confidence, resamples, seed)
+
+    for delta in deltas:
+        print(delta_line(delta))
+
+    if out:
+        with open(out, 'w') as f:
+            json.dump(deltas, f, indent=4)
+
+    regressions = [ d for d in deltas if d['regression'] ]
+    if regressions:
+        print(f'{len(regressions)} regressions beyond {threshold:.1%}')
+
+    return 1 if regressions else 0
+
+
+
+if __name__ == '__main__':
+    args = ArgumentParser(
+        description = 'compares the benchmark results of a baseline and a '
+                      'candidate, exiting with 1 on a regression')
+
+    args.add_argument('-b', '--baseline',
+        required = True,
+        nargs = '+',
+        help = 'results or trials files of the baseline runs')
+
+    args.add_argument('-c', '--candidate',
+        required = True,
+        nargs = '+',
+        help = 'results or trials files of the candidate runs')
+
+    args.add_argument('--confidence',
+        default = 0.95,
+        type = float,
+        help = 'level of the bootstrap confidence intervals')
+
+    args.add_argument('-m', '--metrics',
+        default = METRICS,
+        nargs = '+',
+        choices = METRICS,
+        help = 'summary values to compare')
+
+    args.add_argument('-o', '--out',
+        help = 'also write the deltas to this json file')
+
+    args.add_argument('-r', '--resamples',
+        default = RESAMPLES,
+        type = int,
+        help = 'bootstrap resamples for each delta')
+
+    args.add_argument('-s', '--seed',
+        type = int,
+        help = 'random seed of the bootstrap')
+
+    args.add_argument('-t', '--threshold',
+        default = 0.05,
+        type = float,
+        help = 'relative change that a worse verdict has to go beyond '
+               'to count as a regression')
+
+    args = args.parse_args()
+    sys.exit(main(**vars(args)))
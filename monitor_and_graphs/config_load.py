@@ -0,0 +1,111 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple, TypedDict
+
+import logging
+
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+
+Counters = Dict[str, Dict[str, int]]
+"opcounters and command totals from a server status"
+
+logger = logging.getLogger(__name__)
+
+
+class ConfigLoad(TypedDict):
+    server: str
+    seconds: float
+    opcounters: Dict[str, int]
+    "ops the config primary ran, like query, insert, and command"
+    per_second: Dict[str, float]
+    commands: Dict[str, int]
+    "commands the config primary ran by name, only the ones that ran"
+
+
+
+def server_counters(cli: MongoClient) -> Counters:
+    status: Dict[str, Any] = cli['admin'].command('serverStatus')
+    commands = status.get('metrics', {}).get('commands', {})
+
+    return {
+        'opcounters': {
+            k: int(v) for k, v in status['opcounters'].items() },
+        'commands': {
+            k: int(v['total']) for k, v in commands.items()
+            if isinstance(v, dict) and 'total' in v } }
+
+
+
+def find_primary(
+    members: List[Tuple[str, int]]) -> Optional[Tuple[str, int]]:
+
+    for host, port in members:
+        try:
+            with MongoClient(
+                host, port,
+                directConnection = True,
+                serverSelectionTimeoutMS = 2000) as cli:
+
+                if cli['admin'].command('ismaster').get('ismaster'):
+                    return host, port
+
+        except PyMongoError as e:
+            logger.warning(f'config member {host}:{port} unreachable: {e}')
+
+    return None
+
+
+
+@dataclass
+class ConfigMonitor:
+    """
+    Counts what the config server primary ran between reset and report,
+    which is where the catalog changes of a sharded cluster end up
+    """
+    host: str
+    port: int
+    _before: Counters = field(default_factory=dict)
+
+    def counters(self) -> Counters:
+        with MongoClient(
+            self.host, self.port, directConnection=True) as cli:
+            return server_counters(cli)
+
+
+    def reset(self):
+        self._before = self.counters()
+
+
+    def report(self, seconds: float) -> ConfigLoad:
+        after = self.counters()
+
+        def deltas(kind: str):
+            before = self._before.get(kind, {})
+            return {
+                k: v - before.get(k, 0) for k, v in after[kind].items() }
+
+        opcounters = deltas('opcounters')
+        commands = { k: v for k, v in deltas('commands').items() if v }
+
+        return ConfigLoad(
+            server = f'{self.host}:{self.port}',
+            seconds = seconds,
+            opcounters = opcounters,
+            per_second = {
+                k: v / seconds if seconds else 0
+                for k, v in opcounters.items() },
+            commands = commands)
+
+
+
+def config_monitor(
+    members: List[Tuple[str, int]]) -> Optional[ConfigMonitor]:
+
+    " none when no config member is the primary "
+    primary = find_primary(members)
+    if primary is None:
+        logger.warning('no config primary, config load is not recorded')
+        return None
+
+    return ConfigMonitor(*primary)
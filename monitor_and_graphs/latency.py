@@ -0,0 +1,154 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, TypedDict
+
+import math
+
+
+GROWTH = 1.02
+"bucket width ratio, so percentiles are within about 1%"
+
+
+class Summary(TypedDict):
+    ops: int
+    seconds: float
+    throughput: float
+    "operations per second"
+    mean: float
+    "latencies are all in ms"
+    p50: float
+    p95: float
+    p99: float
+    max: float
+
+
+class HistogramDict(TypedDict):
+    counts: Dict[str, int]
+    total: int
+    max: float
+
+
+class Recorded(Summary, total=False):
+    histogram: HistogramDict
+    "only kept when asked for, so runs on many hosts can be merged"
+    warmup: int
+    "commands sent before the timed window, left out of the summary"
+    steady: bool
+    "if the load settled before the timed window, when it was watched"
+    bytes: int
+    "payload written in the timed window, only for write runs"
+    mb_per_sec: float
+
+
+@dataclass
+class Histogram:
+    " log bucketed latencies in microseconds, can be merged across runs "
+    counts: Dict[int, int] = field(default_factory=dict)
+    total: int = 0
+    max: float = 0
+
+    @staticmethod
+    def bucket(micros: float) -> int:
+        return int(math.log(max(micros, 1), GROWTH))
+
+    def record(self, micros: float):
+        b = self.bucket(micros)
+        self.counts[b] = self.counts.get(b, 0) + 1
+        self.total += 1
+        self.max = max(self.max, micros)
+
+    def merge(self, other: Histogram):
+        for b, count in other.counts.items():
+            self.counts[b] = self.counts.get(b, 0) + count
+
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        return self
+
+
+    def percentile(self, pct: float) -> float:
+        if not self.total:
+            return 0
+
+        rank = math.ceil(self.total * pct / 100)
+        seen = 0
+
+        for b in sorted(self.counts):
+            seen += self.counts[b]
+            if seen >= rank:
+                # middle of the bucket, capped by the real max
+                return min(GROWTH ** (b + 0.5), self.max)
+
+        return self.max
+
+    def mean(self) -> float:
+        if not self.total:
+            return 0
+
+        weighted = sum(
+            min(GROWTH ** (b + 0.5), self.max) * count
+            for b, count in self.counts.items())
+
+        return weighted / self.total
+
+
+    def summary(self, seconds: float, ops: Optional[int] = None) -> Summary:
+        if ops is None:
+            ops = self.total
+
+        return Summary(
+            ops = ops,
+            seconds = seconds,
+            throughput = ops / seconds if seconds > 0 else 0,
+            mean = self.mean() / 1000,
+            p50 = self.percentile(50) / 1000,
+            p95 = self.percentile(95) / 1000,
+            p99 = self.percentile(99) / 1000,
+            max = self.max / 1000)
+
+
+    def as_dict(self):
+        return HistogramDict(
+            counts = { str(b): c for b, c in self.counts.items() },
+            total = self.total,
+            max = self.max)
+
+    @classmethod
+    def from_dict(cls, data: HistogramDict):
+        return cls(
+            counts = { int(b): c for b, c in data['counts'].items() },
+            total = data['total'],
+            max = data['max'])
+
+
+
+def merge_summaries(summaries: List[Recorded]) -> Summary:
+    """
+    Combines runs that happened at the same time into one, so throughput
+    adds up. Latencies are exact when every run kept its histogram,
+    otherwise the mean is weighted by ops and percentiles are the worst run
+    """
+    ops = sum(s['ops'] for s in summaries)
+    seconds = max((s['seconds'] for s in summaries), default=0)
+
+    if summaries and all('histogram' in s for s in summaries):
+        merged = Histogram()
+        for s in summaries:
+            merged.merge(Histogram.from_dict(s['histogram']))
+
+        return merged.summary(seconds, ops)
+
+    def worst(col: str):
+        return max((s[col] for s in summaries), default=0)
+
+    weighted = sum(s['mean'] * s['ops'] for s in summaries)
+
+    return Summary(
+        ops = ops,
+        seconds = seconds,
+        throughput = ops / seconds if seconds > 0 else 0,
+        mean = weighted / ops if ops else 0,
+        p50 = worst('p50'),
+        p95 = worst('p95'),
+        p99 = worst('p99'),
+        max = worst('max'))
@@ -0,0 +1,97 @@
+from dataclasses import dataclass, field
+from threading import Lock, local
+from typing import Any, TypedDict
+from time import perf_counter
+
+from pymongo import monitoring
+
+from monitor_and_graphs.latency import Histogram, Summary
+
+
+class PoolReport(TypedDict):
+    checkouts: int
+    failed_checkouts: int
+    created: int
+    closed: int
+    cleared: int
+    wait: Summary
+    "time spent waiting for a connection, not on the server"
+
+
+
+@dataclass
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """
+    Records how long checkouts wait for a pooled connection, so client side
+    queuing can be told apart from server latency. One monitor can be
+    shared by the clients of every worker thread
+    """
+    waits: Histogram = field(default_factory=Histogram)
+    failed: int = 0
+    created: int = 0
+    closed: int = 0
+    cleared: int = 0
+
+    def __post_init__(self):
+        self._lock = Lock()
+        self._started = local()
+
+
+    def connection_check_out_started(self, event: Any):
+        # the checkout finishes on the same thread that started it
+        self._started.time = perf_counter()
+
+    def connection_checked_out(self, event: Any):
+        started = getattr(self._started, 'time', None)
+        if started is None:
+            return
+
+        wait = (perf_counter() - started) * 1e6
+        with self._lock:
+            self.waits.record(wait)
+
+    def connection_check_out_failed(self, event: Any):
+        with self._lock:
+            self.failed += 1
+
+    def connection_created(self, event: Any):
+        with self._lock:
+            self.created += 1
+
+    def connection_closed(self, event: Any):
+        with self._lock:
+            self.closed += 1
+
+    def pool_cleared(self, event: Any):
+        with self._lock:
+            self.cleared += 1
+
+    def connection_ready(self, event: Any):
+        pass
+
+    def connection_checked_in(self, event: Any):
+        pass
+
+    def pool_created(self, event: Any):
+        pass
+
+    def pool_closed(self, event: Any):
+        pass
+
+
+    def reset(self):
+        " drops what was recorded so far, like setup before a timed run "
+        with self._lock:
+            self.waits = Histogram()
+            self.failed = self.created = self.closed = self.cleared = 0
+
+
+    def report(self, seconds: float) -> PoolReport:
+        with self._lock:
+            return PoolReport(
+                checkouts = self.waits.total,
+                failed_checkouts = self.failed,
+                created = self.created,
+                closed = self.closed,
+                cleared = self.cleared,
+                wait = self.waits.summary(seconds))
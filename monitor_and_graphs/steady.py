@@ -0,0 +1,71 @@
+from collections import deque
+from dataclasses import dataclass, field
+from statistics import mean, pstdev
+from time import perf_counter
+from typing import Deque, List, Optional
+
+
+STEADY_WINDOW = 100
+"commands in each window"
+
+STEADY_WINDOWS = 5
+"last windows that all have to agree"
+
+STEADY_CV = 0.1
+"max coefficient of variation of the windows, stdev over mean"
+
+
+
+def variation(values: Deque[float]) -> float:
+    average = mean(values)
+    return pstdev(values) / average if average else 0
+
+
+
+@dataclass
+class SteadyState:
+    """
+    Watches the throughput and mean latency of consecutive windows of
+    commands, and calls the load steady once the last few windows vary
+    less than cv
+    """
+    window: int = STEADY_WINDOW
+    windows: int = STEADY_WINDOWS
+    cv: float = STEADY_CV
+
+    _latencies: List[float] = field(default_factory=list)
+    _throughputs: Deque[float] = field(init=False)
+    _means: Deque[float] = field(init=False)
+    _started: Optional[float] = None
+
+    def __post_init__(self):
+        self._throughputs = deque(maxlen=self.windows)
+        self._means = deque(maxlen=self.windows)
+
+
+    def record(self, micros: float) -> bool:
+        " adds the latency of a command, true once the load is steady "
+        now = perf_counter()
+        if self._started is None:
+            self._started = now - micros / 1e6
+
+        self._latencies.append(micros)
+        if len(self._latencies) < self.window:
+            return False
+
+        seconds = now - self._started
+        self._throughputs.append(self.window / seconds if seconds else 0)
+        self._means.append(mean(self._latencies))
+
+        self._latencies = []
+        self._started = now
+
+        return self.is_steady()
+
+
+    def is_steady(self) -> bool:
+        if len(self._means) < self.windows:
+            return False
+
+        return (variation(self._throughputs) <= self.cv
+            and variation(self._means) <= self.cv)
@@ -0,0 +1,192 @@
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Lock, get_ident
+from time import monotonic, time
+from typing import Any, Dict, Iterator, List, Optional, TypedDict, Union
+
+import asyncio as aio
+import json
+import logging
+import socket
+
+
+TRACE_PREFIX = 'trace: '
+"printed before each span, the start scripts use the same prefix"
+
+HOST = socket.gethostname()
+
+logger = logging.getLogger(__name__)
+
+_ANCHOR = (time(), monotonic())
+
+
+class Span(TypedDict):
+    name: str
+    cat: str
+    host: str
+    tid: str
+    "spans of the same host and tid have to nest"
+    ts: float
+    "wall clock start in us, so spans of different hosts line up"
+    dur: float
+    "us, timed by the monotonic clock"
+    args: Dict[str, Any]
+
+
+_spans: List[Span] = []
+_lock = Lock()
+_enabled = False
+_echo = False
+
+
+
+def enable(echo: bool = False):
+    """
+    Starts recording spans; with echo, each span is also printed when it
+    ends, so a caller running this over ssh can collect it
+    """
+    global _enabled, _echo
+    _enabled = True
+    _echo = echo
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def clear():
+    with _lock:
+        _spans.clear()
+
+
+def now_us() -> float:
+    " monotonic time, anchored to the wall clock when the module loaded "
+    return (_ANCHOR[0] + monotonic() - _ANCHOR[1]) * 1e6
+
+
+def current_tid() -> str:
+    " concurrent tasks get their own row, or their spans would overlap "
+    try:
+        task = aio.current_task()
+    except RuntimeError:
+        task = None
+
+    if task is not None:
+        return f'task-{id(task)}'
+
+    return f'thread-{get_ident()}'
+
+
+
+def record(span: Dict[str, Any], host: Optional[str] = None):
+    " adds a finished span, like one from a start script "
+    if not _enabled:
+        return
+
+    span = Span(
+        name = span['name'],
+        cat = span.get('cat', ''),
+        host = host or span.get('host') or HOST,
+        tid = span.get('tid') or current_tid(),
+        ts = span['ts'],
+        dur = span['dur'],
+        args = span.get('args', {}))
+
+    with _lock:
+        _spans.append(span)
+
+    if _echo:
+        print(TRACE_PREFIX + json.dumps(span), flush=True)
+
+
+
+@contextmanager
+def span(
+    name: str,
+    cat: str = '',
+    host: Optional[str] = None,
+    tid: Optional[str] = None,
+    **args: Any) -> Iterator[Dict[str, Any]]:
+
+    """
+    Times the block as a span of host, which is this host by default.
+    The yielded dict holds the tid, and more args can be added to it
+    """
+    info: Dict[str, Any] = { 'tid': tid or current_tid(), 'args': args }
+
+    if not _enabled:
+        yield info
+        return
+
+    start = now_us()
+    try:
+        yield info
+    finally:
+        record({
+            'name': name,
+            'cat': cat,
+            'host': host,
+            'tid': info['tid'],
+            'ts': start,
+            'dur': now_us() - start,
+            'args': info['args'] })
+
+
+
+def collect(out: str, host: Optional[str] = None, tid: Optional[str] = None):
+    """
+    Records the spans printed in the output of a remote command; they go
+    under host and tid, so they nest in the span of the command
+    """
+    if not _enabled:
+        return
+
+    for line in out.splitlines():
+        if not line.startswith(TRACE_PREFIX):
+            continue
+
+        try:
+            remote = json.loads(line[len(TRACE_PREFIX):])
+        except ValueError:
+            # like a line cut off when the command timed out
+            logger.warning(f'skipping a span that is not json: {line}')
+            continue
+
+        remote['tid'] = tid or remote.get('tid')
+        record(remote, host)
+
+
+
+def write(path: Union[str, Path]):
+    " the spans in the chrome trace format, which perfetto can open "
+    with _lock:
+        spans = list(_spans)
+
+    pids: Dict[str, int] = {}
+    tids: Dict[str, int] = {}
+    events: List[Dict[str, Any]] = []
+
+    for s in sorted(spans, key=lambda s: s['ts']):
+        if s['host'] not in pids:
+            pids[s['host']] = len(pids) + 1
+            events.append({
+                'ph': 'M',
+                'name': 'process_name',
+                'pid': pids[s['host']],
+                'args': { 'name': s['host'] } })
+
+        events.append({
+            'ph': 'X',
+            'name': s['name'],
+            'cat': s['cat'],
+            'pid': pids[s['host']],
+            'tid': tids.setdefault(s['tid'], len(tids) + 1),
+            'ts': s['ts'],
+            'dur': s['dur'],
+            'args': s['args'] })
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(path, 'w') as f:
+        json.dump({ 'traceEvents': events, 'displayTimeUnit': 'ms' }, f)
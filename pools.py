@@ -0,0 +1,153 @@
+from dataclasses import asdict, dataclass
+from typing import Any, Awaitable, Callable, List, Optional
+from pathlib import Path
+
+import asyncio as aio
+import json
+import logging
+
+from database import ADDRESSES, CLUSTER_LOC, Addresses
+from deployment.modifyconf import mod_path
+from deployment.mongodb.start import Cluster
+from sweep import (
+    Checkpoint, Point, PointRecord, point_key, run_point)
+
+
+PORT_STEP = 100
+"pools are also kept apart by port, in case the local host is in one"
+
+logger = logging.getLogger(__name__)
+
+
+
+@dataclass
+class Pool:
+    " a group of hosts that runs its own cluster, with its own files "
+    ips: Addresses
+    name: Optional[str] = None
+    port_offset: int = 0
+
+    def port(self, base: int):
+        return base + self.port_offset
+
+    def conf_path(self, source: Path) -> Path:
+        " where a modified config for this pool is written "
+        if self.name is None:
+            return mod_path(source)
+
+        return source.with_name(f'{source.stem}-{self.name}{source.suffix}')
+
+    @property
+    def addrs_loc(self) -> Path:
+        if self.name is None:
+            return ADDRESSES
+
+        return ADDRESSES.with_name(f'{ADDRESSES.stem}-{self.name}.json')
+
+    @property
+    def cluster_loc(self) -> Path:
+        if self.name is None:
+            return CLUSTER_LOC
+
+        return CLUSTER_LOC.with_name(f'{CLUSTER_LOC.stem}-{self.name}.json')
+
+
+    def write_files(self):
+        " the default pool just uses the base files "
+        if self.name is None:
+            return
+
+        self.ips.to_json(self.addrs_loc)
+
+        cluster = Cluster.from_json(CLUSTER_LOC)
+        for role in cluster.as_tuple():
+            role.port = self.port(role.port)
+
+        with open(self.cluster_loc, 'w') as f:
+            json.dump(asdict(cluster), f, indent=4)
+
+
+
+def split_pools(
+    ips: Addresses, count: int, port_step: int = PORT_STEP) -> List[Pool]:
+
+    " deals out the hosts of each role, so every pool gets all the roles "
+    for role, hosts in asdict(ips).items():
+        if len(hosts) < count:
+            raise ValueError(
+                f'only {len(hosts)} {role} hosts for {count} pools')
+
+    return [
+        Pool(
+            ips = Addresses(
+                main = ips.main[i::count],
+                data = ips.data[i::count],
+                misc = ips.misc[i::count]),
+            name = f'pool{i}',
+            port_offset = i * port_step)
+        for i in range(count) ]
+
+
+
+PoolRunner = Callable[[Pool, Point], Awaitable[Any]]
+
+async def run_pools(
+    points: List[Point],
+    pools: List[Pool],
+    runner: PoolRunner,
+    checkpoint: Checkpoint,
+    budget: Optional[float] = None,
+    retry_failed: bool = False,
+    max_failures: int = 2) -> List[PointRecord]:
+
+    """
+    Runs sweep points on all the pools at the same time. Each pool takes
+    the next point when it finishes one, so faster pools run more points,
+    and a pool that keeps failing is dropped for the rest of the sweep
+    """
+    finished = checkpoint.completed(retry_failed)
+    queue: 'aio.Queue[Point]' = aio.Queue()
+
+    for point in points:
+        if point_key(point) not in finished:
+            queue.put_nowait(point)
+
+    logger.info(f'running {queue.qsize()} points on {len(pools)} pools')
+
+    records: List[PointRecord] = []
+
+    async def work(pool: Pool):
+        pool.write_files()
+        failures = 0
+
+        while not queue.empty():
+            point = queue.get_nowait()
+            logger.info(
+                f'pool {pool.name} running {point}, {queue.qsize()} left')
+
+            record = await run_point(
+                point,
+                lambda p: runner(pool, p),
+                checkpoint,
+                budget,
+                labels = { 'pool': pool.name })
+
+            records.append(record)
+
+            if record['status'] != 'failed':
+                failures = 0
+                continue
+
+            failures += 1
+            if failures >= max_failures:
+                logger.error(
+                    f'pool {pool.name} failed {failures} times, '
+                    'leaving the rest of the points to other pools')
+                return
+
+    await aio.gather(*[ work(p) for p in pools ])
+
+    if not queue.empty():
+        logger.error(f'{queue.qsize()} points left, every pool failed')
+
+    return records
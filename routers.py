@@ -0,0 +1,228 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Literal, Optional, Tuple
+from threading import Event
+from time import perf_counter
+
+import logging
+
+from pymongo import MongoClient
+from pymongo.read_concern import ReadConcern
+
+from deployment.mongodb.start import Cluster, member_addr
+from monitor_and_graphs.latency import Histogram, Summary
+from load_generation.mongodb_load_gen import Command
+from transactions import timed_transaction
+
+
+RouterMode = Literal['round-robin', 'least-latency']
+ROUTER_MODES = ['round-robin', 'least-latency']
+
+Router = Tuple[str, int]
+
+EWMA_WEIGHT = 0.2
+"weight of the newest latency in a router's moving average"
+
+PROBE_EVERY = 100
+"least-latency workers retry the least used router this often"
+
+logger = logging.getLogger(__name__)
+
+
+
+def cluster_routers(cluster: Cluster) -> List[Router]:
+    " every mongos in the cluster, as the seed list for the clients "
+    mongos = cluster.mongos
+    return [ member_addr(mongos, i) for i in range(len(mongos.members)) ]
+
+
+def router_name(router: Router):
+    host, port = router
+    return f'{host}:{port}'
+
+
+
+def timed(
+    cli: MongoClient,
+    db: str,
+    cmd: Command,
+    read_preference: Optional[Any] = None) -> float:
+
+    """
+    Commands do not follow the client read preference, so it is given for
+    each find; writes always go to the primary. Renames only run on admin
+    """
+    if 'aggregate' in cmd:
+        return timed_aggregate(cli, db, cmd, read_preference)
+
+    if 'transaction' in cmd:
+        return timed_transaction(cli, db, cmd)
+
+    args: Dict[str, Any] = {}
+    if 'renameCollection' in cmd:
+        db = 'admin'
+
+    if read_preference is not None and 'find' in cmd:
+        args['read_preference'] = read_preference
+
+    start = perf_counter()
+    cli[db].command(cmd, **args)
+    return (perf_counter() - start) * 1e6
+
+
+def timed_aggregate(
+    cli: MongoClient,
+    db: str,
+    cmd: Command,
+    read_preference: Optional[Any] = None) -> float:
+
+    """
+    Runs the pipeline through a cursor, timing every batch until the
+    results run out, instead of only the first batch
+    """
+    concern = cmd.get('readConcern')
+    col = cli[db].get_collection(
+        cmd['aggregate'],
+        read_preference = read_preference,
+        read_concern = ReadConcern(**concern) if concern else None)
+
+    args: Dict[str, Any] = {}
+    if cmd.get('comment'):
+        args['comment'] = cmd['comment']
+
+    if cmd.get('cursor', {}).get('batchSize'):
+        args['batchSize'] = cmd['cursor']['batchSize']
+
+    start = perf_counter()
+    for _ in col.aggregate(cmd['pipeline'], **args):
+        pass
+
+    return (perf_counter() - start) * 1e6
+
+
+def ping(cli: MongoClient) -> float:
+    return timed(cli, 'admin', { 'ping': 1 })
+
+
+
+def round_robin_worker(
+    cmds: List[Command],
+    db: str,
+    router: Router,
+    client_args: Dict[str, Any],
+    read_preference: Optional[Any] = None,
+    stop: Optional[Event] = None) -> Dict[Router, Histogram]:
+
+    " sends every command to the one router it was dealt "
+    latencies = Histogram()
+    host, port = router
+
+    with MongoClient(host, port, **client_args) as cli:
+        for cmd in cmds:
+            if stop and stop.is_set():
+                break
+
+            latencies.record(timed(cli, db, cmd, read_preference))
+
+    return { router: latencies }
+
+
+
+def least_latency_worker(
+    cmds: List[Command],
+    db: str,
+    routers: List[Router],
+    client_args: Dict[str, Any],
+    read_preference: Optional[Any] = None,
+    stop: Optional[Event] = None) -> Dict[Router, Histogram]:
+
+    """
+    Sends each command to the router with the lowest moving average latency,
+    every so often using the least used router instead, so a router that
+    was slow once gets another chance
+    """
+    latencies = { r: Histogram() for r in routers }
+    clients = { r: MongoClient(*r, **client_args) for r in routers }
+
+    try:
+        average = { r: ping(c) for r, c in clients.items() }
+
+        for i, cmd in enumerate(cmds):
+            if stop and stop.is_set():
+                break
+
+            if i % PROBE_EVERY == PROBE_EVERY - 1:
+                router = min(routers, key=lambda r: latencies[r].total)
+            else:
+                router = min(routers, key=lambda r: average[r])
+
+            micros = timed(clients[router], db, cmd, read_preference)
+            latencies[router].record(micros)
+
+            average[router] = (
+                EWMA_WEIGHT * micros + (1 - EWMA_WEIGHT) * average[router])
+
+    finally:
+        for cli in clients.values():
+            cli.close()
+
+    return latencies
+
+
+
+def run_routed(
+    cmds: List[Command],
+    db: str,
+    routers: List[Router],
+    mode: RouterMode,
+    workers: int,
+    client_args: Optional[Dict[str, Any]] = None,
+    read_preference: Optional[Any] = None,
+    stop: Optional[Event] = None) -> Dict[Router, Histogram]:
+
+    """
+    Splits the commands over worker threads, where round-robin deals one
+    router to each worker, and least-latency lets each worker pick per
+    command; the latencies are per router
+    """
+    if client_args is None:
+        client_args = {}
+
+    if not routers:
+        raise ValueError('no mongos routers to send to')
+
+    if mode == 'round-robin' and workers < len(routers):
+        logger.warning(f'only {workers} of {len(routers)} routers are used')
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        if mode == 'round-robin':
+            runs = [
+                pool.submit(
+                    round_robin_worker,
+                    cmds[i::workers], db, routers[i % len(routers)],
+                    client_args, read_preference, stop)
+                for i in range(workers) ]
+        else:
+            runs = [
+                pool.submit(
+                    least_latency_worker,
+                    cmds[i::workers], db, routers,
+                    client_args, read_preference, stop)
+                for i in range(workers) ]
+
+        per_worker = [ r.result() for r in runs ]
+
+    latencies = { r: Histogram() for r in routers }
+    for result in per_worker:
+        for router, hist in result.items():
+            latencies[router].merge(hist)
+
+    return latencies
+
+
+
+def router_summaries(
+    latencies: Dict[Router, Histogram], seconds: float) -> Dict[str, Summary]:
+
+    return {
+        router_name(r): hist.summary(seconds)
+        for r, hist in latencies.items() }
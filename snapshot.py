@@ -0,0 +1,225 @@
+from typing import Any, List, Optional
+from pathlib import Path
+from time import asctime, monotonic
+
+import asyncio as aio
+import json
+import logging
+
+from redis import Redis
+
+from database import (
+    CLUSTER_LOC, LOGS, REDIS_CONF, STORAGE_FOLDER,
+    Addresses, Database, Remote, Result,
+    exec_commands, is_selfhost, run_shutdown, run_ssh, run_starts,
+    start_script,
+    write_results)
+
+from deployment.modifyconf import mod_path
+from deployment.mongodb.start import (
+    Cluster, Mongot, member_addr, restore_db, snapshot_db)
+from deployment.redis.start import (
+    parse_conf, restore_server, snapshot_server)
+
+
+SNAPSHOTS = LOGS / 'snapshots'
+"local record of which snapshots the nodes have"
+
+CLUSTER_WAIT = 30
+
+logger = logging.getLogger(__name__)
+
+
+
+def manifest_path(database: Database, name: str) -> Path:
+    return SNAPSHOTS / f'{database}-{name}.json'
+
+
+def has_snapshot(database: Database, name: str, ips: Addresses) -> bool:
+    manifest = manifest_path(database, name)
+    if not manifest.exists():
+        return False
+
+    with open(manifest) as f:
+        hosts: List[str] = json.load(f)['hosts']
+
+    # a snapshot is only on the nodes it was taken from
+    return hosts == list(ips)
+
+
+def write_manifest(database: Database, name: str, ips: Addresses):
+    manifest = manifest_path(database, name)
+    manifest.parent.mkdir(exist_ok=True, parents=True)
+
+    with open(manifest, 'w') as f:
+        json.dump({ 'hosts': list(ips), 'taken': asctime() }, f, indent=4)
+
+
+
+def check_results(results: List[Result], action: str):
+    failed = [ r for r in results if isinstance(r.output, Exception) ]
+    if failed:
+        raise RuntimeError(f'{action} failed for {failed}')
+
+
+
+async def node_snapshots(
+    ips: Addresses,
+    user: str,
+    database: Database,
+    name: str,
+    restore: bool,
+    redis_conf: Path,
+    cluster_loc: Path = CLUSTER_LOC) -> List[Result]:
+
+    """
+    Runs the snapshot or restore on every node at the same time; mongo
+    snapshots are per member, since a host can have many of them
+    """
+    flag = '--restore' if restore else '--snapshot'
+
+    if database == 'mongodb':
+        cluster = Cluster.from_json(cluster_loc)
+        roles: List[Mongot] = ['configs', 'shards']
+
+        script = ' '.join(start_script('mongodb'))
+        cmd = f'{script} -c cluster.json {flag} {name}'
+        remotes: List[List[str]] = []
+
+        for role in roles:
+            info = cluster.as_dict()[role]
+
+            for i in range(len(info.members)):
+                host, _ = member_addr(info, i)
+
+                if is_selfhost(host) and restore:
+                    restore_db(cluster, role, i, name)
+                elif is_selfhost(host):
+                    snapshot_db(cluster, role, i, name)
+                else:
+                    remotes.append(
+                        Remote(user, host, f'{cmd} -r {role} -m {i}').ssh)
+
+        # db copies can take much longer than the usual commands
+        return await exec_commands(*remotes, timeout=None)
+
+    r_log = STORAGE_FOLDER / LOGS / 'redis'
+    script = ' '.join(start_script('redis'))
+    cmd = f'{script} -c master.conf {flag} {name}'
+
+    if restore:
+        cmd += f' -l {r_log}/master.log'
+
+    if any(is_selfhost(ip) for ip in ips):
+        if restore:
+            log = LOGS / 'redis' / 'master.log'
+            await restore_server(str(redis_conf), name, str(log))
+        else:
+            await snapshot_server(str(redis_conf), name)
+
+    non_local = [ip for ip in ips if not is_selfhost(ip)]
+    return await run_ssh(cmd, user, *non_local, timeout=None)
+
+
+
+def redis_cluster_ok(ip: str, port: int) -> bool:
+    try:
+        with Redis(ip, port) as cli:
+            info: Any = cli.cluster('info')
+    except Exception:
+        return False
+
+    if isinstance(info, dict):
+        return info.get('cluster_state') == 'ok'
+    else:
+        return 'cluster_state:ok' in str(info)
+
+
+async def wait_redis_cluster(
+    ips: Addresses, port: int, timeout: float = CLUSTER_WAIT):
+
+    loop = aio.get_running_loop()
+    start = monotonic()
+
+    while monotonic() - start < timeout:
+        ok = await aio.gather(*[
+            loop.run_in_executor(None, redis_cluster_ok, ip, port)
+            for ip in ips ])
+
+        if all(ok):
+            return
+
+        await aio.sleep(0.5)
+
+    raise TimeoutError(f'redis cluster not ok after {timeout}s')
+
+
+
+async def take_snapshot(
+    ips: Addresses,
+    user: str,
+    database: Database,
+    name: str,
+    redis_conf: Path = mod_path(REDIS_CONF),
+    cluster_loc: Path = CLUSTER_LOC):
+
+    """
+    Redis nodes save while running, mongo nodes are stopped so the db
+    files are consistent, and then started back up
+    """
+    start = monotonic()
+
+    if database == 'mongodb':
+        await run_shutdown(ips, user, database, cluster_loc=cluster_loc)
+
+    results = await node_snapshots(
+        ips, user, database, name, False, redis_conf, cluster_loc)
+
+    write_results(results)
+    check_results(results, f'snapshot {name}')
+
+    if database == 'mongodb':
+        # the data is already initiated, only the daemons are started
+        await run_starts(
+            ips, user, database, cluster_loc=cluster_loc, restart=True)
+
+    write_manifest(database, name, ips)
+    logger.info(f'snapshot {name} took {monotonic() - start:.2f}s')
+
+
+
+async def restore_snapshot(
+    ips: Addresses,
+    user: str,
+    database: Database,
+    name: str,
+    redis_conf: Path = mod_path(REDIS_CONF),
+    cluster_loc: Path = CLUSTER_LOC):
+
+    " every node restarts with the snapshot data "
+    start = monotonic()
+
+    if database == 'mongodb':
+        await run_shutdown(ips, user, database, cluster_loc=cluster_loc)
+
+    results = await node_snapshots(
+        ips, user, database, name, True, redis_conf, cluster_loc)
+
+    write_results(results)
+    check_results(results, f'restore {name}')
+
+    if database == 'mongodb':
+        # replica set and shard info are in the restored files, so only
+        # the daemons are started, without initiate or addShard
+        await run_starts(
+            ips, user, database, cluster_loc=cluster_loc, restart=True)
+    else:
+        port = int(parse_conf(redis_conf, 'port')['port'])
+        await wait_redis_cluster(ips, port)
+
+    logger.info(f'restore {name} took {monotonic() - start:.2f}s')
+
+
+
+def snapshot_name(size: int, tag: Optional[str] = None):
+    return f'{tag}-size{size}' if tag else f'size{size}'
@@ -0,0 +1,230 @@
+from dataclasses import dataclass
+from typing import (
+    Any, Awaitable, Callable, Dict, List, Literal, Optional, Set, TypedDict)
+
+from pathlib import Path
+from time import asctime, monotonic
+
+import asyncio as aio
+import itertools
+import json
+import logging
+import random
+
+
+Point = Dict[str, Any]
+Parameters = Dict[str, List[Any]]
+Runner = Callable[[Point], Awaitable[Any]]
+
+Design = Literal['factorial', 'one-at-a-time', 'latin-hypercube']
+DESIGNS = ['factorial', 'one-at-a-time', 'latin-hypercube']
+
+Status = Literal['done', 'timeout', 'failed']
+
+logger = logging.getLogger(__name__)
+
+
+
+class PointRecord(TypedDict):
+    key: str
+    point: Point
+    status: Status
+    seconds: float
+    finished: str
+    result: Any
+    labels: Dict[str, Any]
+    "extra info about the run, like which pool it ran on"
+
+
+
+def full_factorial(params: Parameters) -> List[Point]:
+    names = list(params)
+    return [
+        dict(zip(names, vals))
+        for vals in itertools.product(*params.values()) ]
+
+
+def one_at_a_time(params: Parameters) -> List[Point]:
+    " each value by itself, the rest of the config is left at defaults "
+    return [
+        { name: val }
+        for name, vals in params.items()
+        for val in vals ]
+
+
+def latin_hypercube(
+    params: Parameters,
+    samples: int,
+    seed: Optional[int] = None) -> List[Point]:
+
+    rand = random.Random(seed)
+    columns: Dict[str, List[Any]] = {}
+
+    for name, vals in params.items():
+        # one draw per stratum, then shuffle strata across samples
+        strata = [
+            vals[int((s + rand.random()) * len(vals) / samples)]
+            for s in range(samples) ]
+
+        rand.shuffle(strata)
+        columns[name] = strata
+
+    points: List[Point] = []
+    seen: Set[str] = set()
+
+    for s in range(samples):
+        point = { name: col[s] for name, col in columns.items() }
+        key = point_key(point)
+
+        if key not in seen:
+            seen.add(key)
+            points.append(point)
+
+    return points
+
+
+
+def expand(
+    params: Parameters,
+    design: Design,
+    samples: Optional[int] = None,
+    seed: Optional[int] = None) -> List[Point]:
+
+    params = { name: vals for name, vals in params.items() if vals }
+
+    if design == 'factorial':
+        return full_factorial(params)
+
+    elif design == 'one-at-a-time':
+        return one_at_a_time(params)
+
+    elif design == 'latin-hypercube':
+        if samples is None:
+            samples = max(len(vals) for vals in params.values())
+
+        return latin_hypercube(params, samples, seed)
+
+    else:
+        raise ValueError(f'unknown design {design}')
+
+
+
+def point_key(point: Point) -> str:
+    return json.dumps(point, sort_keys=True)
+
+
+def point_tag(point: Point) -> str:
+    " file name safe label, single params follow the mongo-name-value dirs "
+    tag = '_'.join(f'{name}-{val}' for name, val in point.items())
+    return ''.join(c if c.isalnum() or c in '.-_' else '_' for c in tag)
+
+
+
+@dataclass
+class Checkpoint:
+    " append only record of finished sweep points, one json per line "
+    path: Path
+
+    def records(self) -> List[PointRecord]:
+        if not self.path.exists():
+            return []
+
+        records: List[PointRecord] = []
+        with open(self.path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # partial line from a crash mid write
+                    logger.warning(f'skipping bad checkpoint line {line}')
+
+        return records
+
+    def completed(self, retry_failed: bool = False) -> Set[str]:
+        return {
+            r['key'] for r in self.records()
+            if r['status'] == 'done' or not retry_failed }
+
+    def finished(self) -> Dict[str, PointRecord]:
+        return {
+            r['key']: r for r in self.records()
+            if r['status'] == 'done' }
+
+    def record(
+        self,
+        point: Point,
+        status: Status,
+        seconds: float,
+        result: Any = None,
+        key: Optional[str] = None,
+        labels: Optional[Dict[str, Any]] = None) -> PointRecord:
+
+        record = PointRecord(
+            key = key or point_key(point),
+            point = point,
+            status = status,
+            seconds = seconds,
+            finished = asctime(),
+            result = result,
+            labels = labels or {})
+
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record, default=str) + '\n')
+            f.flush()
+
+        return record
+
+
+
+async def run_point(
+    point: Point,
+    runner: Runner,
+    checkpoint: Checkpoint,
+    budget: Optional[float] = None,
+    key: Optional[str] = None,
+    labels: Optional[Dict[str, Any]] = None) -> PointRecord:
+
+    start = monotonic()
+    result = None
+
+    try:
+        result = await aio.wait_for(runner(point), budget)
+        status: Status = 'done'
+
+    except aio.TimeoutError:
+        logger.error(f'point {point} went over budget of {budget}s')
+        status = 'timeout'
+
+    except Exception:
+        logger.exception(f'point {point} failed')
+        status = 'failed'
+
+    return checkpoint.record(
+        point, status, monotonic() - start, result, key, labels)
+
+
+
+async def run_sweep(
+    points: List[Point],
+    runner: Runner,
+    checkpoint: Checkpoint,
+    budget: Optional[float] = None,
+    retry_failed: bool = False) -> List[PointRecord]:
+
+    finished = checkpoint.completed(retry_failed)
+    records: List[PointRecord] = []
+
+    remaining = [ p for p in points if point_key(p) not in finished ]
+    logger.info(
+        f'sweep has {len(points)} points, '
+        f'{len(points) - len(remaining)} already in {checkpoint.path}')
+
+    for i, point in enumerate(remaining):
+        logger.info(f'sweep point {i+1}/{len(remaining)}: {point}')
+        records.append(
+            await run_point(point, runner, checkpoint, budget))
+
+    return records
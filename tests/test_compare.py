@@ -0,0 +1,101 @@
+import json
+import random
+
+from monitor_and_graphs.compare import bootstrap, compare, main, verdict
+
+
+SEED = 7
+RUN = 'insert_1000'
+
+
+def trials(level: float, count: int, rng: random.Random):
+    " runs with a throughput and p99 around level, with 1% noise "
+    return [
+        { RUN: {
+            'throughput': level * rng.gauss(1, 0.01),
+            'p99': 1000 / level * rng.gauss(1, 0.01) } }
+        for _ in range(count) ]
+
+
+def verdicts(baseline, candidate):
+    deltas = compare(
+        baseline, candidate, [ 'throughput', 'p99' ],
+        resamples=2000, seed=SEED)
+    return { d['metric']: d for d in deltas }
+
+
+
+def test_better():
+    rng = random.Random(SEED)
+    deltas = verdicts(trials(100, 5, rng), trials(120, 5, rng))
+
+    assert deltas['throughput']['verdict'] == 'better'
+    assert deltas['p99']['verdict'] == 'better'
+    assert not any(d['regression'] for d in deltas.values())
+
+
+def test_worse():
+    rng = random.Random(SEED)
+    deltas = verdicts(trials(100, 5, rng), trials(80, 5, rng))
+
+    assert deltas['throughput']['verdict'] == 'worse'
+    assert deltas['p99']['verdict'] == 'worse'
+    assert deltas['throughput']['regression']
+    assert deltas['throughput']['change'] < -0.05
+
+
+def test_same():
+    rng = random.Random(SEED)
+    deltas = verdicts(trials(100, 5, rng), trials(100, 5, rng))
+
+    for delta in deltas.values():
+        assert delta['low'] <= 0 <= delta['high']
+        assert delta['verdict'] == 'same'
+        assert not delta['regression']
+
+
+def test_single_trial_is_inconclusive():
+    rng = random.Random(SEED)
+    deltas = verdicts(trials(100, 1, rng), trials(50, 5, rng))
+
+    for delta in deltas.values():
+        assert delta['trials'] == (1, 5)
+        assert delta['verdict'] == 'inconclusive'
+        assert not delta['regression']
+
+
+def test_verdict():
+    assert verdict('throughput', 0.1, 0.2, True) == 'better'
+    assert verdict('p99', 0.1, 0.2, True) == 'worse'
+    assert verdict('p99', -0.2, -0.1, True) == 'better'
+    assert verdict('mean', -0.1, 0.1, True) == 'same'
+    assert verdict('throughput', 0.1, 0.2, False) == 'inconclusive'
+
+
+def test_bootstrap_is_seeded():
+    baseline, candidate = [ 1.0, 1.1, 0.9 ], [ 1.2, 1.3, 1.1 ]
+    first = bootstrap(baseline, candidate, 0.95, 500, random.Random(SEED))
+    second = bootstrap(baseline, candidate, 0.95, 500, random.Random(SEED))
+
+    assert first == second
+    assert 0 < first[0] <= first[1]
+
+
+
+def test_main_exit_code(tmp_path):
+    rng = random.Random(SEED)
+    files = {}
+
+    for name, level in [ ('base', 100), ('good', 120), ('bad', 80) ]:
+        files[name] = tmp_path / f'{name}.json'
+        files[name].write_text(json.dumps(trials(level, 5, rng)))
+
+    def run(candidate, out=None):
+        return main(
+            [ str(files['base']) ], [ str(files[candidate]) ],
+            [ 'throughput', 'p99' ], 0.05, 0.95, 2000, SEED, out)
+
+    out = tmp_path / 'deltas.json'
+    assert run('good') == 0
+    assert run('bad', str(out)) == 1
+    assert any(d['regression'] for d in json.loads(out.read_text()))
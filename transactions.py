@@ -0,0 +1,243 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from threading import Event
+from time import perf_counter
+from typing import Dict, List, Optional, TypedDict
+
+import logging
+
+from pymongo import MongoClient
+from pymongo.client_session import ClientSession
+from pymongo.errors import PyMongoError
+from pymongo.write_concern import WriteConcern
+
+from deployment.mongodb.sharding import target_shards
+from monitor_and_graphs.latency import Histogram, Summary
+from load_generation.mongodb_load_gen import GROUP, KEY, Command
+
+
+TXN_RETRIES = 3
+"times a transaction is tried again after a TransientTransactionError"
+
+TRANSIENT = 'TransientTransactionError'
+UNKNOWN_COMMIT = 'UnknownTransactionCommitResult'
+
+logger = logging.getLogger(__name__)
+
+
+class TxnReport(TypedDict):
+    docs: int
+    "documents inserted by each transaction"
+    scope: str
+    shards: int
+    "with fewer than 2, cross scope transactions still commit on one shard"
+    sampled: int
+    "transactions whose documents were explained to find their shards"
+    touched: Dict[str, int]
+    "sampled transactions, by how many shards their documents landed on"
+    committed: int
+    failed: int
+    "transactions that still aborted after every retry"
+    attempts: int
+    aborts: int
+    abort_rate: float
+    "aborted attempts over all attempts"
+    transaction: Summary
+    "whole committed transactions, retries included"
+    commit: Summary
+    "the commit of each committed transaction alone"
+
+
+
+@dataclass
+class TxnTimings:
+    transactions: Histogram = field(default_factory=Histogram)
+    commits: Histogram = field(default_factory=Histogram)
+    attempts: int = 0
+    aborts: int = 0
+    failed: int = 0
+
+    def merge(self, other: 'TxnTimings'):
+        self.transactions.merge(other.transactions)
+        self.commits.merge(other.commits)
+        self.attempts += other.attempts
+        self.aborts += other.aborts
+        self.failed += other.failed
+        return self
+
+
+
+def commit(session: ClientSession, retries: int = TXN_RETRIES):
+    " a commit with an unknown result is safe to send again "
+    for attempt in range(retries + 1):
+        try:
+            session.commit_transaction()
+            return
+
+        except PyMongoError as e:
+            if attempt == retries or not e.has_error_label(UNKNOWN_COMMIT):
+                raise
+
+
+
+def timed_transaction(
+    cli: MongoClient,
+    db: str,
+    cmd: Command,
+    timings: Optional[TxnTimings] = None,
+    retries: int = TXN_RETRIES) -> float:
+
+    """
+    Inserts the documents of the command in one transaction, starting it
+    over on a TransientTransactionError, like a write conflict. Other
+    errors end the run
+    """
+    if timings is None:
+        timings = TxnTimings()
+
+    col = cli[db][cmd['transaction']]
+    concern = WriteConcern(**cmd.get('writeConcern', {}))
+    start = perf_counter()
+
+    with cli.start_session() as session:
+        for attempt in range(retries + 1):
+            timings.attempts += 1
+
+            try:
+                session.start_transaction(write_concern=concern)
+
+                for doc in cmd['documents']:
+                    # a copy, so a retry does not reuse the _id
+                    col.insert_one(dict(doc), session=session)
+
+                commit_start = perf_counter()
+                commit(session, retries)
+                commit_end = perf_counter()
+
+            except PyMongoError as e:
+                if session.in_transaction:
+                    session.abort_transaction()
+
+                timings.aborts += 1
+
+                if not e.has_error_label(TRANSIENT):
+                    raise
+
+                logger.debug(f'transaction attempt {attempt} aborted: {e}')
+                continue
+
+            micros = (commit_end - start) * 1e6
+            timings.commits.record((commit_end - commit_start) * 1e6)
+            timings.transactions.record(micros)
+
+            return micros
+
+    timings.failed += 1
+    return (perf_counter() - start) * 1e6
+
+
+
+def transaction_worker(
+    cli: MongoClient,
+    cmds: List[Command],
+    db: str,
+    retries: int = TXN_RETRIES,
+    stop: Optional[Event] = None) -> TxnTimings:
+
+    timings = TxnTimings()
+
+    for cmd in cmds:
+        if stop and stop.is_set():
+            break
+
+        timed_transaction(cli, db, cmd, timings, retries)
+
+    return timings
+
+
+
+def run_transactions(
+    cli: MongoClient,
+    cmds: List[Command],
+    db: str,
+    clients: int,
+    retries: int = TXN_RETRIES,
+    stop: Optional[Event] = None) -> TxnTimings:
+
+    " splits the transactions over client threads, which can conflict "
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        runs = [
+            pool.submit(
+                transaction_worker,
+                cli, cmds[i::clients], db, retries, stop)
+            for i in range(clients) ]
+
+        per_worker = [ r.result() for r in runs ]
+
+    timings = TxnTimings()
+    for result in per_worker:
+        timings.merge(result)
+
+    return timings
+
+
+
+def touched_shards(
+    cli: MongoClient,
+    db: str,
+    cmds: List[Command],
+    sample: int) -> Dict[str, int]:
+
+    """
+    Explains a find on the shard key of every document in an even sample
+    of the transactions, to count the shards that each one wrote to
+    """
+    touched: Dict[str, int] = {}
+    if not sample:
+        return touched
+
+    step = max(1, len(cmds) // sample)
+
+    for cmd in cmds[::step][:sample]:
+        shards = set()
+
+        for doc in cmd['documents']:
+            explain = cli[db].command(
+                'explain',
+                {
+                    'find': cmd['transaction'],
+                    'filter': { KEY: doc[KEY], GROUP: doc[GROUP] } },
+                verbosity = 'queryPlanner')
+
+            # an unsharded collection only lives on its primary shard
+            shards.update(target_shards(explain) or ['primary'])
+
+        count = str(len(shards))
+        touched[count] = touched.get(count, 0) + 1
+
+    return touched
+
+
+
+def transaction_report(
+    timings: TxnTimings,
+    docs: int,
+    scope: str,
+    shards: int,
+    touched: Dict[str, int],
+    seconds: float) -> TxnReport:
+
+    return TxnReport(
+        docs = docs,
+        scope = scope,
+        shards = shards,
+        sampled = sum(touched.values()),
+        touched = touched,
+        committed = timings.transactions.total,
+        failed = timings.failed,
+        attempts = timings.attempts,
+        aborts = timings.aborts,
+        abort_rate = (
+            timings.aborts / timings.attempts if timings.attempts else 0),
+        transaction = timings.transactions.summary(seconds),
+        commit = timings.commits.summary(seconds))
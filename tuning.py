@@ -0,0 +1,148 @@
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Literal, Optional
+
+import logging
+import math
+
+from benchmark import Results
+from sweep import Checkpoint, Point, point_key, run_point
+
+
+Metric = Literal['throughput', 'mean', 'p50', 'p95', 'p99']
+METRICS = ['throughput', 'mean', 'p50', 'p95', 'p99']
+
+Evaluate = Callable[[Point, List[int]], Awaitable[Results]]
+
+logger = logging.getLogger(__name__)
+
+
+
+@dataclass
+class Trial:
+    point: Point
+    size: int
+    score: float
+    "lower is better, throughput is negated"
+
+
+
+def score(results: Results, metric: Metric, op: Optional[str]) -> float:
+    runs = [
+        summary for key, summary in results.items()
+        if op is None or key.startswith(op) ]
+
+    if not runs:
+        raise ValueError(f'no {op} results to score')
+
+    value = sum(r[metric] for r in runs) / len(runs)
+    return -value if metric == 'throughput' else value
+
+
+
+def improved(best: float, new: float, tolerance: float):
+    " relative improvement, scores can be negative for throughput "
+    return best - new > tolerance * abs(best)
+
+
+
+async def evaluate_rung(
+    candidates: List[Point],
+    size: int,
+    evaluate: Evaluate,
+    checkpoint: Checkpoint,
+    metric: Metric,
+    op: Optional[str],
+    budget: Optional[float] = None,
+    patience: Optional[int] = None,
+    tolerance: float = 0) -> List[Trial]:
+
+    " runs the candidates in order, stopping early once the best converges "
+
+    finished = checkpoint.finished()
+    trials: List[Trial] = []
+
+    best = math.inf
+    stale = 0
+
+    for point in candidates:
+        key = f'{point_key(point)}@{size}'
+
+        if key in finished:
+            record = finished[key]
+            logger.info(f'reusing checkpoint for {point} at {size}')
+        else:
+            record = await run_point(
+                point,
+                lambda p: evaluate(p, [size]),
+                checkpoint,
+                budget,
+                key)
+
+        if record['status'] == 'done':
+            trial_score = score(record['result'], metric, op)
+        else:
+            trial_score = math.inf
+
+        trials.append(Trial(point, size, trial_score))
+        logger.info(f'{point} at {size} scored {trial_score}')
+
+        if improved(best, trial_score, tolerance) or best == math.inf:
+            best = min(best, trial_score)
+            stale = 0
+        else:
+            stale += 1
+
+        if patience and stale >= patience:
+            logger.info(f'best {metric} converged at {best}')
+            break
+
+    return sorted(trials, key=lambda t: t.score)
+
+
+
+async def successive_halving(
+    points: List[Point],
+    evaluate: Evaluate,
+    checkpoint: Checkpoint,
+    sizes: List[int],
+    metric: Metric = 'throughput',
+    op: Optional[str] = None,
+    eta: int = 3,
+    tolerance: float = 0.02,
+    patience: int = 2,
+    budget: Optional[float] = None) -> Optional[Trial]:
+
+    """
+    Screens every point with the smallest load size, and only keeps the
+    best 1/eta of them for each larger size. The last size is the full run,
+    which stops once the best score has not improved for a patience amount
+    of points
+    """
+    candidates = list(points)
+    sizes = sorted(sizes)
+    trials: List[Trial] = []
+
+    for rung, size in enumerate(sizes):
+        is_last = rung == len(sizes) - 1
+
+        logger.info(
+            f'rung {rung}: {len(candidates)} candidates at size {size}')
+
+        trials = await evaluate_rung(
+            candidates, size, evaluate, checkpoint, metric, op, budget,
+            patience = patience if is_last else None,
+            tolerance = tolerance)
+
+        trials = [ t for t in trials if t.score < math.inf ]
+        if not trials:
+            logger.error(f'all candidates failed at size {size}')
+            return None
+
+        keep = max(1, math.ceil(len(trials) / eta))
+        candidates = [ t.point for t in trials[:keep] ]
+
+    best = trials[0]
+    logger.info(f'best point {best.point} with {metric} {abs(best.score)}')
+
+    return best
+